@@ -0,0 +1,109 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+ACCESS_LOG_COLUMNS = (
+    'user_id', 'username', 'ip_address', 'request_method', 'endpoint', 'url',
+    'query_params', 'user_agent', 'access_time', 'response_status', 'process_time',
+)
+
+INSERT_SQL = (
+    f"INSERT INTO access_logs ({', '.join(ACCESS_LOG_COLUMNS)}) "
+    f"VALUES ({', '.join(['%s'] * len(ACCESS_LOG_COLUMNS))})"
+)
+
+
+class AccessLogWriter:
+    """access_logs 异步批量写入器
+
+    请求线程只把日志行放入有界队列；后台线程攒够 batch_size 条或距上次写入
+    超过 flush_interval 秒时，用一次 executemany 批量插入。队列满时直接丢弃
+    并计数，不阻塞请求。
+    """
+
+    def __init__(self, database, max_queue=10000, batch_size=200, flush_interval=2.0):
+        self._database = database  # 返回游标上下文管理器的工厂，即 app.Database
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stopping = threading.Event()
+        self._stats = {'queued': 0, 'written': 0, 'dropped': 0, 'failed': 0, 'flushes': 0}
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._stats[name] += n
+
+    def _ensure_started(self):
+        # 延迟到首次写入时启动，fork 出的 worker 各自启动自己的后台线程
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='access-log-writer', daemon=True)
+            self._thread.start()
+
+    def record(self, row):
+        """放入一条日志（按 ACCESS_LOG_COLUMNS 顺序的元组），队列满时丢弃并返回 False"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self._count('dropped')
+            return False
+        self._count('queued')
+        return True
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            timeout = max(0.0, deadline - time.monotonic())
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                pass
+            now = time.monotonic()
+            if len(batch) >= self.batch_size or (batch and now >= deadline):
+                self._flush(batch)
+                batch = []
+            if now >= deadline:
+                deadline = now + self.flush_interval
+            if self._stopping.is_set() and self._queue.empty():
+                if batch:
+                    self._flush(batch)
+                return
+
+    def _flush(self, batch):
+        try:
+            with self._database() as cursor:
+                cursor.executemany(INSERT_SQL, batch)
+        except Exception as e:
+            self._count('failed', len(batch))
+            logging.error(f"写入访问日志失败，丢弃 {len(batch)} 条: {e}")
+            return
+        self._count('written', len(batch))
+        self._count('flushes')
+
+    def stop(self, timeout=5.0):
+        """停止后台线程并写完队列中剩余的日志"""
+        thread = self._thread
+        if thread is None or self._pid != os.getpid() or not thread.is_alive():
+            return
+        self._stopping.set()
+        thread.join(timeout)
+        if thread.is_alive():
+            logging.warning(f"访问日志写入线程未在 {timeout} 秒内结束，剩余 {self._queue.qsize()} 条未写入")
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot['pending'] = self._queue.qsize()
+        return snapshot
@@ -0,0 +1,294 @@
+import json
+import logging
+import math
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+# 汇总粒度 -> (汇总表, 截取到桶起点的方式)
+GRANULARITIES = {
+    'minute': ('access_log_rollup_minute', lambda t: t.replace(second=0, microsecond=0)),
+    'hour': ('access_log_rollup_hour', lambda t: t.replace(minute=0, second=0, microsecond=0)),
+}
+STATE_NAME = 'access_logs'
+ROLLUP_COLUMNS = ('bucket_start', 'endpoint', 'request_count', 'client_error_count', 'error_count',
+                  'total_time', 'max_time', 'latency_sketch')
+
+# 耗时分桶：第 i 桶的上限为 SKETCH_MIN * SKETCH_GROWTH ** i 秒，估算的分位数相对误差约 5%
+SKETCH_MIN = 0.001
+SKETCH_GROWTH = 1.1
+SKETCH_BUCKETS = 160
+
+
+def sketch_bucket(seconds):
+    if seconds <= SKETCH_MIN:
+        return 0
+    return min(SKETCH_BUCKETS - 1, math.ceil(math.log(seconds / SKETCH_MIN, SKETCH_GROWTH)))
+
+
+def merge_sketch(target, sketch):
+    for bucket, count in sketch.items():
+        target[bucket] = target.get(bucket, 0) + count
+    return target
+
+
+def sketch_quantile(sketch, q):
+    """按分桶计数估算分位数（秒），取所在桶上下限的几何中点"""
+    total = sum(sketch.values())
+    if not total:
+        return None
+    rank = q * total
+    cumulative = 0
+    for bucket in sorted(sketch):
+        cumulative += sketch[bucket]
+        if cumulative >= rank:
+            return SKETCH_MIN if bucket == 0 else SKETCH_MIN * SKETCH_GROWTH ** (bucket - 0.5)
+    return SKETCH_MIN * SKETCH_GROWTH ** max(sketch)
+
+
+def _new_aggregate():
+    # [请求数, 4xx 数, 5xx 数, 总耗时, 最大耗时, 耗时分桶]
+    return [0, 0, 0, 0.0, 0.0, {}]
+
+
+def _merge_aggregate(target, other):
+    target[0] += other[0]
+    target[1] += other[1]
+    target[2] += other[2]
+    target[3] += other[3]
+    target[4] = max(target[4], other[4])
+    merge_sketch(target[5], other[5])
+
+
+class AccessLogRollup:
+    """把 access_logs 增量汇总到按分钟、按小时的汇总表，并按保留期限清理
+
+    - 以 access_log_rollup_state 中的最大已处理 id 为高水位，每次只读取之后的行；
+      同一事务内更新汇总表与高水位，多个进程同时运行时由 FOR UPDATE 串行
+    - 只处理 access_time 早于 settle_seconds 秒前的行，批量写入中较晚提交的小 id 不会被跳过
+    - 原始日志只删除已汇总且超过 raw_retention_days 天的行；分钟汇总保留 minute_retention_days 天，
+      小时汇总保留 hour_retention_days 天（0 为一直保留）
+    - 统计页面只读取汇总表
+    """
+
+    def __init__(self, database, batch_size=5000, settle_seconds=60, raw_retention_days=30,
+                 minute_retention_days=7, hour_retention_days=0, delete_batch=5000):
+        self._database = database  # 返回游标上下文管理器的工厂，即 app.Database
+        self.batch_size = batch_size
+        self.settle_seconds = settle_seconds
+        self.raw_retention_days = raw_retention_days
+        self.minute_retention_days = minute_retention_days
+        self.hour_retention_days = hour_retention_days
+        self.delete_batch = delete_batch
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stats = {'runs': 0, 'rows': 0, 'pruned': 0, 'failed': 0, 'last_run': None}
+
+    def run(self, max_batches=None):
+        """汇总新增的访问日志，返回本次处理的行数"""
+        processed = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            count, more = self._run_batch()
+            processed += count
+            batches += 1
+            if not more:
+                break
+        with self._lock:
+            self._stats['runs'] += 1
+            self._stats['rows'] += processed
+            self._stats['last_run'] = time.time()
+        return processed
+
+    def _run_batch(self):
+        cutoff = datetime.now() - timedelta(seconds=self.settle_seconds)
+        with self._database() as cursor:
+            last_id = self._lock_state(cursor)
+            cursor.execute(
+                "SELECT id, endpoint, access_time, response_status, process_time FROM access_logs"
+                " WHERE id > %s ORDER BY id LIMIT %s", (last_id, self.batch_size))
+            rows = cursor.fetchall()
+            settled = []
+            for row in rows:
+                if row['access_time'] >= cutoff:
+                    break
+                settled.append(row)
+            if not settled:
+                return 0, False
+
+            for granularity, (table, truncate) in GRANULARITIES.items():
+                aggregates = {}
+                for row in settled:
+                    key = (truncate(row['access_time']), row['endpoint'])
+                    aggregate = aggregates.get(key)
+                    if aggregate is None:
+                        aggregate = aggregates[key] = _new_aggregate()
+                    seconds = float(row['process_time'])
+                    status = row['response_status']
+                    aggregate[0] += 1
+                    aggregate[1] += 400 <= status < 500
+                    aggregate[2] += status >= 500
+                    aggregate[3] += seconds
+                    aggregate[4] = max(aggregate[4], seconds)
+                    bucket = sketch_bucket(seconds)
+                    aggregate[5][bucket] = aggregate[5].get(bucket, 0) + 1
+                self._merge_into(cursor, table, aggregates)
+
+            cursor.execute("UPDATE access_log_rollup_state SET last_id = %s, updated_at = %s WHERE name = %s",
+                           (settled[-1]['id'], datetime.now(), STATE_NAME))
+        return len(settled), len(settled) == self.batch_size
+
+    @staticmethod
+    def _lock_state(cursor):
+        """锁定高水位行并返回已处理的最大 id，首次运行时创建"""
+        cursor.execute("SELECT last_id FROM access_log_rollup_state WHERE name = %s FOR UPDATE", (STATE_NAME,))
+        row = cursor.fetchone()
+        if row is None:
+            cursor.execute("INSERT IGNORE INTO access_log_rollup_state (name, last_id, updated_at) VALUES (%s, 0, %s)",
+                           (STATE_NAME, datetime.now()))
+            cursor.execute("SELECT last_id FROM access_log_rollup_state WHERE name = %s FOR UPDATE", (STATE_NAME,))
+            row = cursor.fetchone()
+        return row['last_id']
+
+    @staticmethod
+    def _merge_into(cursor, table, aggregates):
+        """与汇总表中已有的桶合并后整行写回（耗时分桶无法在 SQL 中相加）"""
+        keys = list(aggregates)
+        placeholders = ', '.join(['(%s, %s)'] * len(keys))
+        cursor.execute(f"SELECT {', '.join(ROLLUP_COLUMNS)} FROM {table}"
+                       f" WHERE (bucket_start, endpoint) IN ({placeholders}) FOR UPDATE",
+                       tuple(value for key in keys for value in key))
+        for row in cursor.fetchall():
+            existing = [row['request_count'], row['client_error_count'], row['error_count'],
+                        row['total_time'], row['max_time'],
+                        {int(bucket): count for bucket, count in json.loads(row['latency_sketch']).items()}]
+            key = (row['bucket_start'], row['endpoint'])
+            if key in aggregates:
+                _merge_aggregate(aggregates[key], existing)
+        updates = ', '.join(f'{column} = VALUES({column})' for column in ROLLUP_COLUMNS[2:])
+        cursor.executemany(
+            f"INSERT INTO {table} ({', '.join(ROLLUP_COLUMNS)}) VALUES ({', '.join(['%s'] * len(ROLLUP_COLUMNS))})"
+            f" ON DUPLICATE KEY UPDATE {updates}",
+            [key + (count, client_errors, errors, total, worst, json.dumps(sketch, separators=(',', ':')))
+             for key, (count, client_errors, errors, total, worst, sketch) in aggregates.items()])
+
+    def prune(self):
+        """按保留期限分批删除，返回 {表: 删除行数}"""
+        now = datetime.now()
+        deleted = {}
+        with self._database() as cursor:
+            cursor.execute("SELECT last_id FROM access_log_rollup_state WHERE name = %s", (STATE_NAME,))
+            row = cursor.fetchone()
+        last_id = row['last_id'] if row else 0
+        if self.raw_retention_days:
+            # 只删除已汇总的行，按主键顺序从最旧的开始
+            deleted['access_logs'] = self._delete_batches(
+                "DELETE FROM access_logs WHERE id <= %s AND access_time < %s ORDER BY id LIMIT %s",
+                (last_id, now - timedelta(days=self.raw_retention_days)))
+        for granularity, days in (('minute', self.minute_retention_days), ('hour', self.hour_retention_days)):
+            if days:
+                table = GRANULARITIES[granularity][0]
+                deleted[table] = self._delete_batches(
+                    f"DELETE FROM {table} WHERE bucket_start < %s ORDER BY bucket_start LIMIT %s",
+                    (now - timedelta(days=days),))
+        with self._lock:
+            self._stats['pruned'] += sum(deleted.values())
+        return deleted
+
+    def _delete_batches(self, sql, params):
+        # 每批单独提交，避免一次删除大量行长时间持有锁
+        total = 0
+        while True:
+            with self._database() as cursor:
+                count = cursor.execute(sql, params + (self.delete_batch,))
+            total += count
+            if count < self.delete_batch:
+                return total
+
+    def ensure_started(self, interval, prune_interval=3600.0):
+        """启动后台汇总线程（每个进程一个），每 interval 秒汇总一次，每 prune_interval 秒清理一次"""
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._loop, args=(interval, prune_interval),
+                                            name='access-log-rollup', daemon=True)
+            self._thread.start()
+
+    def _loop(self, interval, prune_interval):
+        next_prune = time.monotonic() + prune_interval
+        while True:
+            time.sleep(interval)
+            try:
+                self.run()
+                if time.monotonic() >= next_prune:
+                    next_prune = time.monotonic() + prune_interval
+                    self.prune()
+            except Exception as e:
+                with self._lock:
+                    self._stats['failed'] += 1
+                logging.error(f"访问日志汇总失败: {e}")
+
+    def report(self, granularity, since):
+        """读取 since 之后的汇总：各路由的请求数、错误数、平均与分位耗时，以及按桶的时间线"""
+        table = GRANULARITIES[granularity][0]
+        with self._database(readonly=True) as cursor:
+            cursor.execute(f"SELECT {', '.join(ROLLUP_COLUMNS)} FROM {table} WHERE bucket_start >= %s"
+                           f" ORDER BY bucket_start", (since,))
+            rows = cursor.fetchall()
+            cursor.execute("SELECT last_id, updated_at FROM access_log_rollup_state WHERE name = %s", (STATE_NAME,))
+            state = cursor.fetchone() or {'last_id': 0, 'updated_at': None}
+            # 主键上取最大 id，得到尚未汇总的日志条数（含刚写入、尚未稳定的行）
+            cursor.execute("SELECT MAX(id) AS max_id FROM access_logs")
+            max_id = cursor.fetchone()['max_id'] or 0
+            state = dict(state, pending=max(0, max_id - state['last_id']))
+
+        endpoints = {}
+        timeline = {}
+        total = _new_aggregate()
+        for row in rows:
+            aggregate = [row['request_count'], row['client_error_count'], row['error_count'],
+                         row['total_time'], row['max_time'],
+                         {int(bucket): count for bucket, count in json.loads(row['latency_sketch']).items()}]
+            for target in (endpoints.setdefault(row['endpoint'], _new_aggregate()),
+                           timeline.setdefault(row['bucket_start'], _new_aggregate()),
+                           total):
+                _merge_aggregate(target, aggregate)
+        return {
+            'granularity': granularity,
+            'since': since,
+            'state': state,
+            'total': _describe(total),
+            'endpoints': sorted(({'endpoint': endpoint, **_describe(aggregate)}
+                                 for endpoint, aggregate in endpoints.items()),
+                                key=lambda item: item['requests'], reverse=True),
+            'timeline': [{'bucket_start': bucket.strftime('%Y-%m-%d %H:%M'), **_describe(aggregate)}
+                         for bucket, aggregate in sorted(timeline.items())],
+        }
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+def _describe(aggregate):
+    count, client_errors, errors, total, worst, sketch = aggregate
+
+    def ms(seconds):
+        return None if seconds is None else round(seconds * 1000, 1)
+
+    return {
+        'requests': count,
+        'client_errors': client_errors,
+        'errors': errors,
+        'error_rate': round(errors / count * 100, 2) if count else 0.0,
+        'avg_ms': ms(total / count) if count else None,
+        'p50_ms': ms(sketch_quantile(sketch, 0.5)),
+        'p95_ms': ms(sketch_quantile(sketch, 0.95)),
+        'p99_ms': ms(sketch_quantile(sketch, 0.99)),
+        'max_ms': ms(worst) if count else None,
+    }
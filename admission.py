@@ -0,0 +1,325 @@
+import asyncio
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+
+# 拒绝原因
+REASON_RATE = 'rate'          # 令牌桶耗尽，返回 429
+REASON_QUEUE = 'queue_full'   # 等待队列已满或预计等待超过期限，返回 503
+REASON_TIMEOUT = 'timeout'    # 排队到期限仍未轮到，返回 503
+
+
+class Rejected(Exception):
+    """请求未被准入：status 为 429 或 503，retry_after 为建议的重试秒数"""
+
+    def __init__(self, status, reason, retry_after, message):
+        super().__init__(message)
+        self.status = status
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+        self.message = message
+
+
+def _pid_alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MemoryStore:
+    """进程内的令牌桶与并发计数，每个 worker 各自限流"""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = {}  # key -> [令牌数, 上次更新时间]
+        self._slots = {}    # route -> {owner}
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, now):
+        """取一个令牌，成功返回 0，否则返回还需等待的秒数"""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._sweep(now)
+                bucket = self._buckets[key] = [float(burst), now]
+            tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if tokens >= 1:
+                bucket[0] = tokens - 1
+                return 0.0
+            bucket[0] = tokens
+            return (1 - tokens) / rate
+
+    def _sweep(self, now):
+        # 已经回满的桶与新建的桶等价，可以直接丢弃
+        full = [key for key, (tokens, updated) in self._buckets.items() if now - updated > 3600]
+        for key in full or list(self._buckets)[:len(self._buckets) // 2]:
+            del self._buckets[key]
+
+    def try_acquire(self, route, limit, owner):
+        with self._lock:
+            owners = self._slots.setdefault(route, set())
+            if len(owners) >= limit:
+                return False
+            owners.add(owner)
+            return True
+
+    def release(self, route, owner):
+        with self._lock:
+            self._slots.get(route, set()).discard(owner)
+
+    def in_use(self, route):
+        with self._lock:
+            return len(self._slots.get(route, ()))
+
+    def stats(self):
+        with self._lock:
+            return {'store': 'memory', 'buckets': len(self._buckets)}
+
+
+class SQLiteStore:
+    """本机多个 worker 共享的令牌桶与并发计数，保存在 SQLite 文件中
+
+    每次操作一个 BEGIN IMMEDIATE 短事务，由 SQLite 的文件锁在进程间串行；
+    并发名额记录持有者的 pid，名额用满时清理已退出进程留下的名额。
+    """
+
+    def __init__(self, path, sweep_every=1000, idle_seconds=3600):
+        self.path = path
+        self.sweep_every = sweep_every
+        self.idle_seconds = idle_seconds
+        self._local = threading.local()
+        self._takes = 0
+
+    def _connection(self):
+        # 每个线程一个连接，fork 之后重新连接
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS slots (route TEXT, owner TEXT, pid INTEGER, PRIMARY KEY (route, owner))")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _transaction(self, work):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = work(conn)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    def take(self, key, rate, burst, now):
+        def work(conn):
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens = float(burst) if row is None else min(burst, row[0] + (now - row[1]) * rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                         (key, tokens - 1 if not wait else tokens, now))
+            self._takes += 1
+            if self._takes % self.sweep_every == 0:
+                conn.execute("DELETE FROM buckets WHERE updated < ?", (now - self.idle_seconds,))
+            return wait
+        return self._transaction(work)
+
+    def try_acquire(self, route, limit, owner):
+        def work(conn):
+            count = conn.execute("SELECT COUNT(*) FROM slots WHERE route = ?", (route,)).fetchone()[0]
+            if count >= limit:
+                pids = [pid for (pid,) in conn.execute("SELECT DISTINCT pid FROM slots WHERE route = ?", (route,))]
+                dead = [pid for pid in pids if not _pid_alive(pid)]
+                if not dead:
+                    return False
+                conn.executemany("DELETE FROM slots WHERE pid = ?", [(pid,) for pid in dead])
+                count = conn.execute("SELECT COUNT(*) FROM slots WHERE route = ?", (route,)).fetchone()[0]
+                if count >= limit:
+                    return False
+            conn.execute("INSERT INTO slots (route, owner, pid) VALUES (?, ?, ?)", (route, owner, os.getpid()))
+            return True
+        return self._transaction(work)
+
+    def release(self, route, owner):
+        self._connection().execute("DELETE FROM slots WHERE route = ? AND owner = ?", (route, owner))
+
+    def in_use(self, route):
+        return self._connection().execute("SELECT COUNT(*) FROM slots WHERE route = ?", (route,)).fetchone()[0]
+
+    def stats(self):
+        buckets = self._connection().execute("SELECT COUNT(*) FROM buckets").fetchone()[0]
+        return {'store': 'sqlite', 'path': self.path, 'buckets': buckets}
+
+
+class _Route:
+    """一个限制并发的路由在本进程内的等待队列与耗时估计"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.queue = deque()
+        self.cond = threading.Condition()
+        self.service_time = 0.0  # 持有名额时间的指数移动平均（秒）
+        self.stats = {'admitted': 0, 'queued': 0, 'shed': 0, 'timeouts': 0}
+
+
+class AdmissionController:
+    """准入控制：按会话用户与 IP 的令牌桶限流，并限制昂贵路由的并发数
+
+    - 令牌桶以 rate 个/秒补充、最多 burst 个，取不到令牌时拒绝（429），Retry-After 为补满一个令牌的时间
+    - route_limits 中的路由同时最多 limit 个请求持有名额，名额在响应发送完毕后释放（含流式导出）
+    - 名额用满时进入本进程的 FIFO 队列，队列已满或按平均耗时预计等不到 max_wait 秒时立即拒绝（503），
+      排队超过 max_wait 秒同样拒绝；只有队首尝试获取名额，释放时唤醒本进程的等待者，
+      其他 worker 释放的名额每 poll_interval 秒检查一次
+    """
+
+    def __init__(self, store, user_rate=5.0, user_burst=20, ip_rate=20.0, ip_burst=100, route_limits=None,
+                 queue_size=32, max_wait=5.0, poll_interval=0.02):
+        self.store = store
+        self.rates = {'user': (user_rate, user_burst), 'ip': (ip_rate, ip_burst)}
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+        self.routes = {route: _Route(limit) for route, limit in (route_limits or {}).items()}
+        self._lock = threading.Lock()
+        self._rate_limited = {'user': 0, 'ip': 0}
+
+    def check_rate(self, identities):
+        """identities 为 [(类型, 标识)]，类型为 user 或 ip；任一令牌桶耗尽时抛出 Rejected(429)"""
+        now = time.time()
+        for kind, value in identities:
+            rate, burst = self.rates[kind]
+            if rate <= 0:
+                continue
+            wait = self.store.take(f'{kind}:{value}', rate, burst, now)
+            if wait:
+                with self._lock:
+                    self._rate_limited[kind] += 1
+                raise Rejected(429, REASON_RATE, wait, '请求过于频繁，请稍后再试')
+
+    def limited(self, route):
+        return route in self.routes
+
+    def acquire(self, route, wait=True):
+        """获取路由的并发名额，返回名额（release 时传回），不限制的路由返回 None"""
+        state = self.routes.get(route)
+        if state is None:
+            return None
+        ticket = self._enqueue(route, state, wait)
+        if isinstance(ticket, tuple):
+            return ticket
+        deadline = time.monotonic() + self.max_wait
+        with state.cond:
+            try:
+                while True:
+                    slot = self._try_head(route, state, ticket)
+                    if slot is not None:
+                        return slot
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise self._timeout(state)
+                    state.cond.wait(min(remaining, self.poll_interval))
+            finally:
+                self._leave(state, ticket)
+
+    async def acquire_async(self, route):
+        """acquire 的协程版本，在事件循环中等待，不占用线程"""
+        state = self.routes.get(route)
+        if state is None:
+            return None
+        ticket = self._enqueue(route, state, True)
+        if isinstance(ticket, tuple):
+            return ticket
+        deadline = time.monotonic() + self.max_wait
+        try:
+            while True:
+                with state.cond:
+                    slot = self._try_head(route, state, ticket)
+                if slot is not None:
+                    return slot
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise self._timeout(state)
+                await asyncio.sleep(min(remaining, self.poll_interval))
+        finally:
+            with state.cond:
+                self._leave(state, ticket)
+
+    def _enqueue(self, route, state, wait):
+        # 队列为空时直接尝试获取名额，返回名额；否则排队并返回排队凭据
+        with state.cond:
+            if not state.queue:
+                slot = self._grab(route, state)
+                if slot is not None:
+                    return slot
+            position = len(state.queue) + 1
+            expected = math.ceil(position / state.limit) * state.service_time
+            if not wait or position > self.queue_size or expected > self.max_wait:
+                state.stats['shed'] += 1
+                raise Rejected(503, REASON_QUEUE, expected or state.service_time or 1,
+                               '服务繁忙，请稍后再试')
+            ticket = object()
+            state.queue.append(ticket)
+            state.stats['queued'] += 1
+            return ticket
+
+    def _try_head(self, route, state, ticket):
+        # 只有队首获取名额，保证本进程内先到先得
+        if state.queue[0] is not ticket:
+            return None
+        slot = self._grab(route, state)
+        if slot is not None:
+            state.queue.popleft()
+            state.cond.notify_all()
+        return slot
+
+    @staticmethod
+    def _leave(state, ticket):
+        if ticket in state.queue:
+            state.queue.remove(ticket)
+            state.cond.notify_all()
+
+    def _grab(self, route, state):
+        owner = uuid.uuid4().hex
+        if not self.store.try_acquire(route, state.limit, owner):
+            return None
+        state.stats['admitted'] += 1
+        return route, owner, time.monotonic()
+
+    def _timeout(self, state):
+        state.stats['timeouts'] += 1
+        return Rejected(503, REASON_TIMEOUT, state.service_time or self.max_wait, '服务繁忙，请稍后再试')
+
+    def release(self, slot):
+        route, owner, started = slot
+        state = self.routes[route]
+        self.store.release(route, owner)
+        with state.cond:
+            held = time.monotonic() - started
+            state.service_time = held if not state.service_time else 0.8 * state.service_time + 0.2 * held
+            state.cond.notify_all()
+
+    def stats(self):
+        routes = {}
+        for route, state in self.routes.items():
+            with state.cond:
+                routes[route] = dict(state.stats, limit=state.limit, waiting=len(state.queue),
+                                     service_ms=round(state.service_time * 1000, 1))
+            routes[route]['in_use'] = self.store.in_use(route)
+        with self._lock:
+            rate_limited = dict(self._rate_limited)
+        return {'rate_limited': rate_limited, 'routes': routes, **self.store.stats()}
@@ -1,14 +1,40 @@
 import csv
 import logging
 import os
+import atexit
+import base64
+import hashlib
+import hmac
+import json
+import mimetypes
 import re
+import threading
+import time
 import urllib.parse
-from datetime import datetime
+from datetime import datetime, timedelta
 from io import StringIO
 
 import flask
 import pymysql
-from flask import Flask, render_template, request, session, redirect, url_for, Response, flash
+from flask import Flask, render_template, request, session, redirect, url_for, Response, flash, jsonify, g, has_request_context
+from jinja2 import meta
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+from access_log import AccessLogWriter
+from admission import AdmissionController, MemoryStore, Rejected, SQLiteStore
+from access_rollup import AccessLogRollup
+from db_pool import ConnectionPool, ReplicaSet
+from major_index import MAJOR_FILTER_FIELDS, MajorIndex, count_facets
+from major_snapshot import MajorSnapshot, write_snapshot
+from metrics import Metrics
+from qa_index import QAIndex
+from rank_engine import RankEngine
+from score_stats import ScoreDistribution
+from suggest_index import SUGGEST_FIELDS, SuggestIndex
+from result_cache import FileBackend, MemoryBackend, ResultCache, VersionFile
+from sql_profiler import SQLProfiler
+from subject_eligibility import REQUIREMENT_COLUMNS, SUBJECTS, SubjectEligibility, format_subjects, parse_subjects
+from volunteer_check import STATUS_OK, check_list, code_key, parse_list
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -22,11 +48,42 @@ app.config['SESSION_COOKIE_SECURE'] = os.environ.get('PRODUCTION', 'False').lowe
 app.config['SESSION_COOKIE_HTTPONLY'] = True
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'  # 防止CSRF攻击
 app.config['DEBUG'] = False
+# 部署在反向代理之后时，设置为可信代理的层数（通常为 1），从 X-Forwarded-For 取客户端地址；
+# 未设置时 remote_addr 为直连地址，代理之后即为代理自身的地址
+TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', 0))
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=TRUSTED_PROXIES)
+
+# 静态资源清单：由 build_static.py 生成，记录原文件名对应的带哈希文件名及预压缩版本
+STATIC_MANIFEST_PATH = os.path.join(app.static_folder, 'dist', 'manifest.json')
+# 按优先级排列的预压缩编码及文件后缀
+STATIC_ENCODING_SUFFIXES = (('br', '.br'), ('gzip', '.gz'))
+
+def load_static_manifest():
+    try:
+        with open(STATIC_MANIFEST_PATH, encoding='utf-8') as f:
+            assets = json.load(f)['assets']
+    except FileNotFoundError:
+        logging.info("未找到静态资源清单，使用原始静态文件（运行 python build_static.py 构建）")
+        return {}, {}
+    except (ValueError, KeyError) as e:
+        logging.error(f"静态资源清单无效，使用原始静态文件: {e}")
+        return {}, {}
+    # 带哈希的路径 -> 可用的预压缩编码
+    return assets, {asset['path']: asset['encodings'] for asset in assets.values()}
+
+static_assets, static_encodings = load_static_manifest()
+
+# 模板中替代 url_for('static', filename=...)：有清单时返回带哈希的地址
+def static_url(filename):
+    asset = static_assets.get(filename)
+    return url_for('static', filename=asset['path'] if asset else filename)
 
 # 添加全局模板函数
 app.jinja_env.globals.update(
     max=max,
-    min=min
+    min=min,
+    static_url=static_url
 )
 
 # 数据库配置
@@ -40,33 +97,384 @@ DB_CONFIG = {
     'cursorclass': pymysql.cursors.DictCursor
 }
 
-# 自定义数据库连接管理类
+# 连接池配置
+DB_POOL_CONFIG = {
+    'min_size': int(os.environ.get('DB_POOL_MIN', 1)),
+    'max_size': int(os.environ.get('DB_POOL_MAX', 10)),
+    'max_age': int(os.environ.get('DB_POOL_MAX_AGE', 3600)),
+    'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 5)),
+}
+
+db_pool = ConnectionPool(DB_CONFIG, **DB_POOL_CONFIG)
+
+# 只读副本：DB_REPLICAS 为逗号分隔的 host[:port]，账号与库名同主库
+DB_REPLICAS = [item.strip() for item in os.environ.get('DB_REPLICAS', '').split(',') if item.strip()]
+DB_STICKY_SECONDS = float(os.environ.get('DB_STICKY_SECONDS', 10))
+replica_set = ReplicaSet(
+    db_pool,
+    [dict(DB_CONFIG, host=replica.rsplit(':', 1)[0], port=int(replica.rsplit(':', 1)[1]) if ':' in replica else 3306)
+     for replica in DB_REPLICAS],
+    max_lag=float(os.environ.get('DB_REPLICA_MAX_LAG', 5)),
+    check_interval=float(os.environ.get('DB_REPLICA_CHECK_INTERVAL', 5)),
+    retry_after=float(os.environ.get('DB_REPLICA_RETRY', 30)),
+    acquire_timeout=float(os.environ.get('DB_REPLICA_ACQUIRE_TIMEOUT', 0.2)),
+    **DB_POOL_CONFIG
+) if DB_REPLICAS else None
+
+# 列式快照文件路径：设置后各 worker 内存映射同一个快照文件代替进程内索引
+MAJOR_SNAPSHOT_PATH = os.environ.get('MAJOR_SNAPSHOT', '')
+# 启用 major_infos 内存索引（或快照）后，college_major 不再访问数据库
+MAJOR_INDEX_ENABLED = os.environ.get('MAJOR_INDEX', 'False').lower() == 'true' or bool(MAJOR_SNAPSHOT_PATH)
+major_index = None
+major_index_lock = threading.Lock()
+
+# 执行 migrations/0001 建立 ngram 全文索引后，可开启全文检索预过滤
+FULLTEXT_SEARCH_ENABLED = os.environ.get('FULLTEXT_SEARCH', 'False').lower() == 'true'
+FULLTEXT_MIN_TOKEN = int(os.environ.get('FULLTEXT_MIN_TOKEN', 2))  # 与 MySQL ngram_token_size 一致
+FULLTEXT_COLUMNS = ('college_name_query', 'major_name_query')
+
+# 快照中按整数数组存放的列类型
+MYSQL_INTEGER_TYPES = {
+    pymysql.constants.FIELD_TYPE.TINY, pymysql.constants.FIELD_TYPE.SHORT, pymysql.constants.FIELD_TYPE.INT24,
+    pymysql.constants.FIELD_TYPE.LONG, pymysql.constants.FIELD_TYPE.LONGLONG,
+}
+
+# 查询结果排序键，末尾的 id 保证顺序唯一，供键集分页定位
+MAJOR_SORT_COLUMNS = ('batch_name', 'college_code', 'major_code', 'id')
+MAJOR_ORDER_BY = ', '.join(MAJOR_SORT_COLUMNS)
+MAJOR_PER_PAGE = 20  # 查询页面每页显示数量
+
+# 查询结果缓存：默认进程内，设为 file 时多个 worker 共享本地目录
+RESULT_CACHE_TTL = int(os.environ.get('RESULT_CACHE_TTL', 300))
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', 4096))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+# file 后端会反序列化目录中的 pickle 文件，目录必须显式配置，且只允许运行应用的用户访问
+if os.environ.get('RESULT_CACHE_BACKEND', 'memory') == 'file':
+    if not os.environ.get('RESULT_CACHE_DIR'):
+        raise RuntimeError("RESULT_CACHE_BACKEND=file 时必须设置 RESULT_CACHE_DIR（仅运行应用的用户可访问的目录）")
+    cache_backend = FileBackend(
+        os.environ['RESULT_CACHE_DIR'],
+        secret=os.environ.get('RESULT_CACHE_SECRET') or app.secret_key,
+        max_entries=RESULT_CACHE_MAX_ENTRIES,
+        max_bytes=RESULT_CACHE_MAX_BYTES
+    )
+else:
+    cache_backend = MemoryBackend(max_entries=RESULT_CACHE_MAX_ENTRIES, max_bytes=RESULT_CACHE_MAX_BYTES)
+# 数据版本文件：与缓存后端无关，重新加载专业索引、导入招生计划后更新，各 worker 据此失效缓存并重新加载索引；
+# 设为空时数据版本保存在缓存后端，进程内缓存只有处理重新加载请求的 worker 会刷新
+DATA_VERSION_FILE = os.environ.get('DATA_VERSION_FILE', os.path.join(app.instance_path, 'data_version'))
+result_cache = ResultCache(cache_backend, ttl=RESULT_CACHE_TTL,
+                           version_file=VersionFile(DATA_VERSION_FILE) if DATA_VERSION_FILE else None)
+# 数据版本是否在各 worker 之间共享：共享时只由发布新数据的一方更新版本
+RESULT_CACHE_SHARED = bool(DATA_VERSION_FILE) or isinstance(cache_backend, FileBackend)
+# 单次导出结果不超过该字节数时整体缓存
+EXPORT_CACHE_MAX_BYTES = int(os.environ.get('EXPORT_CACHE_MAX_BYTES', 8 * 1024 * 1024))
+
+# 内容与数据无关的页面按 (模板, 用户名) 渲染一次后缓存，部署新模板后重启生效
+PAGE_CACHE_MAX_ENTRIES = int(os.environ.get('PAGE_CACHE_MAX_ENTRIES', 512))
+page_cache = ResultCache(MemoryBackend(max_entries=PAGE_CACHE_MAX_ENTRIES, max_bytes=32 * 1024 * 1024), ttl=0)
+
+# 只有这些页面禁止浏览器保存：登录页、管理后台与考生成绩
+NO_STORE_PATHS = ('/',)
+NO_STORE_PREFIXES = ('/admin', '/score_rank')
+
+# 成绩排名内存索引，导入成绩后由管理员重新加载
+rank_engine = None
+rank_engine_lock = threading.Lock()
+SCORE_RANK_BATCH_LIMIT = 500
+RANK_ENGINE_SQL = "SELECT id, name, theory_score, practical_score, cultural_score, total_score FROM score_table"
+# 成绩表指纹：每 SCORE_CHECK_INTERVAL 秒（0 为不检查）比对一次，变化后重新加载排名索引与分数分布
+SCORE_CHECK_INTERVAL = float(os.environ.get('SCORE_CHECK_INTERVAL', 60))
+# 除行数与各项成绩之和外，按行内容计算 MD5 前 60 位的异或作为校验和，改名、两行间对调成绩等原地修改同样能发现
+# （CRC32 对异或是线性的，两行对调等长字段时会相互抵消，所以不用 CRC32）
+SCORE_FINGERPRINT_SQL = (
+    "SELECT COUNT(*) AS count, MAX(id) AS max_id, SUM(theory_score) AS theory, SUM(practical_score) AS practical,"
+    " SUM(cultural_score) AS cultural, SUM(total_score) AS total,"
+    " BIT_XOR(CAST(CONV(SUBSTRING(MD5(CONCAT_WS('|', id, name, COALESCE(theory_score, ''), COALESCE(practical_score, ''),"
+    " COALESCE(cultural_score, ''), COALESCE(total_score, ''))), 1, 15), 16, 10) AS UNSIGNED)) AS checksum"
+    " FROM score_table"
+)
+# 分数分布：一分一段表的分段宽度与各项成绩直方图的分段宽度
+SCORE_SEGMENT = int(os.environ.get('SCORE_SEGMENT', 1))
+SCORE_HISTOGRAM_BIN = int(os.environ.get('SCORE_HISTOGRAM_BIN', 5))
+score_distribution = None
+
+# 名称补全索引：数据版本变化（导入招生计划、重新加载专业索引）后下一次请求时重建
+suggest_index = None
+suggest_index_lock = threading.Lock()
+SUGGEST_DEFAULT_K = 10
+# 热度为名称在招生计划中出现的次数，大学为其问答问题数
+SUGGEST_SQL = {
+    'college_name': "SELECT college_name, COUNT(*) FROM major_infos GROUP BY college_name",
+    'major_name': "SELECT major_name, COUNT(*) FROM major_infos GROUP BY major_name",
+    'university': "SELECT u.name, COUNT(q.id) FROM universities u LEFT JOIN questions q ON q.university_id = u.id GROUP BY u.id, u.name",
+}
+
+# 数据库查询模式下按选考科目筛选用到的要求组合（各不相同的选科要求与考生资格要求），数据版本变化后重新读取
+subject_requirements = None
+subject_requirements_lock = threading.Lock()
+
+# 院校问答检索索引：由 build_qa_index.py 离线生成，启动时内存映射，查询不访问数据库
+QA_INDEX_PATH = os.environ.get('QA_INDEX_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'qa_index.bin'))
+QA_SEARCH_DEFAULT_K = 20
+QA_SEARCH_MAX_K = 100
+qa_index = None
+qa_index_lock = threading.Lock()
+
+# 请求与数据库指标，/metrics 以 Prometheus 文本格式输出；
+# 多 worker 部署时设置 METRICS_DIR 为共享目录，抓取任一 worker 即得到全部 worker 的汇总
+METRICS_ENABLED = os.environ.get('METRICS', 'True').lower() == 'true'
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+# 允许本机地址不带令牌抓取；部署在同机反向代理之后时所有请求都来自本机，不要开启
+METRICS_ALLOW_LOCAL = os.environ.get('METRICS_ALLOW_LOCAL', 'False').lower() == 'true'
+metrics = Metrics(
+    directory=os.environ.get('METRICS_DIR') or None,
+    flush_interval=float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+)
+
+# 主库写入后，该会话的只读查询在这段时间内仍走主库，保证能读到自己的修改
+def remember_primary_write():
+    if replica_set is not None:
+        session['db_primary_until'] = time.time() + DB_STICKY_SECONDS
+
+def read_from_primary():
+    return has_request_context() and session.get('db_primary_until', 0) > time.time()
+
+# 自定义数据库连接管理类，连接从连接池借出并在退出时归还
+# readonly=True 的查询在配置了只读副本时发往副本
 class Database:
-    def __init__(self):
+    def __init__(self, cursorclass=None, readonly=False):
+        self.cursorclass = cursorclass
+        self.readonly = readonly
+        self.pool = db_pool
         self.connection = None
         self.cursor = None
     
     def __enter__(self):
         try:
-            self.connection = pymysql.connect(**DB_CONFIG)
-            self.cursor = self.connection.cursor()
+            if self.readonly and replica_set is not None and not read_from_primary():
+                self.pool, self.connection = replica_set.acquire()
+            else:
+                self.connection = db_pool.acquire()
+            self.cursor = self.connection.cursor(self.cursorclass)
+            if METRICS_ENABLED:
+                metrics.instrument_cursor(self.cursor)
+            if sql_profiler is not None:
+                sql_profiler.instrument_cursor(self.cursor)
             return self.cursor
         except pymysql.Error as e:
+            if self.connection:
+                self.pool.release(self.connection, broken=True)
+                self.connection = None
             logging.error(f"数据库连接错误: {e}")
             raise
     
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if exc_type:
+        # 无缓冲游标中途退出（如客户端中断下载）时，回滚或关闭游标都会先读完剩余结果，
+        # 直接丢弃连接更快
+        if exc_type and isinstance(self.cursor, pymysql.cursors.SSCursor):
+            if exc_type is not GeneratorExit:
+                logging.error(f"数据库操作错误: {exc_val}")
             if self.connection:
-                self.connection.rollback()
-            logging.error(f"数据库操作错误: {exc_val}")
-        else:
+                self.pool.release(self.connection, broken=True)
+            return
+        broken = False
+        try:
+            if exc_type:
+                if self.connection:
+                    self.connection.rollback()
+                if exc_type is not GeneratorExit:
+                    logging.error(f"数据库操作错误: {exc_val}")
+            else:
+                if self.connection:
+                    self.connection.commit()
+        except pymysql.Error as e:
+            # 提交或回滚失败说明连接状态不可信，不再放回连接池
+            broken = True
+            logging.error(f"事务结束失败: {e}")
+            if not exc_type:
+                raise
+        finally:
+            if self.cursor:
+                self.cursor.close()
             if self.connection:
-                self.connection.commit()
-        if self.cursor:
-            self.cursor.close()
-        if self.connection:
-            self.connection.close()
+                self.pool.release(self.connection, broken=broken or isinstance(exc_val, pymysql.OperationalError))
+
+# 对慢查询执行 EXPLAIN（由 SQL 分析器在后台线程调用）
+def explain_statement(sql, params):
+    with Database(readonly=True) as cursor:
+        cursor.execute("EXPLAIN " + sql, params)
+        return cursor.fetchall()
+
+# SQL 分析模式：记录每个请求执行的语句、参数、行数与耗时，慢查询自动 EXPLAIN
+SQL_PROFILE_ENABLED = os.environ.get('SQL_PROFILE', 'False').lower() == 'true'
+SQL_PROFILE_TOP_N = int(os.environ.get('SQL_PROFILE_TOP_N', 20))
+# 不记录跟踪的路径：静态资源、指标抓取与分析页面本身
+SQL_PROFILE_SKIP_PREFIXES = ('/static/', '/metrics', '/admin/sql_profile')
+sql_profiler = SQLProfiler(
+    explain_statement,
+    slow_ms=float(os.environ.get('SQL_PROFILE_SLOW_MS', 200)),
+    sample_rate=float(os.environ.get('SQL_PROFILE_SAMPLE_RATE', 1.0)),
+    max_traces=int(os.environ.get('SQL_PROFILE_MAX_TRACES', 200)),
+    window_minutes=int(os.environ.get('SQL_PROFILE_WINDOW_MINUTES', 15))
+) if SQL_PROFILE_ENABLED else None
+
+# 访问日志：请求结束后放入队列，由后台线程批量写入 access_logs
+ACCESS_LOG_ENABLED = os.environ.get('ACCESS_LOG', 'True').lower() == 'true'
+access_log_writer = AccessLogWriter(
+    Database,
+    max_queue=int(os.environ.get('ACCESS_LOG_QUEUE', 10000)),
+    batch_size=int(os.environ.get('ACCESS_LOG_BATCH', 200)),
+    flush_interval=float(os.environ.get('ACCESS_LOG_FLUSH_INTERVAL', 2))
+)
+atexit.register(access_log_writer.stop)
+
+# 访问日志汇总：增量汇总到按分钟、按小时的汇总表，并按保留期限清理原始日志
+# ACCESS_LOG_ROLLUP_INTERVAL 为 0 时不在应用内运行，改用 rollup_access_logs.py 定时执行
+ACCESS_LOG_ROLLUP_INTERVAL = float(os.environ.get('ACCESS_LOG_ROLLUP_INTERVAL', 0))
+ACCESS_LOG_PRUNE_INTERVAL = float(os.environ.get('ACCESS_LOG_PRUNE_INTERVAL', 3600))
+access_log_rollup = AccessLogRollup(
+    Database,
+    batch_size=int(os.environ.get('ACCESS_LOG_ROLLUP_BATCH', 5000)),
+    settle_seconds=float(os.environ.get('ACCESS_LOG_ROLLUP_SETTLE', 60)),
+    raw_retention_days=int(os.environ.get('ACCESS_LOG_RETENTION_DAYS', 30)),
+    minute_retention_days=int(os.environ.get('ACCESS_LOG_MINUTE_RETENTION_DAYS', 7)),
+    hour_retention_days=int(os.environ.get('ACCESS_LOG_HOUR_RETENTION_DAYS', 0))
+)
+# 准入控制：按会话用户与 IP 的令牌桶限流，昂贵路由限制并发并排队，超过等待期限返回 503
+# 按 IP 限流默认关闭：反向代理或学校 NAT 之后大量用户共用一个地址，需配置 TRUSTED_PROXIES 后再按需开启
+# ADMISSION_DIR 为本机各 worker 共享的目录时限额在 worker 之间共享，否则每个 worker 各自计算
+ADMISSION_ENABLED = os.environ.get('ADMISSION', 'True').lower() == 'true'
+ADMISSION_DIR = os.environ.get('ADMISSION_DIR', '')
+# 限制并发的路由：endpoint=同时处理数，逗号分隔
+ADMISSION_ROUTES = {
+    endpoint.strip(): int(limit)
+    for endpoint, _, limit in (item.partition('=') for item in os.environ.get(
+        'ADMISSION_ROUTES', 'export_college_major=4,college_major=16,api_college_major=16,api_volunteer_check=8'
+    ).split(',') if item.strip())
+}
+admission = AdmissionController(
+    SQLiteStore(os.path.join(ADMISSION_DIR, 'admission.db')) if ADMISSION_DIR else MemoryStore(),
+    user_rate=float(os.environ.get('ADMISSION_USER_RATE', 5)),
+    user_burst=int(os.environ.get('ADMISSION_USER_BURST', 20)),
+    ip_rate=float(os.environ.get('ADMISSION_IP_RATE', 0)),
+    ip_burst=int(os.environ.get('ADMISSION_IP_BURST', 100)),
+    route_limits=ADMISSION_ROUTES,
+    queue_size=int(os.environ.get('ADMISSION_QUEUE', 32)),
+    max_wait=float(os.environ.get('ADMISSION_MAX_WAIT', 5))
+) if ADMISSION_ENABLED else None
+
+# 统计页面的时间范围 -> (小时数, 汇总粒度)
+TRAFFIC_RANGES = {'1h': (1, 'minute'), '6h': (6, 'minute'), '24h': (24, 'hour'), '7d': (24 * 7, 'hour'),
+                  '30d': (24 * 30, 'hour')}
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    if METRICS_ENABLED:
+        g.metrics_token = metrics.begin_request()
+    if sql_profiler is not None and not request.path.startswith(SQL_PROFILE_SKIP_PREFIXES):
+        g.sql_trace = sql_profiler.begin_request(request.method, request.full_path.rstrip('?'), request.endpoint)
+
+# 准入控制：管理员不受令牌桶限制；昂贵路由先取得并发名额再进入视图，
+# 异步服务模式下由 asgi_app 在事件循环中排队，回退到 Flask 的请求不排队
+@app.before_request
+def admit_request():
+    if admission is None or request.path.startswith('/static/') or request.path == '/metrics':
+        return None
+    try:
+        if not session.get('is_admin', False):
+            identities = [('ip', request.remote_addr or '')]
+            if session.get('login') == 'OK' and session.get('user'):
+                identities.insert(0, ('user', session['user']))
+            admission.check_rate(identities)
+        if admission.limited(request.endpoint):
+            if request.environ.get('ziyuan.async'):
+                g.admission_pending = request.endpoint
+            else:
+                g.admission_slot = admission.acquire(request.endpoint, wait=not request.environ.get('ziyuan.no_wait'))
+    except Rejected as e:
+        return rejection_response(e)
+    return None
+
+# 429/503 响应：JSON 接口返回 {'error': ...}，页面返回纯文本，均带 Retry-After
+def rejection_response(rejection):
+    if METRICS_ENABLED:
+        metrics.inc('ziyuan_admission_rejected_total',
+                    (('endpoint', request.endpoint or 'unmatched'), ('reason', rejection.reason)))
+    if request.path.startswith('/api/') or request.is_json:
+        response = jsonify({'error': rejection.message})
+        response.status_code = rejection.status
+    else:
+        response = Response(rejection.message, status=rejection.status, mimetype='text/plain')
+    response.headers['Retry-After'] = str(rejection.retry_after)
+    return response
+
+# 并发名额在响应发送完毕后释放，流式导出直到最后一块写出才释放
+@app.after_request
+def release_admission_slot(response):
+    slot = g.pop('admission_slot', None)
+    if slot is not None:
+        response.call_on_close(lambda: admission.release(slot))
+    return response
+
+# 视图抛出未处理的异常时没有响应对象，在请求结束时释放名额
+@app.teardown_request
+def release_admission_slot_on_error(exc):
+    slot = g.pop('admission_slot', None)
+    if slot is not None:
+        admission.release(slot)
+
+# 分析模式下在响应头中附带本次请求的跟踪编号与 SQL 耗时
+@app.after_request
+def add_sql_trace_headers(response):
+    if 'sql_trace' in g:
+        trace = g.sql_trace[0]
+        statements = trace['statements']
+        response.headers['X-SQL-Trace-Id'] = trace['id']
+        response.headers['Server-Timing'] = (f'sql;dur={sum(statement["ms"] for statement in statements):.3f};'
+                                             f'desc="{len(statements)} queries"')
+    return response
+
+# 请求结束后保存 SQL 跟踪（流式导出在此之后执行的语句不计入）
+@app.teardown_request
+def finish_sql_trace(exc):
+    sql_trace = g.pop('sql_trace', None)
+    if sql_trace is not None:
+        trace, token = sql_trace
+        sql_profiler.end_request(token, trace, g.get('response_status', 500), time.perf_counter() - g.request_start)
+
+# 请求结束时记录请求指标；未处理的异常没有响应对象，按 500 计
+@app.teardown_request
+def record_request_metrics(exc):
+    token = g.pop('metrics_token', None)
+    if token is not None:
+        metrics.end_request(token, request.endpoint or 'unmatched', g.get('response_status', 500),
+                            time.perf_counter() - g.request_start)
+
+# 记录访问日志（静态资源除外），process_time 单位为秒
+@app.after_request
+def record_access_log(response):
+    g.response_status = response.status_code
+    if (not ACCESS_LOG_ENABLED or request.path.startswith('/static/') or request.path == '/metrics'
+            or 'request_start' not in g):
+        return response
+    if ACCESS_LOG_ROLLUP_INTERVAL > 0:
+        access_log_rollup.ensure_started(ACCESS_LOG_ROLLUP_INTERVAL, ACCESS_LOG_PRUNE_INTERVAL)
+    access_log_writer.record((
+        None,
+        session.get('user'),
+        request.remote_addr or '',
+        request.method,
+        (request.endpoint or request.path)[:100],
+        request.full_path.rstrip('?')[:255],
+        request.query_string.decode('utf-8', 'replace') or None,
+        request.headers.get('User-Agent', '')[:255],
+        datetime.now(),
+        response.status_code,
+        round(time.perf_counter() - g.request_start, 6)
+    ))
+    return response
 
 # 安全响应头中间件
 @app.after_request
@@ -76,11 +484,15 @@ def add_security_headers(response):
     response.headers['X-Frame-Options'] = 'SAMEORIGIN'
     response.headers['X-XSS-Protection'] = '1; mode=block'
     
-    # 缓存控制（非静态资源）
-    if not request.path.startswith('/static/'):
-        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        response.headers['Pragma'] = 'no-cache'
-        response.headers['Expires'] = '0'
+    # 缓存控制（非静态资源，视图已设置缓存策略的除外）：
+    # 敏感页面禁止保存，其余页面只允许浏览器私有缓存且每次使用前重新验证
+    if not request.path.startswith('/static/') and 'Cache-Control' not in response.headers:
+        if request.path in NO_STORE_PATHS or request.path.startswith(NO_STORE_PREFIXES):
+            response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+            response.headers['Pragma'] = 'no-cache'
+            response.headers['Expires'] = '0'
+        else:
+            response.headers['Cache-Control'] = 'private, no-cache'
     
     # 简化Server头
     response.headers['Server'] = 'Web Server'
@@ -91,10 +503,32 @@ def add_security_headers(response):
 @app.after_request
 def set_static_cache(response):
     if request.path.startswith('/static/'):
-        # 静态资源缓存1年并设置immutable
-        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        if (request.view_args or {}).get('filename') in static_encodings:
+            # 带内容哈希的文件名内容不会变化，缓存1年并设置immutable
+            response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        else:
+            # 原始文件名的内容可能随部署变化，每次使用前验证
+            response.headers['Cache-Control'] = 'public, no-cache'
+    return response
+
+# 发送静态资源：带哈希的文件按 Accept-Encoding 选择预压缩版本
+def send_static_asset(filename):
+    encodings = static_encodings.get(filename)
+    if not encodings:
+        return app.send_static_file(filename)
+    for encoding, suffix in STATIC_ENCODING_SUFFIXES:
+        if encoding in encodings and request.accept_encodings[encoding]:
+            mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            response = flask.send_from_directory(app.static_folder, filename + suffix, mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = app.send_static_file(filename)
+    response.vary.add('Accept-Encoding')
     return response
 
+app.view_functions['static'] = send_static_asset
+
 # 登录页面
 @app.route("/", methods=["GET", "POST"])
 def login():
@@ -153,247 +587,624 @@ def login():
 
     return render_template('login.html', msg=msg, user=user)
 
+# 读取七个院校专业查询条件及考生选考科目（subjects，规范为“物理+化学+生物”，无法识别时忽略）
+def get_major_filters(source):
+    filters = {arg: source.get(arg, '').strip() for arg, _ in MAJOR_FILTER_FIELDS}
+    subjects = source.getlist('subjects') if hasattr(source, 'getlist') else [source.get('subjects', '')]
+    try:
+        filters['subjects'] = format_subjects(parse_subjects('+'.join(subjects)))
+    except ValueError as e:
+        logging.warning(f"忽略无效的选考科目: {e}")
+        filters['subjects'] = ''
+    return filters
+
+# 在内存索引中按查询条件过滤，再按选考科目保留能报考的专业
+def search_major_index(index, filters):
+    positions = index.search({column: filters[arg] for arg, column in MAJOR_FILTER_FIELDS})
+    if filters.get('subjects') and positions:
+        positions = index.subject_eligibility.filter(positions, parse_subjects(filters['subjects']))
+    return positions
+
+# 查询串能否交给 ngram 全文索引：长度不小于分词长度，且不含 LIKE 通配符与布尔模式的引号
+def fulltext_usable(query):
+    return len(query) >= FULLTEXT_MIN_TOKEN and not re.search(r'[%_"\\]', query)
+
+# 把查询条件转换为 SQL 条件与参数，fulltext 为 None 时按 FULLTEXT_SEARCH 配置决定
+def build_major_conditions(filters, fulltext=None):
+    conditions = []
+    values = []
+    if FULLTEXT_SEARCH_ENABLED if fulltext is None else fulltext:
+        # 全文索引只负责缩小范围，下面的 LIKE 条件保证结果与原语义一致
+        phrases = [f'+"{filters[arg]}"' for arg in FULLTEXT_COLUMNS if fulltext_usable(filters.get(arg, ''))]
+        if phrases:
+            conditions.append('MATCH(college_name, major_name) AGAINST (%s IN BOOLEAN MODE)')
+            values.append(' '.join(phrases))
+    for arg, column in MAJOR_FILTER_FIELDS:
+        if filters.get(arg):
+            conditions.append(f'{column} LIKE %s')
+            values.append(f'%{filters[arg]}%')
+    if filters.get('subjects'):
+        # 选科要求在内存中按要求组合判断，数据库只按能报考的组合取行
+        requirements = get_subject_requirements()
+        eligible = requirements.eligible_texts(parse_subjects(filters['subjects']))
+        if not eligible:
+            conditions.append('1 = 0')
+        elif len(eligible) < len(requirements):
+            columns = ', '.join(f"COALESCE({column}, '')" for column in REQUIREMENT_COLUMNS)
+            conditions.append(f"({columns}) IN ({', '.join(['(%s, %s)'] * len(eligible))})")
+            values.extend(text or '' for texts in eligible for text in texts)
+    return conditions, values
+
+# 读取各不相同的要求组合并解析，供数据库查询模式按选考科目筛选
+def load_subject_requirements():
+    global subject_requirements
+    version = result_cache.data_version()
+    columns = ', '.join(REQUIREMENT_COLUMNS)
+    with Database(readonly=True) as cursor:
+        cursor.execute(f"SELECT DISTINCT {columns} FROM major_infos")
+        rows = cursor.fetchall()
+    requirements = SubjectEligibility(tuple(row[column] for column in REQUIREMENT_COLUMNS) for row in rows)
+    requirements.data_version = version
+    subject_requirements = requirements
+    logging.info(f"选科要求组合已加载: {len(requirements)} 种")
+    return requirements
+
+# 获取要求组合，首次使用或数据版本变化时加载
+def get_subject_requirements():
+    requirements = subject_requirements
+    if requirements is None or requirements.data_version != result_cache.data_version():
+        with subject_requirements_lock:
+            if subject_requirements is requirements:
+                load_subject_requirements()
+    return subject_requirements
+
+# 结果缓存键：查询条件按 LIKE 的大小写不敏感语义归一化
+def major_cache_key(namespace, filters, *extra):
+    normalized = {arg: filters.get(arg, '').casefold() for arg, _ in MAJOR_FILTER_FIELDS}
+    normalized['subjects'] = filters.get('subjects', '')
+    return ResultCache.make_key(namespace, normalized, *extra)
+
+# 分页游标：把排序键编码为 URL 安全的不透明字符串
+def encode_page_cursor(row):
+    raw = json.dumps([row[column] for column in MAJOR_SORT_COLUMNS], ensure_ascii=False, default=str)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_page_cursor(token):
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        key = json.loads(raw.decode('utf-8'))
+    except (ValueError, UnicodeDecodeError):
+        logging.warning(f"无效的分页游标: {token}")
+        return None
+    if not isinstance(key, list) or len(key) != len(MAJOR_SORT_COLUMNS):
+        return None
+    return key
+
+# 从数据库快照重建 major_infos 内存索引
+# bump=True 表示数据已变更，同时更新结果缓存的数据版本；
+# 否则沿用当前版本（首次加载或跟随其他 worker 的重新加载）
+# 快照模式下打开快照文件（不存在时先从数据库生成），不再持有行数据
+def load_major_index(bump=False):
+    global major_index
+    start = time.perf_counter()
+    version = None if bump else result_cache.data_version()
+    if MAJOR_SNAPSHOT_PATH:
+        if not os.path.exists(MAJOR_SNAPSHOT_PATH):
+            write_major_snapshot(MAJOR_SNAPSHOT_PATH)
+        index = MajorSnapshot(MAJOR_SNAPSHOT_PATH)
+    else:
+        with Database() as cursor:
+            cursor.execute(f"SELECT * FROM major_infos ORDER BY {MAJOR_ORDER_BY}")
+            rows = cursor.fetchall()
+        index = MajorIndex(rows)
+    index.data_version = result_cache.bump_version() if bump else version
+    major_index = index
+    logging.info(f"专业索引已加载: {len(index)} 行, 耗时 {time.perf_counter() - start:.2f} 秒")
+    return index
+
+# 获取内存索引，首次使用、数据版本变化或快照文件被替换时加载
+def get_major_index():
+    index = major_index
+    replaced = MAJOR_SNAPSHOT_PATH and index is not None and index.replaced()
+    if index is None or replaced or index.data_version != result_cache.data_version():
+        with major_index_lock:
+            if major_index is index:
+                # 其他进程发布了新快照：共享缓存的版本已由发布方更新，不再重复更新，
+                # 否则其他 worker 会因版本变化再加载一次；进程内缓存由本进程自行失效
+                load_major_index(bump=bool(replaced) and not RESULT_CACHE_SHARED)
+    return major_index
+
+# 用无缓冲游标逐行读取 major_infos，按排序键写入列式快照文件并原子替换
+def write_major_snapshot(path):
+    start = time.perf_counter()
+    with Database(cursorclass=pymysql.cursors.SSCursor) as cursor:
+        cursor.execute(f"SELECT * FROM major_infos ORDER BY {MAJOR_ORDER_BY}")
+        columns = [column[0] for column in cursor.description]
+        integer_columns = {column[0] for column in cursor.description if column[1] in MYSQL_INTEGER_TYPES}
+        meta = write_snapshot(path, columns, cursor, integer_columns)
+    logging.info(f"专业快照已生成: {meta['rows']} 行, 耗时 {time.perf_counter() - start:.2f} 秒, 文件 {path}")
+    return meta
+
+# 院校专业查询的 SQL 语句，同步视图与异步服务模式共用
+def major_count_query(conditions, values):
+    sql = "SELECT COUNT(*) as count FROM major_infos"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    return sql, tuple(values)
+
+def major_offset_query(conditions, values, per_page, offset):
+    sql = "SELECT * FROM major_infos"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += f" ORDER BY {MAJOR_ORDER_BY} LIMIT %s OFFSET %s"
+    return sql, tuple(values) + (per_page, offset)
+
+# 键集分页：从游标位置按索引顺序向后（after）或向前读取一页，向前读取的结果为倒序
+def major_seek_query(conditions, values, key, after, per_page):
+    seek_op, direction = ('>', 'ASC') if after else ('<', 'DESC')
+    seek_conditions = conditions + [
+        f"({MAJOR_ORDER_BY}) {seek_op} ({', '.join(['%s'] * len(MAJOR_SORT_COLUMNS))})"
+    ]
+    sql = "SELECT * FROM major_infos WHERE " + " AND ".join(seek_conditions)
+    sql += " ORDER BY " + ", ".join(f"{column} {direction}" for column in MAJOR_SORT_COLUMNS)
+    sql += " LIMIT %s"
+    return sql, tuple(values) + tuple(key) + (per_page,)
+
+# 查询一页院校专业数据，返回 (总记录数, 实际页码, 本页结果)
+def query_major_page(filters, current_page, per_page, after_key=None, before_key=None, version=None):
+    if MAJOR_INDEX_ENABLED:
+        # 内存索引模式：过滤、计数、分页均不访问数据库
+        index = get_major_index()
+        matched = search_major_index(index, filters)
+        total_count = len(matched)
+        total_pages = max(1, (total_count + per_page - 1) // per_page)
+        current_page = min(max(current_page, 1), total_pages)
+        offset = (current_page - 1) * per_page
+        return total_count, current_page, index.page(matched, offset, per_page)
+
+    conditions, values = build_major_conditions(filters)
+    results = []
+    with Database(readonly=True) as cursor:
+        # 总记录数只与查询条件有关，翻页时直接复用
+        count_key = major_cache_key('count', filters)
+        total_count = result_cache.get(count_key, version)
+        if total_count is None:
+            cursor.execute(*major_count_query(conditions, values))
+            result = cursor.fetchone()
+            total_count = result['count'] if result else 0
+            result_cache.set(count_key, total_count, version=version)
+        total_pages = max(1, (total_count + per_page - 1) // per_page)
+
+        # 确保页码有效
+        if current_page < 1:
+            current_page = 1
+        if current_page > total_pages:
+            current_page = total_pages if total_pages > 0 else 1
+
+        offset = (current_page - 1) * per_page
+
+        if after_key or before_key:
+            cursor.execute(*major_seek_query(conditions, values, after_key or before_key, bool(after_key), per_page))
+            results = cursor.fetchall()
+            if before_key:
+                results.reverse()
+                # 向前翻到头时不足一页，回到第一页
+                if len(results) < per_page:
+                    results = []
+                    current_page = 1
+                    offset = 0
+
+        if not results:
+            # 查询数据
+            cursor.execute(*major_offset_query(conditions, values, per_page, offset))
+            results = cursor.fetchall()
+
+    return total_count, current_page, list(results)
+
 # 院校专业查询页面
 @app.route('/college_major', methods=['GET', 'POST'])
 def college_major():
-    # 会话验证并记录日志
-    login_status = session.get("login", "")
-    logging.info(f"访问college_major，会话状态: login={login_status}, user={session.get('user')}")
-    
-    if login_status != 'OK':
-        logging.info("会话失效，重定向到登录页")
+    # 会话验证（每次访问已计入访问日志与请求指标，这里只在调试级别记录）
+    if session.get("login", "") != 'OK':
+        logging.debug("会话失效，重定向到登录页")
         return redirect('/')
 
     # 获取查询条件和分页参数
     current_page = request.values.get('page', 1, type=int)
-    per_page = 20  # 每页显示数量
+    per_page = MAJOR_PER_PAGE
 
     # 处理GET和POST请求
     if request.method == 'POST':
         # 将POST请求转为带参数的GET请求，便于保持查询条件
-        query_args = {
-            'batch_name_query': request.form.get('batch_name_query', '').strip(),
-            'college_code_query': request.form.get('college_code_query', '').strip(),
-            'college_name_query': request.form.get('college_name_query', '').strip(),
-            'major_code_query': request.form.get('major_code_query', '').strip(),
-            'major_name_query': request.form.get('major_name_query', '').strip(),
-            'subject_requirement_query': request.form.get('subject_requirement_query', '').strip(),
-            'qualification_requirement_query': request.form.get('qualification_requirement_query', '').strip(),
-            'page': current_page
-        }
+        query_args = get_major_filters(request.form)
+        query_args['page'] = current_page
         return redirect(url_for('college_major', **query_args))
-    else:
-        batch_name_query = request.args.get('batch_name_query', '').strip()
-        college_code_query = request.args.get('college_code_query', '').strip()
-        college_name_query = request.args.get('college_name_query', '').strip()
-        major_code_query = request.args.get('major_code_query', '').strip()
-        major_name_query = request.args.get('major_name_query', '').strip()
-        subject_requirement_query = request.args.get('subject_requirement_query', '').strip()
-        qualification_requirement_query = request.args.get('qualification_requirement_query', '').strip()
-
-    # 构建查询条件
-    conditions = []
-    values = []
 
-    if batch_name_query:
-        conditions.append('batch_name LIKE %s')
-        values.append(f'%{batch_name_query}%')
-    if college_code_query:
-        conditions.append('college_code LIKE %s')
-        values.append(f'%{college_code_query}%')
-    if college_name_query:
-        conditions.append('college_name LIKE %s')
-        values.append(f'%{college_name_query}%')
-    if major_code_query:
-        conditions.append('major_code LIKE %s')
-        values.append(f'%{major_code_query}%')
-    if major_name_query:
-        conditions.append('major_name LIKE %s')
-        values.append(f'%{major_name_query}%')
-    if subject_requirement_query:
-        conditions.append('subject_requirement LIKE %s')
-        values.append(f'%{subject_requirement_query}%')
-    if qualification_requirement_query:
-        conditions.append('qualification_requirement LIKE %s')
-        values.append(f'%{qualification_requirement_query}%')
-
-    # 计算总记录数
-    total_count = 0
-    total_pages = 1
-    results = []
-    query_result = "未查询到记录"
+    filters = get_major_filters(request.args)
+    # 键集分页游标：after 为上一页最后一行，before 为下一页第一行
+    after_key = decode_page_cursor(request.args.get('after'))
+    before_key = decode_page_cursor(request.args.get('before')) if not after_key else None
 
     try:
-        with Database() as cursor:
-            count_sql = "SELECT COUNT(*) as count FROM major_infos"
-            if conditions:
-                count_sql += " WHERE " + " AND ".join(conditions)
-
-            cursor.execute(count_sql, tuple(values))
-            result = cursor.fetchone()
-            total_count = result['count'] if result else 0
-            total_pages = max(1, (total_count + per_page - 1) // per_page)
-
-            # 确保页码有效
-            if current_page < 1:
-                current_page = 1
-            if current_page > total_pages:
-                current_page = total_pages if total_pages > 0 else 1
-
-            offset = (current_page - 1) * per_page
-
-            # 查询数据
-            data_sql = "SELECT * FROM major_infos"
-            if conditions:
-                data_sql += " WHERE " + " AND ".join(conditions)
-            data_sql += " ORDER BY batch_name, college_code, major_code LIMIT %s OFFSET %s"
-
-            query_values = values.copy()
-            query_values.extend([per_page, offset])
-
-            cursor.execute(data_sql, tuple(query_values))
-            results = cursor.fetchall()
-
-            if results:
-                query_result = f"共查询到 {total_count} 条记录，显示第 {offset + 1} 到 {min(offset + per_page, total_count)} 条"
-            else:
-                query_result = "未找到符合条件的记录"
-
+        # 同一查询条件与页码的结果直接从缓存读取
+        version = result_cache.data_version()
+        cached = result_cache.get(major_cache_key('page', filters, current_page, per_page), version)
+        if cached:
+            total_count, current_page, results = cached
+        else:
+            total_count, current_page, results = query_major_page(
+                filters, current_page, per_page, after_key, before_key, version)
+            result_cache.set(major_cache_key('page', filters, current_page, per_page),
+                             (total_count, current_page, results), version=version)
     except pymysql.Error as e:
-        query_result = f"查询出错: {str(e)}"
         logging.error(f"查询错误: {e}")
-        results = []
-        total_pages = 1
-        current_page = 1
+        return render_college_major(filters, 0, 1, [], per_page, error=e)
+
+    return render_college_major(filters, total_count, current_page, results, per_page)
+
+# 渲染院校专业查询结果页，同步视图与异步服务模式共用
+def render_college_major(filters, total_count, current_page, results, per_page, error=None):
+    next_cursor = None
+    prev_cursor = None
+    total_pages = max(1, (total_count + per_page - 1) // per_page)
+    offset = (current_page - 1) * per_page
+
+    if error is not None:
+        query_result = f"查询出错: {str(error)}"
+    elif results:
+        if not MAJOR_INDEX_ENABLED:
+            if current_page > 1:
+                prev_cursor = encode_page_cursor(results[0])
+            if current_page < total_pages:
+                next_cursor = encode_page_cursor(results[-1])
+        query_result = f"共查询到 {total_count} 条记录，显示第 {offset + 1} 到 {min(offset + per_page, total_count)} 条"
+    else:
+        query_result = "未找到符合条件的记录"
 
     # 构建分页URL参数
-    pagination_args = {
-        'batch_name_query': batch_name_query,
-        'college_code_query': college_code_query,
-        'college_name_query': college_name_query,
-        'major_code_query': major_code_query,
-        'major_name_query': major_name_query,
-        'subject_requirement_query': subject_requirement_query,
-        'qualification_requirement_query': qualification_requirement_query
-    }
+    pagination_args = filters
 
     return render_template('college_major.html',
                            results=results,
                            query_result=query_result,
                            current_page=current_page,
                            total_pages=total_pages,
-                           batch_name_query=batch_name_query,
                            pagination_args=pagination_args,
-                           college_code_query=college_code_query,
-                           college_name_query=college_name_query,
-                           major_code_query=major_code_query,
-                           major_name_query=major_name_query,
-                           subject_requirement_query=subject_requirement_query,
-                           qualification_requirement_query=qualification_requirement_query,
+                           next_cursor=next_cursor,
+                           prev_cursor=prev_cursor,
                            user_info=session.get('user', '未登录'),
-                           is_admin=session.get('is_admin', False)
+                           is_admin=session.get('is_admin', False),
+                           subject_choices=SUBJECTS,
+                           **filters
                            )
 
-# 导出院校专业数据
-@app.route('/export_college_major', methods=['GET'])
-def export_college_major():
-    """导出院校专业数据为CSV文件，支持中文标题和自动列宽"""
+# JSON 查询接口返回的分面统计列与可选字段
+MAJOR_FACET_COLUMNS = ('batch_name', 'subject_requirement', 'qualification_requirement')
+MAJOR_API_FIELDS = ('id',) + tuple(column for _, column in MAJOR_FILTER_FIELDS)
+MAJOR_API_MAX_PER_PAGE = 100
+
+# 查询一页数据及分面统计，返回 (总记录数, 实际页码, 本页结果, 分面统计)
+def query_major_facets(filters, current_page, per_page):
+    if MAJOR_INDEX_ENABLED:
+        index = get_major_index()
+        matched = search_major_index(index, filters)
+        total_count = len(matched)
+        total_pages = max(1, (total_count + per_page - 1) // per_page)
+        current_page = min(max(current_page, 1), total_pages)
+        offset = (current_page - 1) * per_page
+        return total_count, current_page, index.page(matched, offset, per_page), index.facets(matched, MAJOR_FACET_COLUMNS)
+
+    conditions, values = build_major_conditions(filters)
+    with Database(readonly=True) as cursor:
+        cursor.execute(*major_facet_query(conditions, values))
+        groups = cursor.fetchall()
+        total_count = sum(group['count'] for group in groups)
+        total_pages = max(1, (total_count + per_page - 1) // per_page)
+        current_page = min(max(current_page, 1), total_pages)
+        offset = (current_page - 1) * per_page
+
+        cursor.execute(*major_offset_query(conditions, values, per_page, offset))
+        results = list(cursor.fetchall())
+    return total_count, current_page, results, count_facets(groups, MAJOR_FACET_COLUMNS, count_key='count')
+
+# 按三个分面列的组合分组一次，总数与各分面计数都由此汇总，不必每个分面单独 GROUP BY
+def major_facet_query(conditions, values):
+    facet_list = ', '.join(MAJOR_FACET_COLUMNS)
+    where = " WHERE " + " AND ".join(conditions) if conditions else ""
+    return f"SELECT {facet_list}, COUNT(*) AS count FROM major_infos{where} GROUP BY {facet_list}", tuple(values)
+
+# 院校专业 JSON 查询接口
+@app.route('/api/college_major', methods=['GET'])
+def api_college_major():
+    """按七个查询条件返回一页数据及批次、选科要求、考生资格要求的分面统计
+
+    支持 fields 参数（逗号分隔）只返回指定字段，响应带 ETag，内容未变时返回 304。
+    """
     if session.get("login", "") != 'OK':
-        return redirect('/')
+        return jsonify({'error': '未登录'}), 401
 
-    # 获取查询条件
-    batch_name_query = request.args.get('batch_name_query', '').strip()
-    college_code_query = request.args.get('college_code_query', '').strip()
-    college_name_query = request.args.get('college_name_query', '').strip()
-    major_code_query = request.args.get('major_code_query', '').strip()
-    major_name_query = request.args.get('major_name_query', '').strip()
-    subject_requirement_query = request.args.get('subject_requirement_query', '').strip()
-    qualification_requirement_query = request.args.get('qualification_requirement_query', '').strip()
-
-    # 构建查询条件
-    conditions = []
-    values = []
-
-    if batch_name_query:
-        conditions.append('batch_name LIKE %s')
-        values.append(f'%{batch_name_query}%')
-    if college_code_query:
-        conditions.append('college_code LIKE %s')
-        values.append(f'%{college_code_query}%')
-    if college_name_query:
-        conditions.append('college_name LIKE %s')
-        values.append(f'%{college_name_query}%')
-    if major_code_query:
-        conditions.append('major_code LIKE %s')
-        values.append(f'%{major_code_query}%')
-    if major_name_query:
-        conditions.append('major_name LIKE %s')
-        values.append(f'%{major_name_query}%')
-    if subject_requirement_query:
-        conditions.append('subject_requirement LIKE %s')
-        values.append(f'%{subject_requirement_query}%')
-    if qualification_requirement_query:
-        conditions.append('qualification_requirement LIKE %s')
-        values.append(f'%{qualification_requirement_query}%')
+    try:
+        filters, current_page, per_page, fields = parse_major_api_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
     try:
-        with Database() as cursor:
-            # 查询数据
-            sql = "SELECT * FROM major_infos"
-            if conditions:
-                sql += " WHERE " + " AND ".join(conditions)
-            sql += " ORDER BY batch_name, college_code, major_code"
+        version = result_cache.data_version()
+        cache_key = major_cache_key('api', filters, current_page, per_page)
+        cached = result_cache.get(cache_key, version)
+        if cached:
+            total_count, current_page, results, facets = cached
+        else:
+            total_count, current_page, results, facets = query_major_facets(filters, current_page, per_page)
+            result_cache.set(major_cache_key('api', filters, current_page, per_page),
+                             (total_count, current_page, results, facets), version=version)
+    except pymysql.Error as e:
+        logging.error(f"JSON查询错误: {e}")
+        return jsonify({'error': '数据库操作错误，请稍后再试'}), 500
+
+    return major_api_response(total_count, current_page, per_page, results, facets, fields)
+
+# 解析 JSON 查询接口参数，返回 (查询条件, 页码, 每页条数, 字段列表)，字段不支持时抛出 ValueError
+def parse_major_api_args(args):
+    filters = get_major_filters(args)
+    if args.get('subjects'):
+        # 页面上忽略无法识别的科目，接口直接报错
+        parse_subjects(args.get('subjects'))
+    current_page = args.get('page', 1, type=int)
+    per_page = min(max(args.get('per_page', 20, type=int), 1), MAJOR_API_MAX_PER_PAGE)
+    fields = [field.strip() for field in args.get('fields', '').split(',') if field.strip()]
+    unknown = [field for field in fields if field not in MAJOR_API_FIELDS]
+    if unknown:
+        raise ValueError(f"不支持的字段: {', '.join(unknown)}")
+    return filters, current_page, per_page, fields or list(MAJOR_API_FIELDS)
+
+# 生成 JSON 查询接口响应
+def major_api_response(total_count, current_page, per_page, results, facets, fields):
+    payload = {
+        'total': total_count,
+        'page': current_page,
+        'per_page': per_page,
+        'total_pages': max(1, (total_count + per_page - 1) // per_page),
+        'results': [{field: row.get(field) for field in fields} for row in results],
+        'facets': facets,
+    }
+    body = json.dumps(payload, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
+
+    response = Response(body, mimetype='application/json')
+    response.set_etag(hashlib.sha1(body).hexdigest())
+    # 允许浏览器保存并每次带 If-None-Match 验证
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+# 志愿表批量检查：单份志愿表的条数上限、单次请求的志愿表份数上限（一个班级），数据库模式每条查询的代码对数
+VOLUNTEER_MAX_ENTRIES = int(os.environ.get('VOLUNTEER_MAX_ENTRIES', 120))
+VOLUNTEER_MAX_LISTS = int(os.environ.get('VOLUNTEER_MAX_LISTS', 80))
+VOLUNTEER_LOOKUP_BATCH = 500
+
+# 按 (院校专业组代码, 专业代号) 批量查找的 SQL 语句
+def major_code_lookup_query(keys):
+    placeholders = ', '.join(['(%s, %s)'] * len(keys))
+    sql = f"SELECT * FROM major_infos WHERE (college_code, major_code) IN ({placeholders}) ORDER BY {MAJOR_ORDER_BY}"
+    return sql, tuple(code for key in keys for code in key)
+
+# 批量查找招生计划行，返回 {代码键: [行]}；内存索引模式不访问数据库，否则分批查询
+def lookup_major_codes(keys):
+    keys = sorted(keys)
+    if MAJOR_INDEX_ENABLED:
+        return get_major_index().lookup_codes(keys)
+    matches = {}
+    with Database(readonly=True) as cursor:
+        for start in range(0, len(keys), VOLUNTEER_LOOKUP_BATCH):
+            cursor.execute(*major_code_lookup_query(keys[start:start + VOLUNTEER_LOOKUP_BATCH]))
+            for row in cursor.fetchall():
+                matches.setdefault(code_key(row['college_code'], row['major_code']), []).append(row)
+    return matches
+
+# 志愿表批量检查接口
+@app.route('/api/volunteer_check', methods=['POST'])
+def api_volunteer_check():
+    """按志愿顺序检查志愿表，给出每条志愿对应的招生计划行，标出不存在、选科不符、需指定批次与重复的志愿
+
+    接受一份志愿表 {"subjects": "物理+化学+生物", "entries": [["0101", "01"], ...]}，
+    或一个班级的多份志愿表 {"lists": [{"id": "张三", "subjects": ..., "entries": [...]}, ...]}，
+    所有志愿表的代码合并后一次批量查找。
+    """
+    if session.get("login", "") != 'OK':
+        return jsonify({'error': '未登录'}), 401
+
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({'error': '请提交 JSON 格式的志愿表'}), 400
+    single = 'lists' not in payload
+    raw_lists = [payload] if single else payload['lists']
+    if not isinstance(raw_lists, list) or not raw_lists:
+        return jsonify({'error': 'lists 必须为非空的志愿表列表'}), 400
+    if len(raw_lists) > VOLUNTEER_MAX_LISTS:
+        return jsonify({'error': f'单次最多检查 {VOLUNTEER_MAX_LISTS} 份志愿表'}), 400
+
+    lists = []
+    for number, raw in enumerate(raw_lists, 1):
+        try:
+            lists.append(parse_list(raw, VOLUNTEER_MAX_ENTRIES))
+        except ValueError as e:
+            return jsonify({'error': str(e) if single else f'第 {number} 份志愿表: {e}'}), 400
 
-            cursor.execute(sql, tuple(values))
-            results = cursor.fetchall()
+    try:
+        matches = lookup_major_codes({code_key(college_code, major_code)
+                                      for _, _, entries in lists for college_code, major_code, _ in entries})
+    except pymysql.Error as e:
+        logging.error(f"志愿表检查数据库错误: {e}")
+        return jsonify({'error': '数据库操作错误，请稍后再试'}), 500
+
+    checked = []
+    for list_id, mask, entries in lists:
+        results, counts = check_list(entries, mask, matches, MAJOR_API_FIELDS)
+        checked.append({
+            'id': list_id,
+            'subjects': None if mask is None else format_subjects(mask),
+            'valid': counts[STATUS_OK] == len(entries),
+            'counts': counts,
+            'entries': results,
+        })
+    return jsonify(checked[0] if single else {'lists': checked})
+
+# 从数据库统计名称及热度，重建补全索引
+def load_suggest_index():
+    global suggest_index
+    start = time.perf_counter()
+    version = result_cache.data_version()
+    counts = {}
+    with Database() as cursor:
+        for field, sql in SUGGEST_SQL.items():
+            cursor.execute(sql)
+            counts[field] = [tuple(row.values()) for row in cursor.fetchall()]
+    index = SuggestIndex(counts)
+    index.data_version = version
+    suggest_index = index
+    logging.info(f"名称补全索引已加载: {len(index)} 个名称, 耗时 {time.perf_counter() - start:.2f} 秒")
+    return index
+
+# 获取补全索引，首次使用或数据版本变化时加载
+def get_suggest_index():
+    index = suggest_index
+    if index is None or index.data_version != result_cache.data_version():
+        with suggest_index_lock:
+            if suggest_index is index:
+                load_suggest_index()
+    return suggest_index
+
+# 名称输入补全接口
+@app.route('/api/suggest', methods=['GET'])
+def api_suggest():
+    """按前缀或拼音首字母返回热度最高的名称，field 为 college_name、major_name 或 university"""
+    if session.get("login", "") != 'OK':
+        return jsonify({'error': '未登录'}), 401
 
-        if not results:
-            return "没有可导出的数据", 400
-
-        # 定义中文标题映射
-        header_map = {
-            'batch_name': '批次名称',
-            'college_code': '院校专业组代码',
-            'college_name': '院校专业组名称',
-            'major_code': '专业代号',
-            'major_name': '专业名称',
-            'subject_requirement': '选科要求',
-            'qualification_requirement': '考生资格要求',
-            'enrollment_number': '招生人数',
-            'tuition_fee': '学费',
-            'remarks': '备注'
-        }
-
-        # 创建CSV响应
-        output = StringIO()
-        output.write('\ufeff')  # 添加UTF-8 BOM
-
-        # 获取原始字段名并映射为中文
-        original_fields = list(results[0].keys()) if results else []
-        chinese_fields = [header_map.get(field, field) for field in original_fields]
-
-        # 创建CSV写入器
-        writer = csv.DictWriter(
-            output,
-            fieldnames=original_fields,
-            dialect='excel',
-            quoting=csv.QUOTE_ALL
-        )
+    field = request.args.get('field', 'college_name')
+    if field not in SUGGEST_FIELDS:
+        return jsonify({'error': f'不支持的字段: {field}'}), 400
+    query = request.args.get('q', '').strip()
+    k = max(request.args.get('k', SUGGEST_DEFAULT_K, type=int), 1)
 
-        # 写入中文标题行
-        writer.writerow({field: chinese_fields[i] for i, field in enumerate(original_fields)})
+    try:
+        suggestions = get_suggest_index().suggest(field, query, k) if query else []
+    except pymysql.Error as e:
+        logging.error(f"加载名称补全索引错误: {e}")
+        return jsonify({'error': '数据库操作错误，请稍后再试'}), 500
+
+    response = jsonify({
+        'field': field,
+        'query': query,
+        'suggestions': [{'value': value, 'count': count} for value, count in suggestions],
+    })
+    # 同一前缀在数据更新前结果不变，浏览器短时间内可直接复用
+    response.headers['Cache-Control'] = 'private, max-age=60'
+    return response
 
-        # 写入数据行，处理中文编码
-        for row in results:
-            encoded_row = {}
-            for key, value in row.items():
-                if value is not None:
-                    encoded_row[key] = str(value).encode('utf-8', 'replace').decode('utf-8')
-                else:
-                    encoded_row[key] = ''
-            writer.writerow(encoded_row)
+# 导出CSV的中文标题映射
+EXPORT_HEADER_MAP = {
+    'batch_name': '批次名称',
+    'college_code': '院校专业组代码',
+    'college_name': '院校专业组名称',
+    'major_code': '专业代号',
+    'major_name': '专业名称',
+    'subject_requirement': '选科要求',
+    'qualification_requirement': '考生资格要求',
+    'enrollment_number': '招生人数',
+    'tuition_fee': '学费',
+    'remarks': '备注'
+}
 
+# 每批从服务端游标读取并写出的行数
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 1000))
+
+# 把一批行写成CSV文本块，首块带 UTF-8 BOM 与中文标题行
+def iter_csv_chunks(fields, batches):
+    output = StringIO()
+    writer = csv.writer(output, dialect='excel', quoting=csv.QUOTE_ALL)
+    output.write('\ufeff')  # 添加UTF-8 BOM
+    writer.writerow([EXPORT_HEADER_MAP.get(field, field) for field in fields])
+    for batch in batches:
+        writer.writerows([row[field] for field in fields] for row in batch)
+        yield output.getvalue().encode('utf-8', 'replace')
         output.seek(0)
+        output.truncate(0)
+
+# 通过无缓冲服务端游标分批读取导出数据，内存占用与导出行数无关
+def stream_major_rows(sql, values):
+    with Database(cursorclass=pymysql.cursors.SSDictCursor, readonly=True) as cursor:
+        cursor.execute(sql, values)
+        fields = [column[0] for column in cursor.description]
+        batch = cursor.fetchmany(EXPORT_BATCH_SIZE)
+        if not batch:
+            return
+        yield fields
+        while batch:
+            yield batch
+            batch = cursor.fetchmany(EXPORT_BATCH_SIZE)
+
+# 边输出边收集导出内容，总大小不超过上限时写入结果缓存
+def cache_export_chunks(chunks, key, version):
+    collected = []
+    size = 0
+    for chunk in chunks:
+        if collected is not None:
+            size += len(chunk)
+            if size <= EXPORT_CACHE_MAX_BYTES:
+                collected.append(chunk)
+            else:
+                collected = None
+        yield chunk
+    if collected is not None:
+        result_cache.set(key, b''.join(collected), version=version)
+
+# 从内存索引分批读取导出数据
+def stream_indexed_rows(filters):
+    index = get_major_index()
+    matched = search_major_index(index, filters)
+    if not matched:
+        return
+    yield list(index.columns)
+    for offset in range(0, len(matched), EXPORT_BATCH_SIZE):
+        yield index.page(matched, offset, EXPORT_BATCH_SIZE)
+
+# 导出院校专业数据
+@app.route('/export_college_major', methods=['GET'])
+def export_college_major():
+    """导出院校专业数据为CSV文件，边查询边输出，支持中文标题"""
+    if session.get("login", "") != 'OK':
+        return redirect('/')
+
+    # 获取查询条件
+    filters = get_major_filters(request.args)
+    conditions, values = build_major_conditions(filters)
+
+    try:
+        version = result_cache.data_version()
+        cache_key = major_cache_key('export', filters)
+        body = result_cache.get(cache_key, version)
+        source = 'cache'
+        if body is None:
+            source = 'query'
+            if MAJOR_INDEX_ENABLED:
+                rows = stream_indexed_rows(filters)
+            else:
+                # 查询数据
+                sql = "SELECT * FROM major_infos"
+                if conditions:
+                    sql += " WHERE " + " AND ".join(conditions)
+                sql += f" ORDER BY {MAJOR_ORDER_BY}"
+                rows = stream_major_rows(sql, tuple(values))
+
+            # 先取出字段名，确认有数据后再开始响应
+            fields = next(rows, None)
+            if fields is None:
+                return "没有可导出的数据", 400
+            body = cache_export_chunks(iter_csv_chunks(fields, rows), cache_key, version)
+        if METRICS_ENABLED:
+            body = metrics.count_export(body, source)
 
         # 设置响应头
         today = datetime.now().strftime('%Y%m%d')
@@ -402,11 +1213,12 @@ def export_college_major():
         content_disposition = f'attachment; filename*=UTF-8\'\'{encoded_filename}'
 
         response = Response(
-            output,
+            body,
             mimetype='text/csv',  # 移除charset=utf-8
             headers={
                 'Content-Disposition': content_disposition,
-                'Content-Type': 'text/csv'  # 移除charset=utf-8
+                'Content-Type': 'text/csv',  # 移除charset=utf-8
+                'X-Accel-Buffering': 'no'  # 禁止反向代理缓冲，分块即时下发
             }
         )
 
@@ -425,7 +1237,7 @@ def admin_dashboard():
 
     users = []
     try:
-        with Database() as cursor:
+        with Database(readonly=True) as cursor:
             cursor.execute("SELECT id, admin_name FROM admins ORDER BY id")
             users = cursor.fetchall()
     except pymysql.Error as e:
@@ -472,6 +1284,7 @@ def add_user():
                 (username, password)
             )
             flash(f"用户 '{username}' 添加成功", "success")
+            remember_primary_write()
 
     except pymysql.Error as e:
         logging.error(f"添加用户错误: {e}")
@@ -517,6 +1330,7 @@ def edit_user(user_id):
                 (new_username, user_id)
             )
             flash(f"用户 '{user['admin_name']}' 已更新为 '{new_username}'", "success")
+            remember_primary_write()
 
     except pymysql.Error as e:
         logging.error(f"修改用户错误: {e}")
@@ -558,6 +1372,7 @@ def change_password(user_id):
                 (new_password, user_id)
             )
             flash(f"用户 '{user['admin_name']}' 的密码已更新", "success")
+            remember_primary_write()
 
     except pymysql.Error as e:
         logging.error(f"修改密码错误: {e}")
@@ -577,18 +1392,18 @@ def delete_user(user_id):
             cursor.execute("SELECT admin_name FROM admins WHERE id=%s", (user_id,))
             user = cursor.fetchone()
 
-        if not user:
-            flash("用户不存在", "danger")
-            return redirect(url_for('admin_dashboard'))
+            if not user:
+                flash("用户不存在", "danger")
+                return redirect(url_for('admin_dashboard'))
 
-        # 防止删除当前登录用户
-        if user['admin_name'] == session.get('user'):
-            flash("不能删除当前登录的用户", "warning")
-            return redirect(url_for('admin_dashboard'))
+            # 防止删除当前登录用户
+            if user['admin_name'] == session.get('user'):
+                flash("不能删除当前登录的用户", "warning")
+                return redirect(url_for('admin_dashboard'))
 
-        with Database() as cursor:
             cursor.execute("DELETE FROM admins WHERE id=%s", (user_id,))
             flash(f"用户 '{user['admin_name']}' 已删除", "success")
+            remember_primary_write()
 
     except pymysql.Error as e:
         logging.error(f"删除用户错误: {e}")
@@ -596,68 +1411,328 @@ def delete_user(user_id):
 
     return redirect(url_for('admin_dashboard'))
 
+# 数据库连接池统计
+@app.route('/admin/db_pool_stats', methods=['GET'])
+def db_pool_stats():
+    """返回连接池统计信息，配置了只读副本时附带各副本的状态"""
+    if not (session.get("login") == 'OK' and session.get('is_admin', False)):
+        return redirect('/')
+    stats = db_pool.stats()
+    if replica_set is not None:
+        stats['replica_set'] = replica_set.stats()
+    return jsonify(stats)
+
+# Prometheus 指标抓取接口：管理员会话、METRICS_TOKEN，或开启 METRICS_ALLOW_LOCAL 时的本机请求可访问
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """以 Prometheus 文本格式返回请求、数据库与导出指标"""
+    authorized = session.get("login") == 'OK' and session.get('is_admin', False)
+    if METRICS_TOKEN:
+        authorized = authorized or hmac.compare_digest(request.headers.get('Authorization', ''),
+                                                       f'Bearer {METRICS_TOKEN}')
+    if METRICS_ALLOW_LOCAL:
+        authorized = authorized or request.remote_addr in ('127.0.0.1', '::1')
+    if not authorized:
+        return Response('forbidden\n', status=403, mimetype='text/plain')
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# SQL 分析页面：最慢的语句形状、慢查询采样（含 EXPLAIN）与最近的请求跟踪
+@app.route('/admin/sql_profile', methods=['GET'])
+def sql_profile():
+    """SQL 分析结果，只包含处理本次请求的 worker 的数据"""
+    if not (session.get("login") == 'OK' and session.get('is_admin', False)):
+        return redirect('/')
+    sort = request.args.get('sort', 'total')
+    if sql_profiler is None:
+        return render_template('admin_sql_profile.html', enabled=False, sort=sort, user_info=session.get('user'))
+    return render_template(
+        'admin_sql_profile.html',
+        enabled=True,
+        sort=sort,
+        slow_ms=sql_profiler.slow_ms,
+        window_minutes=sql_profiler.window_minutes,
+        shapes=sql_profiler.top_shapes(SQL_PROFILE_TOP_N, sort),
+        samples=sql_profiler.slow_samples(),
+        traces=sql_profiler.recent_traces(),
+        user_info=session.get('user')
+    )
+
+# 单个请求的 SQL 跟踪（编号见响应头 X-SQL-Trace-Id）
+@app.route('/admin/sql_profile/trace/<trace_id>', methods=['GET'])
+def sql_profile_trace(trace_id):
+    """返回一个请求执行的全部语句"""
+    if not (session.get("login") == 'OK' and session.get('is_admin', False)):
+        return redirect('/')
+    trace = sql_profiler.trace(trace_id) if sql_profiler is not None else None
+    if trace is None:
+        return jsonify({'error': '跟踪不存在或已过期'}), 404
+    return jsonify(trace)
+
+# 重新加载专业内存索引（major_infos 数据更新后调用）
+@app.route('/admin/reload_major_index', methods=['POST'])
+def reload_major_index():
+    """重新加载专业索引"""
+    if not (session.get("login") == 'OK' and session.get('is_admin', False)):
+        return redirect('/')
+
+    try:
+        if MAJOR_INDEX_ENABLED:
+            with major_index_lock:
+                # 快照模式先发布新快照，其他 worker 发现文件被替换后自动切换
+                if MAJOR_SNAPSHOT_PATH:
+                    write_major_snapshot(MAJOR_SNAPSHOT_PATH)
+                index = load_major_index(bump=True)
+            flash(f"专业索引已重新加载，共 {len(index)} 条记录", "success")
+        else:
+            result_cache.bump_version()
+            flash("查询缓存已清空", "success")
+    except pymysql.Error as e:
+        logging.error(f"重新加载专业索引错误: {e}")
+        flash("重新加载专业索引失败", "danger")
+
+    return redirect(url_for('admin_dashboard'))
+
+# 重新加载成绩排名索引（导入成绩后调用）
+@app.route('/admin/reload_score_rank', methods=['POST'])
+def reload_score_rank():
+    """重新加载成绩排名索引"""
+    if not (session.get("login") == 'OK' and session.get('is_admin', False)):
+        return redirect('/')
+
+    try:
+        with rank_engine_lock:
+            engine = load_rank_engine()
+        flash(f"成绩排名索引与分数分布已重新加载，共 {len(engine)} 条有效成绩", "success")
+    except pymysql.Error as e:
+        logging.error(f"重新加载成绩排名索引错误: {e}")
+        flash("重新加载成绩排名索引失败", "danger")
+
+    return redirect(url_for('admin_dashboard'))
+
+# 重新加载问答检索索引（build_qa_index.py 生成新索引后调用）
+@app.route('/admin/reload_qa_index', methods=['POST'])
+def reload_qa_index():
+    """重新打开问答索引文件"""
+    if not (session.get("login") == 'OK' and session.get('is_admin', False)):
+        return redirect('/')
+
+    try:
+        with qa_index_lock:
+            index = load_qa_index()
+        flash(f"问答索引已重新加载，共 {len(index)} 条回答", "success")
+    except (OSError, ValueError) as e:
+        logging.error(f"重新加载问答索引错误: {e}")
+        flash("重新加载问答索引失败，请先运行 build_qa_index.py 生成索引", "danger")
+
+    return redirect(url_for('admin_dashboard'))
+
+# 访问日志写入统计
+@app.route('/admin/access_log_stats', methods=['GET'])
+def access_log_stats():
+    """返回访问日志队列、写入与丢弃统计"""
+    if not (session.get("login") == 'OK' and session.get('is_admin', False)):
+        return redirect('/')
+    return jsonify(access_log_writer.stats())
+
+# 准入控制统计
+@app.route('/admin/admission_stats', methods=['GET'])
+def admission_stats():
+    """返回各路由的并发名额、排队与拒绝统计"""
+    if not (session.get("login") == 'OK' and session.get('is_admin', False)):
+        return redirect('/')
+    if admission is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(admission.stats(), enabled=True))
+
+# 访问统计页面：只读取汇总表，不扫描 access_logs
+@app.route('/admin/traffic', methods=['GET'])
+def admin_traffic():
+    """各路由的请求数、错误率与耗时分位数，以及请求量时间线"""
+    if not (session.get("login") == 'OK' and session.get('is_admin', False)):
+        return redirect('/')
+    selected = request.args.get('range', '24h')
+    if selected not in TRAFFIC_RANGES:
+        selected = '24h'
+    hours, granularity = TRAFFIC_RANGES[selected]
+    since = datetime.now() - timedelta(hours=hours)
+    report = None
+    try:
+        report = access_log_rollup.report(granularity, since)
+    except pymysql.Error as e:
+        logging.error(f"读取访问统计错误: {e}")
+        flash("读取访问统计失败，请确认已执行 migrate.py up", "danger")
+    return render_template('admin_traffic.html', report=report, ranges=list(TRAFFIC_RANGES), selected=selected,
+                           rollup_stats=access_log_rollup.stats(), user_info=session.get('user'))
+
+# 立即汇总访问日志（不必等待定时任务）
+@app.route('/admin/access_log_rollup/run', methods=['POST'])
+def run_access_log_rollup():
+    """汇总新增的访问日志"""
+    if not (session.get("login") == 'OK' and session.get('is_admin', False)):
+        return redirect('/')
+
+    try:
+        count = access_log_rollup.run()
+        flash(f"访问日志已汇总，本次处理 {count} 条", "success")
+    except pymysql.Error as e:
+        logging.error(f"汇总访问日志错误: {e}")
+        flash("汇总访问日志失败", "danger")
+
+    return redirect(url_for('admin_traffic'))
+
+# 查询结果缓存统计
+@app.route('/admin/cache_stats', methods=['GET'])
+def cache_stats():
+    """返回结果缓存命中、未命中与淘汰统计"""
+    if not (session.get("login") == 'OK' and session.get('is_admin', False)):
+        return redirect('/')
+    return jsonify(result_cache.stats())
+
+# 模板及其继承、包含的模板文件中最晚的修改时间
+def template_mtime(name):
+    env = app.jinja_env
+    source, filename, _ = env.loader.get_source(env, name)
+    mtime = os.path.getmtime(filename) if filename else time.time()
+    for referenced in meta.find_referenced_templates(env.parse(source)):
+        if referenced:
+            mtime = max(mtime, template_mtime(referenced))
+    return mtime
+
+# 渲染内容与数据无关的页面：同一模板与上下文只渲染一次，
+# 响应带强 ETag 与 Last-Modified，浏览器验证未变化时返回 304
+def render_cached_page(template, **context):
+    key = ResultCache.make_key('page', template, context)
+    cached = page_cache.get(key)
+    if cached is None:
+        body = render_template(template, **context).encode('utf-8')
+        cached = (body, hashlib.sha1(body).hexdigest(), int(template_mtime(template)))
+        page_cache.set(key, cached)
+    body, etag, last_modified = cached
+
+    response = Response(body, mimetype='text/html')
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    # 页面带有用户名，只允许浏览器私有缓存，每次使用前验证
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
 # 其他页面路由
 @app.route('/college_query', methods=['GET', 'POST'])
 def college_query():
     if session.get("login", "") != 'OK':
         return redirect('/')
-    return render_template('college_query.html', user_info=session.get('user'))
+    return render_cached_page('college_query.html', user_info=session.get('user'))
 
 @app.route('/skill_college_score')
 def skill_college_score():
     if session.get("login", "") != 'OK':
         return redirect('/')
-    return render_template('skill_college_score.html', user_info=session.get('user'))
+    return render_cached_page('skill_college_score.html', user_info=session.get('user'))
 
 @app.route('/hbea_embed')
 def hbea_embed():
-    return render_template('hbea_embed.html')
+    return render_cached_page('hbea_embed.html')
 
 @app.route('/hubei_education_embed')
 def hubei_education_embed():
-    return render_template('hubei_education_embed.html')
+    return render_cached_page('hubei_education_embed.html')
 
 @app.route('/hubei_zwfw_embed')
 def hubei_zwfw_embed():
-    return render_template('hubei_zwfw_embed.html')
+    return render_cached_page('hubei_zwfw_embed.html')
 
 @app.route('/chaxun')
 def chaxun():
-    return render_template('chaxun.html')
+    return render_cached_page('chaxun.html')
 
 @app.route('/hbksw_embed_new')
 def hbksw_embed_new():
-    return render_template('hbksw_embed_new.html')
+    return render_cached_page('hbksw_embed_new.html')
 
 @app.route('/hbccks_embed')
 def hbccks_embed():
-    return render_template('hbccks_embed.html')
+    return render_cached_page('hbccks_embed.html')
 
 @app.route('/skill_college_1')
 def skill_college_1():
     if session.get("login", "") != 'OK':
         return redirect('/')
-    return render_template('skill_college_1.html', user_info=session.get('user'))
+    return render_cached_page('skill_college_1.html', user_info=session.get('user'))
 
 @app.route('/hbksw_embed')
 def hbksw_embed():
     if session.get("login", "") != 'OK':
         return redirect('/')
-    return render_template('hbksw_embed.html', user_info=session.get('user'))
+    return render_cached_page('hbksw_embed.html', user_info=session.get('user'))
 
 @app.route('/skill_college_2')
 def skill_college_2():
     if session.get("login", "") != 'OK':
         return redirect('/')
-    return render_template('skill_college_2.html', user_info=session.get('user'))
+    return render_cached_page('skill_college_2.html', user_info=session.get('user'))
 
 @app.route('/skill_college_3')
 def skill_college_3():
     if session.get("login", "") != 'OK':
         return redirect('/')
-    return render_template('skill_college_3.html', user_info=session.get('user'))
-
-
+    return render_cached_page('skill_college_3.html', user_info=session.get('user'))
+
+
+
+# 用同一批成绩行生成排名索引与分数分布，fingerprint 为读取成绩前的成绩表指纹
+def install_score_data(rows, fingerprint):
+    global rank_engine, score_distribution
+    engine = RankEngine(rows)
+    distribution = ScoreDistribution(rows, segment=SCORE_SEGMENT, bin_width=SCORE_HISTOGRAM_BIN)
+    # 接口响应只序列化一次
+    distribution.body = json.dumps(distribution.to_dict(), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    distribution.etag = hashlib.sha1(distribution.body).hexdigest()
+    engine.fingerprint = fingerprint
+    engine.checked_at = time.monotonic()
+    score_distribution = distribution
+    rank_engine = engine
+    logging.info(f"成绩排名索引与分数分布已加载: {len(rows)} 条记录")
+    return engine
+
+# 从 score_table 重建成绩排名索引与分数分布
+def load_rank_engine():
+    with Database() as cursor:
+        cursor.execute(SCORE_FINGERPRINT_SQL)
+        fingerprint = tuple(cursor.fetchone().values())
+        cursor.execute(RANK_ENGINE_SQL)
+        rows = cursor.fetchall()
+    return install_score_data(rows, fingerprint)
+
+# 是否需要（重新）检查成绩表：尚未加载，或距上次检查已超过 SCORE_CHECK_INTERVAL 秒
+def rank_engine_due():
+    engine = rank_engine
+    if engine is None:
+        return True
+    return SCORE_CHECK_INTERVAL > 0 and time.monotonic() - engine.checked_at >= SCORE_CHECK_INTERVAL
+
+# 获取成绩排名索引，首次使用时加载，之后定期比对成绩表指纹，成绩变化时重新加载
+def get_rank_engine():
+    if rank_engine_due():
+        with rank_engine_lock:
+            if rank_engine_due():
+                refresh_rank_engine()
+    return rank_engine
+
+def refresh_rank_engine():
+    if rank_engine is not None:
+        with Database() as cursor:
+            cursor.execute(SCORE_FINGERPRINT_SQL)
+            fingerprint = tuple(cursor.fetchone().values())
+        if fingerprint == rank_engine.fingerprint:
+            rank_engine.checked_at = time.monotonic()
+            return rank_engine
+        logging.info("成绩表已变更，重新加载成绩排名索引与分数分布")
+    return load_rank_engine()
+
+# 获取分数分布，与排名索引同时加载与失效
+def get_score_distribution():
+    get_rank_engine()
+    return score_distribution
 
 @app.route('/score_rank', methods=['GET', 'POST'])
 def score_rank():
@@ -668,21 +1743,10 @@ def score_rank():
         if not name:
             return render_template('score_rank.html', msg='请输入姓名')
         try:
-            with Database() as cursor:
-                # 查询总分大于该用户的人数
-                sql = "SELECT COUNT(*) as score_rank FROM score_table WHERE total_score > (SELECT total_score FROM score_table WHERE name = %s)" 
-                cursor.execute(sql, (name,))
-                result = cursor.fetchone()
-                rank = result['score_rank'] + 1 if result else 1
-                # 查询该用户总分
-                sql = "SELECT theory_score, practical_score, cultural_score, total_score FROM score_table WHERE name = %s" 
-                cursor.execute(sql, (name,))
-                result = cursor.fetchone()
-                theory_score = result['theory_score'] if result else 0
-                practical_score = result['practical_score'] if result else 0
-                cultural_score = result['cultural_score'] if result else 0
-                total_score = result['total_score'] if result else 0
-                return render_template('score_rank.html', name=name, rank=rank, theory_score=theory_score, practical_score=practical_score, cultural_score=cultural_score, total_score=total_score)
+            records = get_rank_engine().lookup(name)
+            if not records:
+                return render_template('score_rank.html', msg=f'未找到考生 {name} 的成绩')
+            return render_template('score_rank.html', name=name, records=records)
         except pymysql.Error as e:
             msg = '数据库操作错误，请稍后再试'
             logging.error(f"成绩排名查询数据库错误: {e}")
@@ -693,11 +1757,149 @@ def score_rank():
         msg = ''
     return render_template('score_rank.html', msg=msg)
 
+# 分数分布页面：一分一段表与各项成绩分布图（图表数据来自 /api/score_distribution）
+@app.route('/score_distribution', methods=['GET'])
+def score_distribution_page():
+    if session.get('login') != 'OK':
+        return redirect('/')
+    try:
+        distribution = get_score_distribution()
+    except pymysql.Error as e:
+        logging.error(f"分数分布加载数据库错误: {e}")
+        return render_template('score_distribution.html', msg='数据库操作错误，请稍后再试')
+    return render_template('score_distribution.html', distribution=distribution,
+                           user_info=session.get('user', '未登录'))
+
+# 分数分布 JSON 接口
+@app.route('/api/score_distribution', methods=['GET'])
+def api_score_distribution():
+    """返回总分一分一段表（segments）、各项成绩直方图（histograms）与汇总统计（summary）
+
+    数据随排名索引在内存中预先计算并序列化，请求不执行聚合查询；带 ETag，成绩未变时返回 304。
+    """
+    if session.get('login') != 'OK':
+        return jsonify({'error': '未登录'}), 401
+    try:
+        distribution = get_score_distribution()
+    except pymysql.Error as e:
+        logging.error(f"分数分布加载数据库错误: {e}")
+        return jsonify({'error': '数据库操作错误，请稍后再试'}), 500
+
+    response = Response(distribution.body, mimetype='application/json')
+    response.set_etag(distribution.etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+# 批量查询成绩排名
+@app.route('/score_rank/batch', methods=['POST'])
+def score_rank_batch():
+    """一次查询多名考生的排名，接受 JSON {"names": [...]} 或表单 names（换行或逗号分隔）"""
+    if session.get('login') != 'OK':
+        return jsonify({'error': '未登录'}), 401
+
+    payload = request.get_json(silent=True)
+    if payload is not None:
+        names = payload.get('names') if isinstance(payload, dict) else None
+        if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+            return jsonify({'error': 'names 必须为姓名字符串列表'}), 400
+    else:
+        names = re.split(r'[\r\n,，]+', request.form.get('names', ''))
+    # 去除空白与重复姓名，保持提交顺序
+    names = list(dict.fromkeys(name.strip() for name in names if name.strip()))
+
+    if not names:
+        return jsonify({'error': '请输入姓名'}), 400
+    if len(names) > SCORE_RANK_BATCH_LIMIT:
+        return jsonify({'error': f'单次最多查询 {SCORE_RANK_BATCH_LIMIT} 个姓名'}), 400
+
+    try:
+        engine = get_rank_engine()
+    except pymysql.Error as e:
+        logging.error(f"批量成绩排名查询数据库错误: {e}")
+        return jsonify({'error': '数据库操作错误，请稍后再试'}), 500
+
+    results = []
+    for name in names:
+        records = engine.lookup(name)
+        results.append({'name': name, 'found': bool(records), 'records': records})
+    return jsonify({'total': len(engine), 'results': results})
+
+# 打开问答索引文件；旧索引不主动关闭，正在进行的查询结束后随引用释放
+def load_qa_index():
+    global qa_index
+    index = QAIndex(QA_INDEX_PATH)
+    qa_index = index
+    logging.info(f"问答索引已加载: {len(index)} 条回答, {index.terms} 个词")
+    return index
+
+if os.path.exists(QA_INDEX_PATH):
+    try:
+        load_qa_index()
+    except (OSError, ValueError) as e:
+        logging.error(f"问答索引加载失败: {e}")
+else:
+    logging.info(f"未找到问答索引 {QA_INDEX_PATH}，运行 python build_qa_index.py 生成")
+
+# 解析问答检索参数，返回 (查询词, 大学, 条数)
+def get_qa_search_args(source):
+    query = source.get('q', '').strip()
+    university = source.get('university', '').strip() or None
+    k = min(max(source.get('k', QA_SEARCH_DEFAULT_K, type=int), 1), QA_SEARCH_MAX_K)
+    return query, university, k
+
+# 院校问答检索页面
+@app.route('/qa_search', methods=['GET'])
+def qa_search():
+    if session.get("login", "") != 'OK':
+        return redirect('/')
+    query, university, k = get_qa_search_args(request.args)
+    index = qa_index
+    results, total, msg = [], 0, ''
+    if index is None:
+        msg = '问答检索暂不可用，请联系管理员生成索引'
+    elif query:
+        start = time.perf_counter()
+        results, total = index.search(query, university, k)
+        elapsed = (time.perf_counter() - start) * 1000
+        if university and index.university_index(university) is None:
+            msg = f'未找到大学 {university}'
+        elif results:
+            msg = f'共 {total} 条回答相关，显示前 {len(results)} 条（{elapsed:.1f} 毫秒）'
+        else:
+            msg = '未找到相关回答'
+    return render_template('qa_search.html', q=query, university=university or '', results=results,
+                           msg=msg, universities=index.universities() if index else [],
+                           user_info=session.get('user'))
+
+# 院校问答检索 JSON 接口
+@app.route('/api/qa_search', methods=['GET'])
+def api_qa_search():
+    """按查询词返回 BM25 得分最高的 k 条回答，可用 university（id 或名称）限定大学"""
+    if session.get("login", "") != 'OK':
+        return jsonify({'error': '未登录'}), 401
+    query, university, k = get_qa_search_args(request.args)
+    if not query:
+        return jsonify({'error': '请输入查询词'}), 400
+    index = qa_index
+    if index is None:
+        return jsonify({'error': '问答索引尚未生成'}), 503
+    if university and index.university_index(university) is None:
+        return jsonify({'error': f'未找到大学 {university}'}), 404
+    start = time.perf_counter()
+    results, total = index.search(query, university, k)
+    return jsonify({
+        'query': query,
+        'university': university,
+        'total': total,
+        'took_ms': round((time.perf_counter() - start) * 1000, 3),
+        'results': results,
+    })
+
 @app.route('/skill_college_4')
 def skill_college_4():
     if session.get("login", "") != 'OK':
         return redirect('/')
-    return render_template('skill_college_4.html', user_info=session.get('user'))
+    return render_cached_page('skill_college_4.html', user_info=session.get('user'))
 
 # 主程序入口
 if __name__ == "__main__":
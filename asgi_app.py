@@ -0,0 +1,448 @@
+"""异步服务模式（ASGI）
+
+    uvicorn asgi_app:application --host 0.0.0.0 --port 8000 --workers 2
+
+college_major、/api/college_major 与 score_rank 在事件循环中处理，
+通过 aiomysql 异步连接池访问数据库，COUNT 与分页查询并发执行；
+其余路由（管理后台、导出等）交给原 Flask 应用在线程池中运行。
+会话、模板与结果缓存与 app.py 共用，两种模式渲染的页面一致。
+"""
+import asyncio
+import io
+import logging
+import os
+import sys
+import threading
+import time
+
+try:
+    import aiomysql
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError:
+    raise SystemExit("异步服务模式需要安装 aiomysql、asgiref 与 ASGI 服务器：pip install aiomysql asgiref uvicorn")
+
+import pymysql
+from flask import g, request, session, jsonify
+
+from admission import Rejected
+import app as webapp
+from app import (
+    DB_CONFIG, DB_POOL_CONFIG, MAJOR_FACET_COLUMNS, MAJOR_INDEX_ENABLED, METRICS_ENABLED,
+    MAJOR_PER_PAGE, RANK_ENGINE_SQL, SCORE_FINGERPRINT_SQL, build_major_conditions, count_facets, decode_page_cursor,
+    get_major_filters, major_api_response, major_cache_key, major_count_query, major_facet_query,
+    major_offset_query, major_seek_query, metrics, parse_major_api_args, render_college_major, result_cache,
+    sql_profiler,
+)
+
+# 异步连接池配置：一个事件循环可同时等待多条查询，上限通常比同步连接池大
+ASYNC_DB_POOL_CONFIG = {
+    'minsize': int(os.environ.get('ASYNC_DB_POOL_MIN', 1)),
+    'maxsize': int(os.environ.get('ASYNC_DB_POOL_MAX', 20)),
+    'pool_recycle': DB_POOL_CONFIG['max_age'],
+}
+# aiomysql 的库名参数为 db，游标类使用 aiomysql 自己的 DictCursor
+ASYNC_DB_CONFIG = {key: value for key, value in DB_CONFIG.items() if key not in ('database', 'cursorclass')}
+ASYNC_DB_CONFIG['db'] = DB_CONFIG['database']
+
+db_pool = None
+rank_engine_lock = None
+
+
+# 回退路由由 asgiref 在同一个线程中依次运行，准入控制名额用满时直接拒绝，不在该线程中排队；
+# asgiref 不调用响应的 close()，这里在输出结束（或客户端断开）后关闭，释放并发名额
+def fallback_wsgi(environ, start_response):
+    environ['ziyuan.no_wait'] = True
+    response = webapp.app(environ, start_response)
+    try:
+        yield from response
+    finally:
+        if hasattr(response, 'close'):
+            response.close()
+
+
+wsgi_application = WsgiToAsgi(fallback_wsgi)
+
+# 并发统计：每个 worker 进程各自计数
+_stats_lock = threading.Lock()
+_stats = {'requests': 0, 'in_flight': 0, 'peak_in_flight': 0, 'queries': 0, 'fallback': 0}
+
+
+def _count(name, n=1):
+    with _stats_lock:
+        _stats[name] += n
+        if name == 'in_flight' and _stats['in_flight'] > _stats['peak_in_flight']:
+            _stats['peak_in_flight'] = _stats['in_flight']
+
+
+async def open_pool():
+    global db_pool, rank_engine_lock
+    pool = await aiomysql.create_pool(
+        autocommit=True, cursorclass=aiomysql.DictCursor, **ASYNC_DB_CONFIG, **ASYNC_DB_POOL_CONFIG)
+    if db_pool is not None:
+        # 并发的首批请求可能同时创建，保留先完成的一个
+        pool.close()
+        await pool.wait_closed()
+        return
+    db_pool = pool
+    # 锁需在事件循环内创建
+    rank_engine_lock = asyncio.Lock()
+    logging.info(f"异步连接池已创建: {ASYNC_DB_POOL_CONFIG['minsize']}-{ASYNC_DB_POOL_CONFIG['maxsize']} 个连接")
+
+
+async def close_pool():
+    global db_pool
+    if db_pool is not None:
+        db_pool.close()
+        await db_pool.wait_closed()
+        db_pool = None
+
+
+class AsyncDatabase:
+    """从异步连接池借出连接，用法与 Database 相同：async with AsyncDatabase() as cursor
+
+    只用于只读查询，连接开启 autocommit，无需提交或回滚。
+    """
+
+    def __init__(self):
+        self.connection = None
+        self.cursor = None
+
+    async def __aenter__(self):
+        try:
+            self.connection = await db_pool.acquire()
+            self.cursor = await self.connection.cursor()
+            return self.cursor
+        except pymysql.Error as e:
+            if self.connection:
+                self.connection.close()
+                db_pool.release(self.connection)
+                self.connection = None
+            logging.error(f"数据库连接错误: {e}")
+            raise
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if exc_type and exc_type is not asyncio.CancelledError:
+            logging.error(f"数据库操作错误: {exc_val}")
+        try:
+            if self.cursor:
+                await self.cursor.close()
+        finally:
+            if self.connection:
+                # 出错或被取消的连接可能还有未读完的结果，关闭后归还，连接池会丢弃它
+                if exc_type:
+                    self.connection.close()
+                db_pool.release(self.connection)
+
+
+async def fetch_all(sql, params):
+    async with AsyncDatabase() as cursor:
+        _count('queries')
+        start = time.perf_counter()
+        await cursor.execute(sql, params)
+        rows = list(await cursor.fetchall())
+        elapsed = time.perf_counter() - start
+        if METRICS_ENABLED:
+            metrics.record_query(elapsed)
+        if sql_profiler is not None:
+            sql_profiler.record(sql, params, len(rows), elapsed)
+        return rows
+
+
+# 按选考科目筛选时，选科要求组合首次加载（或数据版本变化后重新加载）需要查询数据库，放到线程中执行
+async def load_subject_requirements(filters):
+    if filters.get('subjects'):
+        await asyncio.to_thread(webapp.get_subject_requirements)
+
+
+# 查询一页院校专业数据，与 app.query_major_page 结果相同
+# 总记录数未缓存时，按请求的页码先行读取数据，与 COUNT 在两个连接上并发执行
+async def query_major_page(filters, current_page, per_page, after_key=None, before_key=None, version=None):
+    if MAJOR_INDEX_ENABLED:
+        # 内存索引模式不访问数据库，只有加载快照时较慢，放到线程中执行以免阻塞事件循环
+        return await asyncio.to_thread(
+            webapp.query_major_page, filters, current_page, per_page, after_key, before_key, version)
+
+    await load_subject_requirements(filters)
+    conditions, values = build_major_conditions(filters)
+    count_key = major_cache_key('count', filters)
+    total_count = result_cache.get(count_key, version)
+    current_page = max(current_page, 1)
+    if total_count is not None:
+        current_page = min(current_page, max(1, (total_count + per_page - 1) // per_page))
+    offset = (current_page - 1) * per_page
+
+    keyset = after_key or before_key
+    if keyset:
+        page_query = major_seek_query(conditions, values, keyset, bool(after_key), per_page)
+    else:
+        page_query = major_offset_query(conditions, values, per_page, offset)
+    if total_count is None:
+        results, counted = await asyncio.gather(
+            fetch_all(*page_query), fetch_all(*major_count_query(conditions, values)))
+        total_count = counted[0]['count'] if counted else 0
+        result_cache.set(count_key, total_count, version=version)
+    else:
+        results = await fetch_all(*page_query)
+
+    # 请求的页码超出范围时回到最后一页
+    total_pages = max(1, (total_count + per_page - 1) // per_page)
+    stale = False
+    if current_page > total_pages:
+        current_page = total_pages
+        offset = (current_page - 1) * per_page
+        stale = True
+    if before_key:
+        results.reverse()
+        # 向前翻到头时不足一页，回到第一页
+        if len(results) < per_page:
+            results = []
+            current_page = 1
+            offset = 0
+    if (keyset and not results) or (stale and not keyset):
+        results = await fetch_all(*major_offset_query(conditions, values, per_page, offset))
+    return total_count, current_page, results
+
+
+# 查询一页数据及分面统计，与 app.query_major_facets 结果相同，GROUP BY 与分页查询并发执行
+async def query_major_facets(filters, current_page, per_page):
+    if MAJOR_INDEX_ENABLED:
+        return await asyncio.to_thread(webapp.query_major_facets, filters, current_page, per_page)
+
+    await load_subject_requirements(filters)
+    conditions, values = build_major_conditions(filters)
+    current_page = max(current_page, 1)
+    groups, results = await asyncio.gather(
+        fetch_all(*major_facet_query(conditions, values)),
+        fetch_all(*major_offset_query(conditions, values, per_page, (current_page - 1) * per_page)))
+    total_count = sum(group['count'] for group in groups)
+    total_pages = max(1, (total_count + per_page - 1) // per_page)
+    if current_page > total_pages:
+        current_page = total_pages
+        results = await fetch_all(*major_offset_query(conditions, values, per_page, (current_page - 1) * per_page))
+    return total_count, current_page, results, count_facets(groups, MAJOR_FACET_COLUMNS, count_key='count')
+
+
+async def college_major():
+    # 未登录与 POST 表单提交只做重定向，不访问数据库，直接交给同步视图
+    if session.get('login') != 'OK' or request.method == 'POST':
+        return webapp.college_major()
+
+    current_page = request.values.get('page', 1, type=int)
+    per_page = MAJOR_PER_PAGE
+    filters = get_major_filters(request.args)
+    after_key = decode_page_cursor(request.args.get('after'))
+    before_key = decode_page_cursor(request.args.get('before')) if not after_key else None
+
+    try:
+        version = result_cache.data_version()
+        cached = result_cache.get(major_cache_key('page', filters, current_page, per_page), version)
+        if cached:
+            total_count, current_page, results = cached
+        else:
+            total_count, current_page, results = await query_major_page(
+                filters, current_page, per_page, after_key, before_key, version)
+            result_cache.set(major_cache_key('page', filters, current_page, per_page),
+                             (total_count, current_page, results), version=version)
+    except pymysql.Error as e:
+        logging.error(f"查询错误: {e}")
+        return render_college_major(filters, 0, 1, [], per_page, error=e)
+
+    return render_college_major(filters, total_count, current_page, results, per_page)
+
+
+async def api_college_major():
+    if session.get('login') != 'OK':
+        return webapp.api_college_major()
+    try:
+        filters, current_page, per_page, fields = parse_major_api_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        version = result_cache.data_version()
+        cached = result_cache.get(major_cache_key('api', filters, current_page, per_page), version)
+        if cached:
+            total_count, current_page, results, facets = cached
+        else:
+            total_count, current_page, results, facets = await query_major_facets(filters, current_page, per_page)
+            result_cache.set(major_cache_key('api', filters, current_page, per_page),
+                             (total_count, current_page, results, facets), version=version)
+    except pymysql.Error as e:
+        logging.error(f"JSON查询错误: {e}")
+        return jsonify({'error': '数据库操作错误，请稍后再试'}), 500
+
+    return major_api_response(total_count, current_page, per_page, results, facets, fields)
+
+
+# 成绩排名索引加载后查询只在内存中进行，首次使用与定期比对成绩表指纹时异步查询，之后直接复用同步视图
+async def ensure_rank_engine():
+    if not webapp.rank_engine_due():
+        return
+    async with rank_engine_lock:
+        if not webapp.rank_engine_due():
+            return
+        engine = webapp.rank_engine
+        fingerprint = tuple((await fetch_all(SCORE_FINGERPRINT_SQL, ()))[0].values())
+        if engine is not None and fingerprint == engine.fingerprint:
+            engine.checked_at = time.monotonic()
+            return
+        rows = await fetch_all(RANK_ENGINE_SQL, ())
+        await asyncio.to_thread(webapp.install_score_data, rows, fingerprint)
+
+
+async def score_rank():
+    if session.get('login') == 'OK' and request.method == 'POST':
+        try:
+            await ensure_rank_engine()
+        except pymysql.Error as e:
+            logging.error(f"成绩排名查询数据库错误: {e}")
+    return webapp.score_rank()
+
+
+async def score_rank_batch():
+    if session.get('login') == 'OK':
+        try:
+            await ensure_rank_engine()
+        except pymysql.Error as e:
+            logging.error(f"批量成绩排名查询数据库错误: {e}")
+    return webapp.score_rank_batch()
+
+
+async def async_stats():
+    """返回本 worker 的并发与异步连接池统计"""
+    if not (session.get("login") == 'OK' and session.get('is_admin', False)):
+        return webapp.redirect('/')
+    with _stats_lock:
+        snapshot = dict(_stats)
+    snapshot['pid'] = os.getpid()
+    if db_pool is not None:
+        snapshot.update(pool_size=db_pool.size, pool_free=db_pool.freesize,
+                        pool_min=db_pool.minsize, pool_max=db_pool.maxsize)
+    return jsonify(snapshot)
+
+
+ASYNC_ROUTES = {
+    ('GET', '/college_major'): college_major,
+    ('POST', '/college_major'): college_major,
+    ('GET', '/api/college_major'): api_college_major,
+    ('GET', '/score_rank'): score_rank,
+    ('POST', '/score_rank'): score_rank,
+    ('POST', '/score_rank/batch'): score_rank_batch,
+    ('GET', '/admin/async_stats'): async_stats,
+}
+
+
+def build_environ(scope, body):
+    """由 ASGI scope 构造 WSGI environ，供 Flask 请求上下文解析参数、表单与会话"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+        'ziyuan.async': True,  # 准入控制的排队由 dispatch 在事件循环中完成
+    }
+    for name, value in scope.get('headers', ()):
+        name = name.decode('latin-1')
+        if name == 'content-type':
+            key = 'CONTENT_TYPE'
+        elif name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        if key == 'CONTENT_LENGTH':
+            # 请求体已完整读入，以实际长度为准（分块传输时没有该请求头）
+            continue
+        value = value.decode('latin-1')
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def dispatch(handler, scope, receive, send):
+    flask_app = webapp.app
+    environ = build_environ(scope, await read_body(receive))
+    _count('requests')
+    _count('in_flight')
+    try:
+        # 请求上下文保存在 contextvars 中，每个请求任务互不影响，可以跨 await 使用
+        with flask_app.request_context(environ):
+            try:
+                rv = flask_app.preprocess_request()
+                if rv is None and 'admission_pending' in g:
+                    try:
+                        g.admission_slot = await webapp.admission.acquire_async(g.pop('admission_pending'))
+                    except Rejected as e:
+                        rv = webapp.rejection_response(e)
+                if rv is None:
+                    rv = await handler()
+                response = flask_app.process_response(flask_app.make_response(rv))
+            except Exception as e:
+                try:
+                    response = flask_app.make_response(flask_app.handle_user_exception(e))
+                except Exception as e:
+                    response = flask_app.make_response(flask_app.handle_exception(e))
+            body = response.get_data()
+            headers = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                       for name, value in response.headers.items()]
+            status = response.status_code
+            response.close()
+    finally:
+        _count('in_flight', -1)
+
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await open_pool()
+            except Exception as e:
+                logging.error(f"异步连接池创建失败: {e}")
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await close_pool()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] == 'http' and db_pool is None:
+        # ASGI 服务器未发送 lifespan 事件时，在首个请求前创建连接池
+        await open_pool()
+    handler = ASYNC_ROUTES.get((scope.get('method'), scope.get('path'))) if scope['type'] == 'http' else None
+    if handler is None:
+        _count('fallback')
+        await wsgi_application(scope, receive, send)
+        return
+    await dispatch(handler, scope, receive, send)
@@ -0,0 +1,508 @@
+"""路由性能基准
+
+用法：
+    python bench.py seed --majors 50000 --scores 1000000 --replace   # 生成合成数据（会清空两张表）
+    python bench.py run --sessions 8 --requests 200 -o bench.json    # 压测并保存结果
+    python bench.py run --baseline old.json                          # 压测并与上次结果比较
+    python bench.py compare old.json new.json                        # 比较两次结果
+
+run 在进程内用 Flask 测试客户端驱动真实路由：每个并发会话先登录，
+再按固定随机种子生成的查询条件依次请求，统计每条路由的
+p50/p95/p99 延迟、吞吐量、每个请求的数据库查询次数与压测期间的内存增长。
+加 --url 时改为通过 HTTP 压测已启动的服务，可对比同步与异步服务模式。
+数据库使用 app.DB_CONFIG，请指向单独的本地测试库。
+"""
+import argparse
+import http.cookiejar
+import json
+import logging
+import math
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+
+import pymysql
+
+import app as webapp
+from app import DB_CONFIG, MAJOR_INDEX_ENABLED, FULLTEXT_SEARCH_ENABLED, result_cache
+
+BENCH_USER = 'bench_user'
+BENCH_PASSWORD = 'bench_pass'
+
+BATCH_NAMES = ('本科提前批', '本科普通批', '高职高专提前批', '高职高专普通批', '技能高考本科批', '技能高考专科批')
+CITIES = ('武汉', '黄石', '十堰', '宜昌', '襄阳', '鄂州', '荆门', '孝感', '荆州', '黄冈', '咸宁', '随州', '恩施', '仙桃')
+COLLEGE_KINDS = ('理工大学', '师范大学', '职业技术学院', '工程学院', '医学院', '财经学院', '科技大学', '交通职业学院')
+MAJOR_NAMES = (
+    '计算机科学与技术', '软件工程', '临床医学', '护理学', '机械设计制造及其自动化', '电气工程及其自动化',
+    '会计学', '财务管理', '土木工程', '汉语言文学', '英语', '数学与应用数学', '学前教育', '工程造价',
+    '数控技术', '汽车检测与维修技术', '大数据技术', '电子商务', '物流管理', '药学', '口腔医学技术', '建筑工程技术',
+)
+SUBJECT_REQUIREMENTS = ('不限', '物理', '历史', '物理和化学', '化学或生物', '思想政治', None)
+QUALIFICATION_REQUIREMENTS = (None, None, None, '只招男生', '色盲色弱不予录取', '要求英语单科成绩')
+SURNAMES = '王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗郑梁谢宋唐许韩冯邓曹彭曾肖田董袁潘于蒋蔡余杜叶程苏魏吕丁任沈'
+GIVEN_CHARS = '伟芳娜敏静丽强磊军洋勇艳杰涛明超秀霞平刚桂英华玉兰飞鹏辉宇浩然子轩梓涵欣怡雨萱思远博文俊'
+
+ROUTES = ('college_major', 'export_college_major', 'score_rank')
+# 比较两次结果时，这些指标增大视为变差；吞吐量减小视为变差
+LOWER_IS_BETTER = ('p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request', 'rss_growth_mb')
+# 变化量小于该值时不计为回退（内存增长本身很小时百分比波动大）
+MIN_ABSOLUTE_CHANGE = {'rss_growth_mb': 1.0}
+
+
+def chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def synthetic_majors(count, rng):
+    """按院校专业组生成招生计划行，每组 5~30 个专业"""
+    produced = 0
+    group = 0
+    while produced < count:
+        group += 1
+        batch = rng.choice(BATCH_NAMES)
+        college = f"{rng.choice(CITIES)}{rng.choice(COLLEGE_KINDS)}"
+        college_code = f"{group:05d}"
+        college_name = f"{college}({rng.randint(1, 12):02d})"
+        subject = rng.choice(SUBJECT_REQUIREMENTS)
+        for major_no in range(1, min(rng.randint(5, 30), count - produced) + 1):
+            major = rng.choice(MAJOR_NAMES)
+            if rng.random() < 0.3:
+                major = f"{major}({rng.choice(CITIES)}校区)"
+            yield (batch, college_code, college_name, f"{major_no:02d}", major,
+                   subject, rng.choice(QUALIFICATION_REQUIREMENTS))
+            produced += 1
+
+
+def synthetic_scores(count, rng):
+    """考生成绩，姓名由常见姓氏与名用字组合，存在重名"""
+    for _ in range(count):
+        name = rng.choice(SURNAMES) + ''.join(rng.choice(GIVEN_CHARS) for _ in range(rng.randint(1, 2)))
+        theory = round(min(300, max(0, rng.gauss(180, 45))), 1)
+        practical = round(min(490, max(0, rng.gauss(300, 70))), 1)
+        cultural = round(min(210, max(0, rng.gauss(120, 35))), 1)
+        yield name, theory, practical, cultural, round(theory + practical + cultural, 1)
+
+
+def fill_table(connection, table, columns, rows, chunk_size):
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+    total = 0
+    start = time.perf_counter()
+    with connection.cursor() as cursor:
+        cursor.execute(f"TRUNCATE TABLE {table}")
+        for chunk in chunked(rows, chunk_size):
+            cursor.executemany(sql, chunk)
+            connection.commit()
+            total += len(chunk)
+            if total % (chunk_size * 20) == 0:
+                logging.info(f"{table}: 已写入 {total} 行")
+    logging.info(f"{table}: 共写入 {total} 行，耗时 {time.perf_counter() - start:.1f} 秒")
+
+
+def cmd_seed(args):
+    connection = pymysql.connect(**dict(DB_CONFIG, cursorclass=pymysql.cursors.Cursor))
+    try:
+        with connection.cursor() as cursor:
+            for table in ('major_infos', 'score_table'):
+                cursor.execute(f"SELECT COUNT(*) FROM {table}")
+                if cursor.fetchone()[0] and not args.replace:
+                    raise SystemExit(f"{table} 已有数据，确认是测试库后加 --replace 重新生成")
+            cursor.execute("SELECT id FROM admins WHERE admin_name=%s", (BENCH_USER,))
+            if cursor.fetchone() is None:
+                cursor.execute("INSERT INTO admins (admin_name, admin_password) VALUES (%s, %s)",
+                               (BENCH_USER, BENCH_PASSWORD))
+        connection.commit()
+
+        rng = random.Random(args.seed)
+        fill_table(connection, 'major_infos',
+                   ('batch_name', 'college_code', 'college_name', 'major_code', 'major_name',
+                    'subject_requirement', 'qualification_requirement'),
+                   synthetic_majors(args.majors, rng), args.chunk_size)
+        fill_table(connection, 'score_table',
+                   ('name', 'theory_score', 'practical_score', 'cultural_score', 'total_score'),
+                   synthetic_scores(args.scores, rng), args.chunk_size)
+    finally:
+        connection.close()
+    result_cache.bump_version()
+    return 0
+
+
+class QueryCounter:
+    """统计每个线程执行的 SQL 条数，后台线程（如访问日志写入）的语句不计入请求"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._original = None
+
+    @property
+    def count(self):
+        return getattr(self._local, 'count', 0)
+
+    def install(self):
+        # executemany 内部按批调用 execute，只包装 execute 即可得到实际往返次数
+        counter = self
+        original = pymysql.cursors.Cursor.execute
+        self._original = original
+
+        def execute(cursor, *args, **kwargs):
+            counter._local.count = counter.count + 1
+            return original(cursor, *args, **kwargs)
+        pymysql.cursors.Cursor.execute = execute
+
+    def uninstall(self):
+        if self._original is not None:
+            pymysql.cursors.Cursor.execute = self._original
+            self._original = None
+
+
+def sample_values(limit=2000):
+    """按 id 等间隔取真实取值作为查询条件来源，同一份数据每次取到的样本相同"""
+    samples = {}
+    with webapp.Database() as cursor:
+        for table, columns in (('major_infos', 'batch_name, college_name, major_name'), ('score_table', 'name')):
+            cursor.execute(f"SELECT COUNT(*) as count FROM {table}")
+            step = max(1, cursor.fetchone()['count'] // limit)
+            cursor.execute(f"SELECT {columns} FROM {table} WHERE id %% %s = 0 ORDER BY id LIMIT %s", (step, limit))
+            samples[table] = cursor.fetchall()
+    if not samples['major_infos'] or not samples['score_table']:
+        raise SystemExit("major_infos 或 score_table 为空，请先运行 python bench.py seed")
+    return samples['major_infos'], [row['name'] for row in samples['score_table']]
+
+
+def make_requests(route, count, rng, majors, names):
+    """为一条路由生成 count 个 (方法, 路径, 参数) 请求"""
+    requests = []
+    for _ in range(count):
+        row = rng.choice(majors)
+        if route == 'score_rank':
+            requests.append(('POST', '/score_rank', {'name': rng.choice(names)}))
+            continue
+        kind = rng.random()
+        if kind < 0.2:
+            params = {}
+        elif kind < 0.5:
+            params = {'college_name_query': row['college_name'][:rng.randint(2, 4)]}
+        elif kind < 0.8:
+            params = {'major_name_query': row['major_name'][:rng.randint(2, 4)]}
+        else:
+            params = {'batch_name_query': row['batch_name'],
+                      'major_name_query': row['major_name'][:2]}
+        if route == 'college_major':
+            params['page'] = rng.choice((1, 1, 1, 2, 3, 10))
+        elif not params:
+            # 不带条件的全表导出太重，至少按批次过滤
+            params = {'batch_name_query': row['batch_name']}
+        requests.append(('GET', f'/{route}', params))
+    return requests
+
+
+def current_rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except OSError:
+        return None
+
+
+class RssSampler:
+    """压测单个路由期间每 interval 秒读取一次常驻内存，记录最大值
+
+    ru_maxrss 是整个进程的历史峰值，只增不减，先压测的路由会抬高之后所有路由的数值；
+    这里只统计本路由运行期间相对开始时的增长。不支持 /proc 的系统返回 None。
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.before = None
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.before = self.peak = current_rss_mb()
+        if self.before is not None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss_mb())
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self.peak = max(self.peak, current_rss_mb())
+
+    def growth_mb(self):
+        return None if self.before is None else self.peak - self.before
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    # 最近秩法
+    return sorted_values[max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)]
+
+
+class AppSession:
+    """进程内会话：Flask 测试客户端，各自保存登录 cookie"""
+
+    def __init__(self):
+        self.client = webapp.app.test_client()
+
+    def request(self, method, path, params):
+        if method == 'GET':
+            response = self.client.get(path, query_string=params)
+        else:
+            response = self.client.post(path, data=params)
+        body = response.get_data()  # 流式响应在此读完
+        return response.status_code, len(body)
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpSession:
+    """HTTP 会话：压测已启动的服务（同步 WSGI 或 asgi_app），各自保存登录 cookie"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect)
+
+    def request(self, method, path, params):
+        data = urllib.parse.urlencode(params)
+        if method == 'GET':
+            req = urllib.request.Request(f"{self.base_url}{path}?{data}")
+        else:
+            req = urllib.request.Request(f"{self.base_url}{path}", data=data.encode('utf-8'))
+        try:
+            with self.opener.open(req, timeout=120) as response:
+                return response.status, len(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, len(e.read())
+
+
+def login(session):
+    status, _ = session.request('POST', '/', {'user': BENCH_USER, 'pwd': BENCH_PASSWORD})
+    if status != 302:
+        raise SystemExit(f"基准账号登录失败（状态码 {status}），请先运行 python bench.py seed")
+
+
+def run_route(route, sessions, requests_per_session, rng, majors, names, counter, warmup, base_url=None):
+    clients = []
+    for _ in range(sessions):
+        client = HttpSession(base_url) if base_url else AppSession()
+        login(client)
+        clients.append(client)
+    plans = [make_requests(route, requests_per_session, random.Random(rng.random()), majors, names)
+             for _ in range(sessions)]
+
+    for method, path, params in plans[0][:warmup]:
+        clients[0].request(method, path, params)
+
+    samples = [[] for _ in range(sessions)]
+    errors = [0] * sessions
+
+    def worker(i):
+        for method, path, params in plans[i]:
+            before = counter.count if counter else 0
+            start = time.perf_counter()
+            status, size = clients[i].request(method, path, params)
+            elapsed = (time.perf_counter() - start) * 1000
+            samples[i].append((elapsed, counter.count - before if counter else None, size))
+            if status >= 400:
+                errors[i] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(sessions)]
+    with RssSampler() as rss:
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - start
+    rss_growth = rss.growth_mb()
+
+    flat = [sample for session_samples in samples for sample in session_samples]
+    latencies = sorted(sample[0] for sample in flat)
+    return {
+        'requests': len(flat),
+        'errors': sum(errors),
+        'wall_seconds': round(wall, 3),
+        'throughput_rps': round(len(flat) / wall, 2) if wall else None,
+        'mean_ms': round(statistics.fmean(latencies), 3),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'max_ms': round(latencies[-1], 3),
+        'queries_per_request': round(statistics.fmean(sample[1] for sample in flat), 3) if counter else None,
+        'mean_response_bytes': round(statistics.fmean(sample[2] for sample in flat)),
+        # HTTP 模式下服务在其他进程中，SQL 条数与内存需查看服务端统计
+        'rss_before_mb': round(rss.before, 1) if rss.before is not None and not base_url else None,
+        'rss_growth_mb': round(rss_growth, 1) if rss_growth is not None and not base_url else None,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def table_sizes():
+    with webapp.Database() as cursor:
+        sizes = {}
+        for table in ('major_infos', 'score_table'):
+            cursor.execute(f"SELECT COUNT(*) as count FROM {table}")
+            sizes[table] = cursor.fetchone()['count']
+    return sizes
+
+
+def cmd_run(args):
+    routes = args.routes.split(',') if args.routes else list(ROUTES)
+    unknown = set(routes) - set(ROUTES)
+    if unknown:
+        raise SystemExit(f"未知路由: {', '.join(sorted(unknown))}")
+
+    # 基准测试期间不记录访问日志，避免后台写入干扰计时；所有会话共用基准账号，
+    # 准入控制会把并发请求限流或排队，测到的是限额而不是路由本身的性能
+    webapp.ACCESS_LOG_ENABLED = False
+    webapp.admission = None
+    rng = random.Random(args.seed)
+    majors, names = sample_values()
+    counter = None if args.url else QueryCounter()
+    if counter:
+        counter.install()
+    results = {}
+    try:
+        for route in routes:
+            logging.info(f"压测 {route}: {args.sessions} 个会话 × {args.requests} 个请求")
+            results[route] = run_route(route, args.sessions, args.requests, rng, majors, names,
+                                       counter, args.warmup, args.url)
+            r = results[route]
+            logging.info(f"{route}: p50={r['p50_ms']}ms p95={r['p95_ms']}ms p99={r['p99_ms']}ms "
+                         f"{r['throughput_rps']} 请求/秒, 每请求 {r['queries_per_request']} 条 SQL, "
+                         f"内存增长 {r['rss_growth_mb']} MB, 错误 {r['errors']}")
+    finally:
+        if counter:
+            counter.uninstall()
+
+    report = {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'git_revision': git_revision(),
+            'python': sys.version.split()[0],
+            'seed': args.seed,
+            'sessions': args.sessions,
+            'requests_per_session': args.requests,
+            'warmup': args.warmup,
+            'url': args.url,
+            'major_index': MAJOR_INDEX_ENABLED,
+            'fulltext_search': FULLTEXT_SEARCH_ENABLED,
+            'db_pool': webapp.DB_POOL_CONFIG,
+            'tables': table_sizes(),
+            'result_cache': result_cache.stats(),
+        },
+        'routes': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        logging.info(f"结果已保存: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            return 1 if compare_reports(json.load(f), report, args.threshold) else 0
+    return 0
+
+
+def compare_reports(baseline, current, threshold):
+    """逐路由比较指标，变差超过 threshold（百分比）记为回退，返回回退列表"""
+    regressions = []
+    for route, result in current['routes'].items():
+        old = baseline.get('routes', {}).get(route)
+        if not old:
+            continue
+        for metric in LOWER_IS_BETTER + ('throughput_rps',):
+            before, after = old.get(metric), result.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) * 100 / before
+            worse = change > threshold if metric in LOWER_IS_BETTER else change < -threshold
+            worse = worse and abs(after - before) >= MIN_ABSOLUTE_CHANGE.get(metric, 0)
+            logging.info(f"{route} {metric}: {before} -> {after} ({change:+.1f}%){' 变差' if worse else ''}")
+            if worse:
+                regressions.append((route, metric, before, after))
+    if baseline.get('meta', {}).get('tables') != current.get('meta', {}).get('tables'):
+        logging.warning("两次结果的数据量不同，比较仅供参考")
+    for route, metric, before, after in regressions:
+        logging.warning(f"性能回退: {route} {metric} {before} -> {after}")
+    return regressions
+
+
+def cmd_compare(args):
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.current, encoding='utf-8') as f:
+        current = json.load(f)
+    return 1 if compare_reports(baseline, current, args.threshold) else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="路由性能基准")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    seed_parser = subparsers.add_parser('seed', help="生成合成数据")
+    seed_parser.add_argument('--majors', type=int, default=50000, help="major_infos 行数")
+    seed_parser.add_argument('--scores', type=int, default=1000000, help="score_table 行数")
+    seed_parser.add_argument('--chunk-size', type=int, default=5000, help="每批插入行数")
+    seed_parser.add_argument('--seed', type=int, default=20240601, help="随机种子")
+    seed_parser.add_argument('--replace', action='store_true', help="清空已有数据后重新生成")
+
+    run_parser = subparsers.add_parser('run', help="压测路由并输出结果")
+    run_parser.add_argument('--routes', help=f"逗号分隔，默认全部：{','.join(ROUTES)}")
+    run_parser.add_argument('--sessions', type=int, default=8, help="并发登录会话数")
+    run_parser.add_argument('--requests', type=int, default=100, help="每个会话的请求数")
+    run_parser.add_argument('--warmup', type=int, default=10, help="每条路由正式计时前的预热请求数")
+    run_parser.add_argument('--seed', type=int, default=20240601, help="随机种子，相同种子生成相同请求序列")
+    run_parser.add_argument('--url', help="压测已启动的服务（如 http://127.0.0.1:8000），默认在进程内调用")
+    run_parser.add_argument('-o', '--output', help="结果 JSON 文件")
+    run_parser.add_argument('--baseline', help="与该结果文件比较，有回退时退出码为 1")
+    run_parser.add_argument('--threshold', type=float, default=10.0, help="判定回退的变化百分比")
+
+    compare_parser = subparsers.add_parser('compare', help="比较两次结果")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=10.0, help="判定回退的变化百分比")
+
+    args = parser.parse_args(argv)
+    if args.command == 'seed':
+        return cmd_seed(args)
+    if args.command == 'run':
+        return cmd_run(args)
+    return cmd_compare(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
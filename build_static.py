@@ -0,0 +1,146 @@
+"""静态资源构建：内容指纹 + 预压缩
+
+用法：
+    python build_static.py            # 构建到 static/dist，并写入 static/dist/manifest.json
+    python build_static.py --clean    # 先删除旧的构建结果
+
+static/ 下每个文件复制为带内容哈希的文件名（如 css/main.css -> dist/css/main.1a2b3c4d.css），
+文本类资源另外生成 .gz 与 .br 预压缩版本（未安装 brotli 时跳过 .br）。
+CSS 中引用的其他静态资源改写为对应的哈希文件名。
+模板中通过 static_url('css/main.css') 按清单解析出哈希后的地址，
+文件内容变化后地址随之变化，因此可以放心设置长期 immutable 缓存。
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import posixpath
+import re
+import shutil
+import sys
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+DIST_NAME = 'dist'
+DIST_DIR = os.path.join(STATIC_DIR, DIST_NAME)
+MANIFEST_PATH = os.path.join(DIST_DIR, 'manifest.json')
+
+# 只压缩文本类资源，图片与字体本身已压缩
+COMPRESSIBLE = {'.css', '.js', '.json', '.svg', '.html', '.txt', '.map', '.ttf'}
+HASH_LENGTH = 8
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+def iter_sources():
+    """static/ 下除构建目录外的全部文件，返回相对路径（/ 分隔）"""
+    for root, dirs, files in os.walk(STATIC_DIR):
+        if os.path.abspath(root) == STATIC_DIR and DIST_NAME in dirs:
+            dirs.remove(DIST_NAME)
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            yield os.path.relpath(path, STATIC_DIR).replace(os.sep, '/')
+
+
+def hashed_name(path, content):
+    digest = hashlib.sha256(content).hexdigest()[:HASH_LENGTH]
+    base, ext = posixpath.splitext(path)
+    return f"{base}.{digest}{ext}"
+
+
+def rewrite_css(path, content, assets):
+    """把 CSS 中 url() 引用的本地资源替换为哈希后的相对路径，找不到的引用保持原样"""
+    directory = posixpath.dirname(path)
+
+    def replace(match):
+        quote, target = match.groups()
+        if re.match(r'^(?:[a-z]+:|//|#|/)', target, re.I):
+            return match.group(0)
+        clean = target.split('?', 1)[0].split('#', 1)[0]
+        suffix = target[len(clean):]
+        referenced = posixpath.normpath(posixpath.join(directory, clean))
+        if referenced not in assets:
+            return match.group(0)
+        relative = posixpath.relpath(assets[referenced]['path'][len(DIST_NAME) + 1:], directory)
+        return f"url({quote}{relative}{suffix}{quote})"
+
+    text = content.decode('utf-8')
+    return CSS_URL.sub(replace, text).encode('utf-8')
+
+
+def write_file(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def compress(path, content):
+    """生成预压缩文件，只保留比原文件小的版本，返回生成的编码列表"""
+    encodings = []
+    # mtime=0 保证相同内容每次构建结果一致
+    gz = gzip.compress(content, compresslevel=9, mtime=0)
+    if len(gz) < len(content):
+        write_file(path + '.gz', gz)
+        encodings.append('gzip')
+    if brotli is not None:
+        br = brotli.compress(content, quality=11)
+        if len(br) < len(content):
+            write_file(path + '.br', br)
+            encodings.append('br')
+    return encodings
+
+
+def build():
+    sources = list(iter_sources())
+    # 先处理非 CSS 文件，CSS 改写引用时即可查到它们的哈希名
+    sources.sort(key=lambda path: path.endswith('.css'))
+    assets = {}
+    original_bytes = 0
+    compressed_bytes = 0
+    for path in sources:
+        with open(os.path.join(STATIC_DIR, path), 'rb') as f:
+            content = f.read()
+        if path.endswith('.css'):
+            content = rewrite_css(path, content, assets)
+        target = hashed_name(path, content)
+        output = os.path.join(DIST_DIR, target)
+        write_file(output, content)
+        encodings = []
+        if posixpath.splitext(path)[1].lower() in COMPRESSIBLE:
+            encodings = compress(output, content)
+        assets[path] = {'path': f"{DIST_NAME}/{target}", 'size': len(content), 'encodings': encodings}
+        original_bytes += len(content)
+        if encodings:
+            compressed_bytes += os.path.getsize(output + ('.br' if 'br' in encodings else '.gz'))
+        else:
+            compressed_bytes += len(content)
+
+    write_file(MANIFEST_PATH, json.dumps({'assets': assets}, ensure_ascii=False, indent=2, sort_keys=True).encode('utf-8'))
+    logging.info(f"已构建 {len(assets)} 个静态资源，原始 {original_bytes / 1024:.0f} KB，"
+                 f"压缩后 {compressed_bytes / 1024:.0f} KB，清单: {MANIFEST_PATH}")
+    if brotli is None:
+        logging.warning("未安装 brotli，只生成了 gzip 版本：pip install brotli")
+    return assets
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="构建带内容指纹与预压缩的静态资源")
+    parser.add_argument('--clean', action='store_true', help="构建前删除 static/dist")
+    args = parser.parse_args(argv)
+    if args.clean and os.path.isdir(DIST_DIR):
+        shutil.rmtree(DIST_DIR)
+    build()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
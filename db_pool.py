@@ -0,0 +1,335 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import pymysql
+
+
+class PoolTimeout(pymysql.err.OperationalError):
+    """连接池耗尽且等待超时"""
+
+
+class ConnectionPool:
+    """线程安全的 MySQL 连接池
+
+    - min_size: 空闲时至少保留的连接数，超出部分空闲过久会被关闭
+    - max_size: 同时打开的连接数上限
+    - max_age: 连接最长存活秒数，超过后归还或取出时回收
+    - timeout: 连接池耗尽时等待可用连接的秒数
+    - ping_interval: 空闲超过该秒数的连接在取出时先 ping 检查存活
+    - idle_timeout: 超出 min_size 的空闲连接闲置超过该秒数即关闭
+    """
+
+    def __init__(self, config, min_size=1, max_size=10, max_age=3600,
+                 timeout=5.0, ping_interval=30, idle_timeout=300):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("连接池大小配置无效")
+        self._config = dict(config)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_age = max_age
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self.idle_timeout = idle_timeout
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (connection, 归还时间)，后进先出复用热连接
+        self._size = 0        # 已打开的连接数（含已借出）
+        self._pid = os.getpid()
+        self._stats = {
+            'checkouts': 0,   # 借出次数
+            'hits': 0,        # 复用空闲连接
+            'misses': 0,      # 新建连接
+            'waits': 0,       # 因连接池耗尽而等待
+            'timeouts': 0,    # 等待超时
+            'recycled': 0,    # 因超龄/闲置被回收
+            'broken': 0,      # ping 失败或出错被丢弃
+        }
+
+    def _check_fork(self):
+        # gunicorn 等预加载后 fork 的场景：子进程不能复用父进程的 socket
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._idle.clear()
+            self._size = 0
+
+    def _connect(self):
+        conn = pymysql.connect(**self._config)
+        conn._pool_born = time.monotonic()
+        return conn
+
+    def _expired(self, conn, now):
+        return self.max_age and now - conn._pool_born > self.max_age
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _trim_idle(self, now):
+        """关闭超出 min_size 且闲置过久的连接，调用方需持有锁"""
+        closed = []
+        while len(self._idle) > self.min_size:
+            conn, returned_at = self._idle[0]
+            if now - returned_at <= self.idle_timeout:
+                break
+            self._idle.popleft()
+            self._size -= 1
+            self._stats['recycled'] += 1
+            closed.append(conn)
+        return closed
+
+    def acquire(self):
+        """借出一个可用连接，必要时等待，超时抛出 PoolTimeout"""
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        with self._cond:
+            self._check_fork()
+            self._stats['checkouts'] += 1
+
+        while True:
+            entry = None
+            with self._cond:
+                while True:
+                    if self._idle:
+                        entry = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(2013, f"数据库连接池已耗尽（上限 {self.max_size}），等待 {self.timeout} 秒超时")
+                    if not waited:
+                        waited = True
+                        self._stats['waits'] += 1
+                    self._cond.wait(remaining)
+
+            if entry is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._stats['misses'] += 1
+                return conn
+
+            # 存活检查在锁外进行，避免 ping 阻塞其他线程
+            conn, returned_at = entry
+            now = time.monotonic()
+            if self._expired(conn, now):
+                self._discard(conn, 'recycled')
+                continue
+            if now - returned_at >= self.ping_interval:
+                try:
+                    conn.ping(reconnect=False)
+                except Exception as e:
+                    logging.warning(f"连接池中的连接已失效，丢弃: {e}")
+                    self._discard(conn, 'broken')
+                    continue
+            with self._cond:
+                self._stats['hits'] += 1
+            return conn
+
+    def release(self, conn, broken=False):
+        """归还连接；broken=True 或连接已超龄时直接关闭"""
+        now = time.monotonic()
+        with self._cond:
+            if self._pid != os.getpid():
+                return
+            if broken or not conn.open:
+                reason = 'broken'
+            elif self._expired(conn, now):
+                reason = 'recycled'
+            else:
+                self._idle.append((conn, now))
+                closed = self._trim_idle(now)
+                self._cond.notify()
+                reason = None
+        if reason:
+            self._discard(conn, reason)
+            return
+        for idle_conn in closed:
+            self._close(idle_conn)
+
+    def _discard(self, conn, reason):
+        self._close(conn)
+        with self._cond:
+            self._size -= 1
+            self._stats[reason] += 1
+            self._cond.notify()
+
+    def close_all(self):
+        """关闭所有空闲连接（借出的连接归还时照常处理）"""
+        with self._cond:
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            self._close(conn)
+
+    def stats(self):
+        """返回连接池统计信息快照"""
+        with self._cond:
+            snapshot = dict(self._stats)
+            snapshot.update({
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+            })
+        return snapshot
+
+
+class ReplicaSet:
+    """只读副本的连接池组，为只读查询选择副本，不可用时回落到主库
+
+    - 选择借出连接最少的副本，数量相同时轮流使用
+    - 每个副本每 check_interval 秒检查一次复制延迟，由发现检查到期的请求线程执行；
+      延迟超过 max_lag 秒或复制已停止的副本暂不使用
+    - 连接失败的副本 retry_after 秒内不再尝试
+    - 副本连接池只等待 acquire_timeout 秒；池已借满（PoolTimeout）说明副本正忙而不是故障，
+      不标记为不可用，直接尝试下一个副本或主库
+    """
+
+    def __init__(self, primary, configs, max_lag=5.0, check_interval=5.0, retry_after=30.0, acquire_timeout=0.2,
+                 **pool_options):
+        self.primary = primary
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._turn = 0
+        self._replicas = []
+        for config in configs:
+            # 副本连接设为只读事务，误用写语句时直接报错而不是写入副本
+            config = dict(config, init_command='SET SESSION TRANSACTION READ ONLY')
+            self._replicas.append({
+                'name': f"{config['host']}:{config.get('port', 3306)}",
+                'pool': ConnectionPool(config, **dict(pool_options, timeout=acquire_timeout)),
+                'lag': None,
+                'checked_at': None,
+                'down_until': 0.0,
+                'error': None,
+                'reads': 0,
+                'saturated': 0,
+            })
+        self._fallbacks = 0
+
+    def __len__(self):
+        return len(self._replicas)
+
+    def _usable(self, replica, now):
+        return replica['down_until'] <= now and replica['lag'] is not None and replica['lag'] <= self.max_lag
+
+    def _due_checks(self, now):
+        """取出需要检查的副本并标记为检查中，同一时间只有一个线程检查同一副本"""
+        due = []
+        with self._lock:
+            for replica in self._replicas:
+                if replica['down_until'] > now:
+                    continue
+                if replica['checked_at'] is None or now - replica['checked_at'] >= self.check_interval:
+                    replica['checked_at'] = now
+                    due.append(replica)
+        return due
+
+    def _check(self, replica):
+        try:
+            conn = replica['pool'].acquire()
+        except PoolTimeout:
+            # 连接都在使用中，副本可用；下次请求时再检查
+            with self._lock:
+                replica['checked_at'] = None
+            return
+        except pymysql.Error as e:
+            self._mark_down(replica, e)
+            return
+        broken = False
+        try:
+            with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+                try:
+                    cursor.execute("SHOW REPLICA STATUS")
+                except pymysql.err.ProgrammingError:
+                    # MySQL 8.0.22 之前只支持旧语法
+                    cursor.execute("SHOW SLAVE STATUS")
+                status = cursor.fetchone()
+            if status is None:
+                lag = 0.0  # 不是复制节点（如只读克隆），视为无延迟
+            else:
+                seconds = status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+                lag = None if seconds is None else float(seconds)
+            with self._lock:
+                if replica['lag'] is not None and lag is None:
+                    logging.warning(f"副本 {replica['name']} 复制已停止，暂停读取")
+                elif lag is not None and lag > self.max_lag:
+                    logging.warning(f"副本 {replica['name']} 复制延迟 {lag:.0f} 秒，超过上限 {self.max_lag} 秒")
+                replica['lag'] = lag
+                replica['error'] = None if lag is not None else '复制已停止'
+        except pymysql.Error as e:
+            broken = True
+            self._mark_down(replica, e)
+        finally:
+            replica['pool'].release(conn, broken=broken)
+
+    def _mark_down(self, replica, error):
+        logging.warning(f"副本 {replica['name']} 不可用，{self.retry_after:.0f} 秒内改用其他节点: {error}")
+        with self._lock:
+            replica['down_until'] = time.monotonic() + self.retry_after
+            replica['error'] = str(error)
+            replica['checked_at'] = None
+
+    def _candidates(self, now):
+        """可用副本，借出连接少的在前，数量相同时从上次之后的副本开始轮流"""
+        with self._lock:
+            self._turn += 1
+            turn = self._turn
+        count = len(self._replicas)
+        ordered = [self._replicas[(turn + i) % count] for i in range(count)]
+        usable = [replica for replica in ordered if self._usable(replica, now)]
+        return sorted(usable, key=lambda replica: replica['pool'].stats()['in_use'])
+
+    def acquire(self):
+        """借出只读连接，返回 (连接池, 连接)；没有可用副本时从主库借出"""
+        now = time.monotonic()
+        for replica in self._due_checks(now):
+            self._check(replica)
+        for replica in self._candidates(now):
+            try:
+                conn = replica['pool'].acquire()
+            except PoolTimeout:
+                with self._lock:
+                    replica['saturated'] += 1
+                continue
+            except pymysql.Error as e:
+                self._mark_down(replica, e)
+                continue
+            with self._lock:
+                replica['reads'] += 1
+            return replica['pool'], conn
+        with self._lock:
+            self._fallbacks += 1
+        return self.primary, self.primary.acquire()
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            replicas = [{
+                'name': replica['name'],
+                'usable': self._usable(replica, now),
+                'lag': replica['lag'],
+                'reads': replica['reads'],
+                'saturated': replica['saturated'],
+                'error': replica['error'],
+                'pool': replica['pool'].stats(),
+            } for replica in self._replicas]
+            return {'max_lag': self.max_lag, 'primary_fallbacks': self._fallbacks, 'replicas': replicas}
@@ -0,0 +1,316 @@
+"""导入省考试院发布的招生计划到 major_infos
+
+用法：
+    python import_majors.py 招生计划.xlsx                 # 全量导入，加载完成后原子替换
+    python import_majors.py 招生计划.csv --mode incremental  # 只更新/新增有变化的专业
+    python import_majors.py 招生计划.csv --dry-run           # 只校验不写库
+
+文件首行为表头，可使用中文列名（与导出文件一致）或英文字段名。
+全量模式先写入 major_infos_staging，再用 RENAME TABLE 一次性替换，
+查询方不会看到导入到一半的数据。
+"""
+import argparse
+import csv
+import logging
+import os
+import re
+import sys
+import tempfile
+import time
+import unicodedata
+
+import pymysql
+
+from app import (DB_CONFIG, EXPORT_HEADER_MAP, MAJOR_SNAPSHOT_PATH, RESULT_CACHE_SHARED, result_cache,
+                 write_major_snapshot)
+
+MAJOR_COLUMNS = (
+    'batch_name', 'college_code', 'college_name', 'major_code',
+    'major_name', 'subject_requirement', 'qualification_requirement',
+)
+REQUIRED_COLUMNS = MAJOR_COLUMNS[:5]
+# 与 ziyuan.sql 中的列长度一致
+COLUMN_LENGTHS = {
+    'batch_name': 255, 'college_code': 50, 'college_name': 255, 'major_code': 50,
+    'major_name': 255, 'subject_requirement': 255, 'qualification_requirement': 255,
+}
+CODE_PATTERN = re.compile(r'^[0-9A-Za-z]+$')
+# 这些写法都表示没有要求，统一存为 NULL
+EMPTY_VALUES = {'', '无', '不限', '无要求', '无特殊要求', '-', '—', '/'}
+
+STAGING_TABLE = 'major_infos_staging'
+OLD_TABLE = 'major_infos_old'
+
+# 表头：中文列名与英文字段名都可识别
+HEADER_ALIASES = {label: column for column, label in EXPORT_HEADER_MAP.items() if column in MAJOR_COLUMNS}
+HEADER_ALIASES.update({column: column for column in MAJOR_COLUMNS})
+
+
+def read_csv(path, encoding):
+    with open(path, newline='', encoding=encoding) as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        yield header
+        for row in reader:
+            yield row
+
+
+def read_xlsx(path, sheet):
+    try:
+        import openpyxl
+    except ImportError:
+        raise SystemExit("读取 xlsx 需要安装 openpyxl：pip install openpyxl")
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet] if sheet else workbook.active
+        for row in worksheet.iter_rows(values_only=True):
+            yield list(row)
+    finally:
+        workbook.close()
+
+
+def iter_records(path, sheet=None, encoding='utf-8-sig'):
+    """逐行读取文件，产出 (行号, {字段: 原始值})"""
+    if path.lower().endswith(('.xlsx', '.xlsm')):
+        rows = read_xlsx(path, sheet)
+    else:
+        rows = read_csv(path, encoding)
+
+    header = next(rows, None)
+    if header is None:
+        raise SystemExit("文件为空")
+    mapping = {}
+    for position, label in enumerate(header):
+        column = HEADER_ALIASES.get(str(label).strip()) if label is not None else None
+        if column:
+            mapping[position] = column
+    missing = [column for column in REQUIRED_COLUMNS if column not in mapping.values()]
+    if missing:
+        raise SystemExit(f"表头缺少必需列: {', '.join(EXPORT_HEADER_MAP[c] for c in missing)}")
+
+    for line_no, row in enumerate(rows, start=2):
+        if not any(cell not in (None, '') for cell in row):
+            continue
+        yield line_no, {column: row[position] if position < len(row) else None for position, column in mapping.items()}
+
+
+def normalize_cell(value):
+    if value is None:
+        return ''
+    # Excel 中的数字代码会读成 int/float
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    text = unicodedata.normalize('NFKC', str(value))
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def normalize_record(record):
+    """校验并规范化一行，返回 (按 MAJOR_COLUMNS 排列的元组, 错误列表)"""
+    values = {}
+    errors = []
+    for column in MAJOR_COLUMNS:
+        text = normalize_cell(record.get(column))
+        if column in ('college_code', 'major_code'):
+            text = text.replace(' ', '').upper()
+            if text and not CODE_PATTERN.match(text):
+                errors.append(f"{EXPORT_HEADER_MAP[column]}只能包含字母和数字: {text}")
+        if column in REQUIRED_COLUMNS and not text:
+            errors.append(f"{EXPORT_HEADER_MAP[column]}不能为空")
+        if column in ('subject_requirement', 'qualification_requirement') and text in EMPTY_VALUES:
+            text = None
+        if text and len(text) > COLUMN_LENGTHS[column]:
+            errors.append(f"{EXPORT_HEADER_MAP[column]}超过 {COLUMN_LENGTHS[column]} 个字符")
+        values[column] = text
+    return tuple(values[column] for column in MAJOR_COLUMNS), errors
+
+
+class ImportReport:
+    def __init__(self, max_errors=20):
+        self.max_errors = max_errors
+        self.read = 0
+        self.loaded = 0
+        self.rejected = 0
+        self.errors = []
+        self.started = time.perf_counter()
+
+    def reject(self, line_no, messages):
+        self.rejected += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append(f"第 {line_no} 行: {'；'.join(messages)}")
+
+    def rate(self):
+        elapsed = time.perf_counter() - self.started
+        return self.read / elapsed if elapsed > 0 else 0.0
+
+    def progress(self):
+        logging.info(f"已读取 {self.read} 行，已加载 {self.loaded} 行，拒绝 {self.rejected} 行，{self.rate():.0f} 行/秒")
+
+
+def valid_rows(records, report):
+    """过滤出合法行，同一文件中重复的 (批次, 院校专业组代码, 专业代号) 只保留首次出现"""
+    seen = {}
+    for line_no, record in records:
+        report.read += 1
+        row, errors = normalize_record(record)
+        key = (row[0], row[1], row[3])
+        if not errors and key in seen:
+            errors = [f"与第 {seen[key]} 行的批次、院校专业组代码、专业代号重复"]
+        if errors:
+            report.reject(line_no, errors)
+            continue
+        seen[key] = line_no
+        yield row
+
+
+def chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def create_staging(cursor):
+    cursor.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE}")
+    cursor.execute(f"CREATE TABLE {STAGING_TABLE} LIKE major_infos")
+
+
+def load_with_executemany(connection, rows, report, chunk_size):
+    sql = (f"INSERT INTO {STAGING_TABLE} ({', '.join(MAJOR_COLUMNS)}) "
+           f"VALUES ({', '.join(['%s'] * len(MAJOR_COLUMNS))})")
+    with connection.cursor() as cursor:
+        for chunk in chunked(rows, chunk_size):
+            cursor.executemany(sql, chunk)
+            connection.commit()
+            report.loaded += len(chunk)
+            report.progress()
+
+
+def _tsv_field(value):
+    if value is None:
+        return '\\N'
+    return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+
+
+def load_with_infile(connection, rows, report):
+    """先写成临时 TSV，再用 LOAD DATA LOCAL INFILE 一次性加载"""
+    fd, tmp_path = tempfile.mkstemp(suffix='.tsv')
+    try:
+        count = 0
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='\n') as f:
+            for row in rows:
+                f.write('\t'.join(_tsv_field(value) for value in row) + '\n')
+                count += 1
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"LOAD DATA LOCAL INFILE %s INTO TABLE {STAGING_TABLE} CHARACTER SET utf8mb4 "
+                f"FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' "
+                f"({', '.join(MAJOR_COLUMNS)})",
+                (tmp_path,)
+            )
+        connection.commit()
+        report.loaded += count
+        report.progress()
+    finally:
+        os.remove(tmp_path)
+
+
+def swap_tables(connection):
+    """原子替换：RENAME TABLE 在一条语句内完成，读方要么看到旧表要么看到新表"""
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {OLD_TABLE}")
+        cursor.execute(f"RENAME TABLE major_infos TO {OLD_TABLE}, {STAGING_TABLE} TO major_infos")
+        cursor.execute(f"DROP TABLE {OLD_TABLE}")
+
+
+def upsert_from_staging(connection):
+    """增量模式：按 (batch_name, college_code, major_code) 只更新有变化的行并插入新行"""
+    key_join = ' AND '.join(f"m.{column} = s.{column}" for column in ('batch_name', 'college_code', 'major_code'))
+    value_columns = ('college_name', 'major_name', 'subject_requirement', 'qualification_requirement')
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE major_infos m JOIN {STAGING_TABLE} s ON {key_join} "
+            f"SET {', '.join(f'm.{c} = s.{c}' for c in value_columns)} "
+            f"WHERE NOT ({' AND '.join(f'm.{c} <=> s.{c}' for c in value_columns)})"
+        )
+        updated = cursor.rowcount
+        cursor.execute(
+            f"INSERT INTO major_infos ({', '.join(MAJOR_COLUMNS)}) "
+            f"SELECT {', '.join(f's.{c}' for c in MAJOR_COLUMNS)} FROM {STAGING_TABLE} s "
+            f"LEFT JOIN major_infos m ON {key_join} WHERE m.id IS NULL"
+        )
+        inserted = cursor.rowcount
+        connection.commit()
+        cursor.execute(f"DROP TABLE {STAGING_TABLE}")
+    return updated, inserted
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="导入招生计划到 major_infos")
+    parser.add_argument('path', help="CSV 或 XLSX 文件")
+    parser.add_argument('--mode', choices=('full', 'incremental'), default='full',
+                        help="full 全量替换（默认），incremental 只更新变化的专业")
+    parser.add_argument('--sheet', help="XLSX 工作表名称，默认第一个")
+    parser.add_argument('--encoding', default='utf-8-sig', help="CSV 文件编码，默认 utf-8-sig")
+    parser.add_argument('--chunk-size', type=int, default=1000, help="每批插入行数")
+    parser.add_argument('--load-data', action='store_true', help="使用 LOAD DATA LOCAL INFILE 加载")
+    parser.add_argument('--dry-run', action='store_true', help="只校验，不写数据库")
+    args = parser.parse_args(argv)
+
+    report = ImportReport()
+    rows = valid_rows(iter_records(args.path, args.sheet, args.encoding), report)
+
+    if args.dry_run:
+        for _ in rows:
+            report.loaded += 1
+        report.progress()
+    else:
+        config = dict(DB_CONFIG, cursorclass=pymysql.cursors.Cursor, local_infile=args.load_data)
+        connection = pymysql.connect(**config)
+        try:
+            with connection.cursor() as cursor:
+                create_staging(cursor)
+            if args.load_data:
+                load_with_infile(connection, rows, report)
+            else:
+                load_with_executemany(connection, rows, report, args.chunk_size)
+
+            if report.loaded == 0:
+                with connection.cursor() as cursor:
+                    cursor.execute(f"DROP TABLE {STAGING_TABLE}")
+                raise SystemExit("没有可导入的有效数据，major_infos 未改动")
+
+            if args.mode == 'full':
+                swap_tables(connection)
+                logging.info(f"已用 {report.loaded} 行替换 major_infos")
+            else:
+                updated, inserted = upsert_from_staging(connection)
+                logging.info(f"增量导入完成：更新 {updated} 行，新增 {inserted} 行")
+        finally:
+            connection.close()
+
+        # 配置了快照时先发布新快照，各 worker 发现文件被替换后切换到新数据；
+        # 再更新共享的数据版本，各 worker 随之失效缓存并重新加载专业索引；版本不共享且无快照时需在管理后台重新加载
+        if MAJOR_SNAPSHOT_PATH:
+            write_major_snapshot(MAJOR_SNAPSHOT_PATH)
+        if RESULT_CACHE_SHARED:
+            result_cache.bump_version()
+        elif not MAJOR_SNAPSHOT_PATH:
+            logging.info("请在管理员控制面板“数据维护”中重新加载专业索引以刷新查询缓存")
+
+    logging.info(f"读取 {report.read} 行，有效 {report.loaded} 行，拒绝 {report.rejected} 行，"
+                 f"平均 {report.rate():.0f} 行/秒")
+    for message in report.errors:
+        logging.warning(message)
+    if report.rejected > len(report.errors):
+        logging.warning(f"另有 {report.rejected - len(report.errors)} 行错误未列出")
+    return 0 if report.rejected == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
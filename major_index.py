@@ -0,0 +1,205 @@
+import re
+import time
+from array import array
+from collections import Counter
+
+from subject_eligibility import REQUIREMENT_COLUMNS, SubjectEligibility
+
+# 与 college_major 查询条件一一对应：(请求参数名, 列名)
+MAJOR_FILTER_FIELDS = (
+    ('batch_name_query', 'batch_name'),
+    ('college_code_query', 'college_code'),
+    ('college_name_query', 'college_name'),
+    ('major_code_query', 'major_code'),
+    ('major_name_query', 'major_name'),
+    ('subject_requirement_query', 'subject_requirement'),
+    ('qualification_requirement_query', 'qualification_requirement'),
+)
+
+# 建立 n-gram 倒排表的文本列；代码列很短，直接在候选集上校验
+INDEXED_COLUMNS = (
+    'college_name',
+    'major_name',
+    'batch_name',
+    'subject_requirement',
+    'qualification_requirement',
+)
+
+
+def like_matcher(query):
+    """把 LIKE '%query%' 翻译成 (字面片段列表, 匹配函数)
+
+    与 MySQL 行为保持一致：不区分大小写，% 与 _ 为通配符，反斜杠转义。
+    """
+    query = query.casefold()
+    fragments = []
+    parts = []
+    literal = []
+    wildcard = False
+    i = 0
+    while i < len(query):
+        ch = query[i]
+        if ch == '\\' and i + 1 < len(query):
+            literal.append(query[i + 1])
+            i += 2
+            continue
+        if ch in '%_':
+            wildcard = True
+            if literal:
+                fragments.append(''.join(literal))
+                parts.append(re.escape(fragments[-1]))
+                literal = []
+            parts.append('.*' if ch == '%' else '.')
+        else:
+            literal.append(ch)
+        i += 1
+    if literal:
+        fragments.append(''.join(literal))
+        parts.append(re.escape(fragments[-1]))
+
+    if not wildcard:
+        text = fragments[0] if fragments else ''
+        return fragments, lambda value: text in value
+    pattern = re.compile(''.join(parts), re.S)
+    return fragments, lambda value: pattern.search(value) is not None
+
+
+def count_facets(rows, columns, count_key=None):
+    """一次遍历统计各列取值的分布，按数量降序返回
+
+    count_key 为 None 时每行计 1；否则取该键的值作为行数（用于 GROUP BY 结果）。
+    """
+    counters = {column: Counter() for column in columns}
+    for row in rows:
+        weight = 1 if count_key is None else row[count_key]
+        for column in columns:
+            counters[column][row[column]] += weight
+    return {
+        column: [{'value': value, 'count': count} for value, count in counter.most_common()]
+        for column, counter in counters.items()
+    }
+
+
+def _grams(text, n):
+    """文本中的全部 1..n 字符 gram"""
+    grams = set(text)
+    for size in range(2, n + 1):
+        grams.update(text[i:i + size] for i in range(len(text) - size + 1))
+    return grams
+
+
+class MajorIndex:
+    """major_infos 的内存快照与字符 n-gram 倒排索引
+
+    rows 需已按 batch_name, college_code, major_code 排序，
+    检索结果为行号列表，天然保持该排序，可直接切片分页。
+    """
+
+    def __init__(self, rows, n=2):
+        self.n = n
+        self.rows = list(rows)
+        self.built_at = time.time()
+        columns = {column for _, column in MAJOR_FILTER_FIELDS}
+        # 预先小写化的列值，None 表示 NULL（LIKE 永远不匹配）
+        self._folded = {
+            column: [None if row.get(column) is None else str(row[column]).casefold() for row in self.rows]
+            for column in columns
+        }
+        self._postings = {column: self._build_postings(self._folded[column]) for column in INDEXED_COLUMNS}
+        self._eligibility = None
+        self._code_positions = None
+
+    def _build_postings(self, values):
+        postings = {}
+        for pos, value in enumerate(values):
+            if not value:
+                continue
+            for gram in _grams(value, self.n):
+                postings.setdefault(gram, []).append(pos)
+        return {gram: array('I', positions) for gram, positions in postings.items()}
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def columns(self):
+        return list(self.rows[0].keys()) if self.rows else []
+
+    @property
+    def subject_eligibility(self):
+        """选科要求编码，首次按选考科目筛选时生成"""
+        if self._eligibility is None:
+            self._eligibility = SubjectEligibility(
+                tuple(row.get(column) for column in REQUIREMENT_COLUMNS) for row in self.rows)
+        return self._eligibility
+
+    def _query_grams(self, fragment):
+        if len(fragment) <= self.n:
+            return [fragment]
+        return [fragment[i:i + self.n] for i in range(len(fragment) - self.n + 1)]
+
+    def _candidates(self, column, fragments):
+        """倒排表求交得到的候选行号集合，返回 None 表示无法缩小范围"""
+        postings = self._postings[column]
+        lists = []
+        for fragment in fragments:
+            for gram in self._query_grams(fragment):
+                posting = postings.get(gram)
+                if posting is None:
+                    return set()
+                lists.append(posting)
+        if not lists:
+            return None
+        lists.sort(key=len)
+        candidates = set(lists[0])
+        for posting in lists[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                break
+        return candidates
+
+    def search(self, filters):
+        """按 {列名: 查询串} 做子串过滤，返回有序行号列表"""
+        matchers = []
+        candidates = None
+        for column, query in filters.items():
+            if not query:
+                continue
+            fragments, match = like_matcher(query)
+            matchers.append((self._folded[column], match))
+            if column in self._postings:
+                found = self._candidates(column, fragments)
+                if found is None:
+                    continue
+                candidates = found if candidates is None else candidates & found
+                if not candidates:
+                    return []
+
+        if candidates is None:
+            if not matchers:
+                return list(range(len(self.rows)))
+            candidates = range(len(self.rows))
+        else:
+            candidates = sorted(candidates)
+
+        # 最终校验：gram 命中不代表子串命中，且通配符/代码列需逐行判断
+        return [
+            pos for pos in candidates
+            if all(values[pos] is not None and match(values[pos]) for values, match in matchers)
+        ]
+
+    def lookup_codes(self, keys):
+        """按 (院校专业组代码, 专业代号) 精确查找，键为小写化后的代码，返回 {键: [行]}"""
+        if self._code_positions is None:
+            positions = {}
+            for pos, key in enumerate(zip(self._folded['college_code'], self._folded['major_code'])):
+                positions.setdefault(key, []).append(pos)
+            self._code_positions = positions
+        return {key: [self.rows[pos] for pos in self._code_positions[key]]
+                for key in keys if key in self._code_positions}
+
+    def facets(self, positions, columns):
+        return count_facets((self.rows[pos] for pos in positions), columns)
+
+    def page(self, positions, offset, limit):
+        return [self.rows[pos] for pos in positions[offset:offset + limit]]
@@ -0,0 +1,324 @@
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+import uuid
+from array import array
+from collections import Counter
+
+from major_index import like_matcher
+from subject_eligibility import REQUIREMENT_COLUMNS, SubjectEligibility
+
+# 文件末尾的定位信息：元数据 JSON 的偏移与长度、魔数
+MAGIC = b'ZYMAJSN1'
+_FOOTER = struct.Struct('<QQ8s')
+FORMAT_VERSION = 1
+
+# 字符串列中 NULL 的编码，整数列中 NULL 的取值
+NULL_CODE = 0xFFFFFFFF
+NULL_INT = -2 ** 63
+# 两次检查快照文件是否已被替换的最短间隔（秒）
+REPLACED_CHECK_INTERVAL = 1.0
+
+
+class _Column:
+    """构建中的列：整数列直接存值，其他列按字典编码"""
+
+    def __init__(self, name, integer):
+        self.name = name
+        self.integer = integer
+        if integer:
+            self.values = array('q')
+        else:
+            self.codes = array('I')
+            self.dictionary = {}
+
+    def append(self, value):
+        if self.integer:
+            self.values.append(NULL_INT if value is None else value)
+        elif value is None:
+            self.codes.append(NULL_CODE)
+        else:
+            self.codes.append(self.dictionary.setdefault(str(value), len(self.dictionary)))
+
+    def sections(self):
+        if self.integer:
+            return {self.name: self.values}
+        data = bytearray()
+        offsets = array('Q', [0])
+        for value in self.dictionary:
+            data += value.encode('utf-8')
+            offsets.append(len(data))
+        # 每个取值对应的行号（按编码分组，组内升序），按取值过滤时直接取出整段
+        counts = array('I', [0] * (len(self.dictionary) + 1))
+        for code in self.codes:
+            if code != NULL_CODE:
+                counts[code + 1] += 1
+        for code in range(len(self.dictionary)):
+            counts[code + 1] += counts[code]
+        cursor = array('I', counts[:-1])
+        rows = array('I', [0] * counts[-1])
+        for pos, code in enumerate(self.codes):
+            if code != NULL_CODE:
+                rows[cursor[code]] = pos
+                cursor[code] += 1
+        return {
+            f'{self.name}.dict_data': data,
+            f'{self.name}.dict_offsets': offsets,
+            f'{self.name}.codes': self.codes,
+            f'{self.name}.rows': rows,
+            f'{self.name}.row_start': counts,
+        }
+
+
+def write_snapshot(path, columns, rows, integer_columns=()):
+    """把按排序键排好的行写成列式快照文件，先写临时文件再原子替换
+
+    columns: 列名列表；rows: 与列名顺序一致的元组，可以是逐行读取的游标；
+    integer_columns: 按整数数组存放的列，其余列按字典编码。
+    返回元数据字典。
+    """
+    start = time.perf_counter()
+    built = [_Column(name, name in integer_columns) for name in columns]
+    count = 0
+    for row in rows:
+        for column, value in zip(built, row):
+            column.append(value)
+        count += 1
+
+    meta = {
+        'version': FORMAT_VERSION,
+        'byteorder': sys.byteorder,
+        'snapshot_id': uuid.uuid4().hex,
+        'created_at': time.time(),
+        'rows': count,
+        'columns': [{'name': column.name, 'integer': column.integer,
+                     'distinct': None if column.integer else len(column.dictionary)} for column in built],
+        'sections': {},
+    }
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.major_snapshot.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC)
+            for column in built:
+                for name, data in column.sections().items():
+                    # 各段按 8 字节对齐，便于直接映射为数组
+                    f.write(b'\0' * (-f.tell() % 8))
+                    offset = f.tell()
+                    raw = data.tobytes() if isinstance(data, array) else bytes(data)
+                    f.write(raw)
+                    meta['sections'][name] = [offset, len(raw), data.typecode if isinstance(data, array) else 'B']
+            meta_offset = f.tell()
+            raw_meta = json.dumps(meta, ensure_ascii=False).encode('utf-8')
+            f.write(raw_meta)
+            f.write(_FOOTER.pack(meta_offset, len(raw_meta), MAGIC))
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    meta['build_seconds'] = round(time.perf_counter() - start, 2)
+    return meta
+
+
+class MajorSnapshot:
+    """major_infos 的列式快照（只读，内存映射）
+
+    行按 batch_name, college_code, major_code, id 排序存放，行号顺序即查询结果顺序。
+    字符串列字典编码：过滤时只对不重复的取值做 LIKE 匹配，再取出命中取值的行号。
+    各 worker 映射同一个文件，行数据由操作系统页缓存共享，进程内只保留各列的取值字典。
+    与 MajorIndex 提供相同的 search、page、facets 接口。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            meta_offset, meta_length, magic = _FOOTER.unpack_from(self._mm, len(self._mm) - _FOOTER.size)
+            if magic != MAGIC or self._mm[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} 不是专业快照文件")
+            self.meta = json.loads(self._mm[meta_offset:meta_offset + meta_length].decode('utf-8'))
+            if self.meta['version'] != FORMAT_VERSION or self.meta['byteorder'] != sys.byteorder:
+                raise ValueError(f"{path} 的格式版本或字节序与当前程序不符，请重新生成")
+        except Exception:
+            self.close()
+            raise
+        self._inode = os.fstat(self._file.fileno()).st_ino
+        self._checked_at = time.monotonic()
+        view = memoryview(self._mm)
+        self._views = [view]
+        sections = {}
+        for name, (offset, length, typecode) in self.meta['sections'].items():
+            section = view[offset:offset + length]
+            if typecode != 'B':
+                section = section.cast(typecode)
+            self._views.append(section)
+            sections[name] = section
+
+        self.columns = [column['name'] for column in self.meta['columns']]
+        self._integer = {column['name'] for column in self.meta['columns'] if column['integer']}
+        self._values = {name: sections[name] for name in self._integer}
+        self._codes = {}
+        self._rows = {}
+        self._row_start = {}
+        self._dictionary = {}
+        self._folded = {}
+        for name in self.columns:
+            if name in self._integer:
+                continue
+            self._codes[name] = sections[f'{name}.codes']
+            self._rows[name] = sections[f'{name}.rows']
+            self._row_start[name] = sections[f'{name}.row_start']
+            data, offsets = sections[f'{name}.dict_data'], sections[f'{name}.dict_offsets']
+            values = [bytes(data[offsets[i]:offsets[i + 1]]).decode('utf-8') for i in range(len(offsets) - 1)]
+            self._dictionary[name] = values
+            self._folded[name] = [value.casefold() for value in values]
+        self.snapshot_id = self.meta['snapshot_id']
+        self.built_at = self.meta['created_at']
+        self._eligibility = None
+
+    def close(self):
+        for view in reversed(getattr(self, '_views', ())):
+            view.release()
+        self._views = []
+        if getattr(self, '_mm', None) is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+    def __len__(self):
+        return self.meta['rows']
+
+    def replaced(self):
+        """快照文件是否已被新文件替换（每秒最多检查一次）"""
+        now = time.monotonic()
+        if now - self._checked_at < REPLACED_CHECK_INTERVAL:
+            return False
+        self._checked_at = now
+        try:
+            return os.stat(self.path).st_ino != self._inode
+        except FileNotFoundError:
+            return False
+
+    @property
+    def subject_eligibility(self):
+        """选科要求编码，首次按选考科目筛选时由两列的编码生成（每种取值只解析一次）"""
+        if self._eligibility is None:
+            self._eligibility = SubjectEligibility(zip(*(self._iter_text(column) for column in REQUIREMENT_COLUMNS)))
+        return self._eligibility
+
+    def _iter_text(self, column):
+        values = self._dictionary[column]
+        for code in self._codes[column]:
+            yield None if code == NULL_CODE else values[code]
+
+    def _value(self, column, pos):
+        if column in self._integer:
+            value = self._values[column][pos]
+            return None if value == NULL_INT else value
+        code = self._codes[column][pos]
+        return None if code == NULL_CODE else self._dictionary[column][code]
+
+    def _matching_codes(self, column, query):
+        _, match = like_matcher(query)
+        return [code for code, value in enumerate(self._folded[column]) if match(value)]
+
+    def search(self, filters):
+        """按 {列名: 查询串} 做子串过滤（与 LIKE '%查询串%' 一致），返回有序行号"""
+        # 每个条件先换算成命中的编码及行数，从命中行数最少的条件取行号，其余条件按编码校验
+        conditions = []
+        for column, query in filters.items():
+            if not query:
+                continue
+            if column in self._integer:
+                _, match = like_matcher(query)
+                conditions.append((None, column, match))
+                continue
+            codes = self._matching_codes(column, query)
+            if not codes:
+                return []
+            row_start = self._row_start[column]
+            size = sum(row_start[code + 1] - row_start[code] for code in codes)
+            conditions.append((size, column, codes))
+
+        coded = sorted((condition for condition in conditions if condition[0] is not None), key=lambda c: c[0])
+        if not coded:
+            positions = range(len(self))
+        else:
+            _, column, codes = coded[0]
+            rows, row_start = self._rows[column], self._row_start[column]
+            if len(codes) == 1:
+                positions = rows[row_start[codes[0]]:row_start[codes[0] + 1]].tolist()
+            else:
+                positions = sorted(pos for code in codes for pos in rows[row_start[code]:row_start[code + 1]])
+        for _, column, codes in coded[1:]:
+            column_codes = self._codes[column]
+            wanted = set(codes)
+            positions = [pos for pos in positions if column_codes[pos] in wanted]
+        for _, column, match in (condition for condition in conditions if condition[0] is None):
+            values = self._values[column]
+            positions = [pos for pos in positions if values[pos] != NULL_INT and match(str(values[pos]))]
+        return positions
+
+    def lookup_codes(self, keys):
+        """按 (院校专业组代码, 专业代号) 精确查找，键为小写化后的代码，返回 {键: [行]}
+
+        先按院校专业组代码的取值取出整组行号，再在组内比对专业代号。
+        """
+        college_codes = {}
+        for code, value in enumerate(self._folded['college_code']):
+            college_codes.setdefault(value, []).append(code)
+        rows, row_start = self._rows['college_code'], self._row_start['college_code']
+        major_codes, major_folded = self._codes['major_code'], self._folded['major_code']
+        found = {}
+        for key in keys:
+            college_code, major_code = key
+            positions = sorted(pos for code in college_codes.get(college_code, ())
+                               for pos in rows[row_start[code]:row_start[code + 1]]
+                               if major_codes[pos] != NULL_CODE and major_folded[major_codes[pos]] == major_code)
+            if positions:
+                found[key] = self.page(positions, 0, len(positions))
+        return found
+
+    def facets(self, positions, columns):
+        result = {}
+        for column in columns:
+            if column in self._integer:
+                counter = Counter(self._value(column, pos) for pos in positions)
+            else:
+                codes = self._codes[column]
+                if isinstance(positions, range) and len(positions) == len(self):
+                    # 不过滤时各取值的行数即分组长度
+                    row_start = self._row_start[column]
+                    counter = Counter({code: row_start[code + 1] - row_start[code]
+                                       for code in range(len(row_start) - 1)})
+                    nulls = len(self) - row_start[-1]
+                    if nulls:
+                        counter[NULL_CODE] = nulls
+                else:
+                    counter = Counter(codes[pos] for pos in positions)
+                dictionary = self._dictionary[column]
+                counter = Counter({None if code == NULL_CODE else dictionary[code]: count
+                                   for code, count in counter.items()})
+            result[column] = [{'value': value, 'count': count} for value, count in counter.most_common()]
+        return result
+
+    def page(self, positions, offset, limit):
+        return [{column: self._value(column, pos) for column in self.columns}
+                for pos in positions[offset:offset + limit]]
+
+    def stats(self):
+        return {
+            'path': self.path,
+            'rows': len(self),
+            'file_bytes': len(self._mm),
+            'created_at': self.built_at,
+            'columns': {column['name']: column['distinct'] for column in self.meta['columns']},
+        }
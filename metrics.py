@@ -0,0 +1,263 @@
+import atexit
+import contextvars
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# 请求耗时与单个请求内数据库耗时的桶上限（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 单个请求内 SQL 条数的桶上限
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50)
+
+# 指标名 -> (类型, 说明, 桶上限)
+METRICS = {
+    'ziyuan_http_requests_total': ('counter', '按路由与状态码统计的请求数', None),
+    'ziyuan_http_request_duration_seconds': ('histogram', '按路由与状态码统计的请求耗时', LATENCY_BUCKETS),
+    'ziyuan_http_requests_in_flight': ('gauge', '正在处理的请求数', None),
+    'ziyuan_request_db_seconds': ('histogram', '单个请求内执行 SQL 的总耗时', LATENCY_BUCKETS),
+    'ziyuan_request_db_queries': ('histogram', '单个请求内执行的 SQL 条数', QUERY_COUNT_BUCKETS),
+    'ziyuan_db_queries_total': ('counter', '执行的 SQL 总条数（含后台线程与流式导出）', None),
+    'ziyuan_db_query_seconds_total': ('counter', '执行 SQL 的总耗时', None),
+    'ziyuan_export_bytes_total': ('counter', '导出 CSV 输出的字节数', None),
+    'ziyuan_exports_total': ('counter', '导出次数，source 区分缓存与实时查询', None),
+    'ziyuan_admission_rejected_total': ('counter', '准入控制拒绝的请求数，reason 为 rate、queue_full 或 timeout', None),
+}
+
+# 当前请求累计的 [SQL 条数, SQL 耗时]；线程与异步任务各自独立，
+# asyncio.gather 派生的子任务共享同一个列表
+_current_request = contextvars.ContextVar('metrics_request', default=None)
+
+
+def _labels_text(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metrics:
+    """Prometheus 文本格式的指标收集器
+
+    每个线程写自己的分片（普通 dict，无锁），抓取时再合并所有分片；
+    已结束线程的分片并入 _retired，线程按请求创建时分片数不会一直增长。
+    设置 directory 后，每个 worker 定期把合并结果写入 metrics_<pid>.json，
+    抓取时汇总目录下所有 worker 的文件：计数器与直方图保留已退出 worker 的值，
+    仪表只统计仍在运行的 worker。
+    """
+
+    def __init__(self, directory=None, flush_interval=5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []  # [(线程, 分片)]
+        self._retired = self._new_shard()
+        self._last_flush = 0.0
+        # fork 出的 worker 从零开始计数，不继承主进程已有的值
+        os.register_at_fork(after_in_child=self._reset)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            atexit.register(self.flush)
+
+    def _reset(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._retired = self._new_shard()
+        self._last_flush = 0.0
+
+    @staticmethod
+    def _new_shard():
+        return {'counter': {}, 'gauge': {}, 'histogram': {}}
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = self._new_shard()
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def inc(self, name, labels=(), value=1):
+        """计数器或仪表加 value，labels 为 ((标签名, 值), ...)"""
+        values = self._shard()[METRICS[name][0]]
+        key = (name, labels)
+        values[key] = values.get(key, 0) + value
+
+    def observe(self, name, value, labels=()):
+        buckets = METRICS[name][2]
+        values = self._shard()['histogram']
+        key = (name, labels)
+        histogram = values.get(key)
+        if histogram is None:
+            # [各桶计数（最后一个为 +Inf）, 总和, 次数]
+            histogram = values[key] = [[0] * (len(buckets) + 1), 0.0, 0]
+        histogram[0][bisect_left(buckets, value)] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+    # 请求开始时调用，返回的令牌交给 end_request
+    def begin_request(self):
+        self.inc('ziyuan_http_requests_in_flight')
+        return _current_request.set([0, 0.0])
+
+    def end_request(self, token, endpoint, status, duration):
+        queries, db_seconds = _current_request.get() or (0, 0.0)
+        _current_request.reset(token)
+        self.inc('ziyuan_http_requests_in_flight', value=-1)
+        labels = (('endpoint', endpoint), ('status', str(status)))
+        self.inc('ziyuan_http_requests_total', labels)
+        self.observe('ziyuan_http_request_duration_seconds', duration, labels)
+        endpoint_label = (('endpoint', endpoint),)
+        self.observe('ziyuan_request_db_queries', queries, endpoint_label)
+        self.observe('ziyuan_request_db_seconds', db_seconds, endpoint_label)
+        if self.directory and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def record_query(self, seconds):
+        """记录一条 SQL 的耗时，请求内执行的同时计入当前请求"""
+        self.inc('ziyuan_db_queries_total')
+        self.inc('ziyuan_db_query_seconds_total', value=seconds)
+        current = _current_request.get()
+        if current is not None:
+            current[0] += 1
+            current[1] += seconds
+
+    def instrument_cursor(self, cursor):
+        """替换游标实例的 execute，记录每条 SQL 的耗时（executemany 内部也经过 execute）"""
+        execute = cursor.execute
+
+        def timed_execute(query, args=None):
+            start = time.perf_counter()
+            try:
+                return execute(query, args)
+            finally:
+                self.record_query(time.perf_counter() - start)
+
+        cursor.execute = timed_execute
+        return cursor
+
+    def count_export(self, body, source):
+        """统计导出字节数；body 为完整内容或分块生成器，生成器按实际输出的块计数"""
+        self.inc('ziyuan_exports_total', (('source', source),))
+        if isinstance(body, bytes):
+            self.inc('ziyuan_export_bytes_total', value=len(body))
+            return body
+        return self._count_chunks(body)
+
+    def _count_chunks(self, chunks):
+        for chunk in chunks:
+            self.inc('ziyuan_export_bytes_total', value=len(chunk))
+            yield chunk
+
+    def snapshot(self):
+        """合并所有线程的分片，返回 {类型: {(指标名, 标签): 值}}"""
+        with self._lock:
+            shards = list(self._shards)
+            alive = [(thread, shard) for thread, shard in shards if thread.is_alive()]
+            for thread, shard in shards:
+                if not thread.is_alive():
+                    self._merge(self._retired, shard)
+            self._shards = alive
+            merged = self._new_shard()
+            self._merge(merged, self._retired)
+        for _, shard in alive:
+            self._merge(merged, shard)
+        return merged
+
+    @staticmethod
+    def _merge(target, shard):
+        # dict.copy 在持有 GIL 时完成，其他线程同时写入也不会出错
+        for kind in ('counter', 'gauge'):
+            values = target[kind]
+            for key, value in shard[kind].copy().items():
+                values[key] = values.get(key, 0) + value
+        histograms = target['histogram']
+        for key, (buckets, total, count) in shard['histogram'].copy().items():
+            merged = histograms.get(key)
+            if merged is None:
+                histograms[key] = [list(buckets), total, count]
+            else:
+                merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+                merged[1] += total
+                merged[2] += count
+
+    def flush(self):
+        """把本进程的指标写入共享目录（先写临时文件再替换，读取方不会看到写了一半的文件）"""
+        if not self.directory:
+            return
+        self._last_flush = time.monotonic()
+        snapshot = self.snapshot()
+        data = {kind: [[name, [list(pair) for pair in labels], value] for (name, labels), value in values.items()]
+                for kind, values in snapshot.items()}
+        path = os.path.join(self.directory, f'metrics_{os.getpid()}.json')
+        try:
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            logging.error(f"写入指标文件失败: {e}")
+
+    def collect(self):
+        """汇总所有 worker 的指标；未设置共享目录时只有本进程"""
+        if not self.directory:
+            return self.snapshot()
+        self.flush()
+        merged = self._new_shard()
+        for path in glob.glob(os.path.join(self.directory, 'metrics_*.json')):
+            try:
+                pid = int(os.path.basename(path)[len('metrics_'):-len('.json')])
+                with open(path, encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            shard = {kind: {(name, tuple(tuple(pair) for pair in labels)): value
+                            for name, labels, value in data.get(kind, ())}
+                     for kind in ('counter', 'gauge', 'histogram')}
+            if not _pid_alive(pid):
+                shard['gauge'] = {}
+            self._merge(merged, shard)
+        return merged
+
+    def render(self):
+        """Prometheus 文本格式（text/plain; version=0.0.4）"""
+        collected = self.collect()
+        lines = []
+        for name, (kind, help_text, buckets) in METRICS.items():
+            series = sorted((labels, value) for (metric, labels), value in collected[kind].items() if metric == name)
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            if kind != 'histogram':
+                for labels, value in series or [((), 0)]:
+                    lines.append(f'{name}{_labels_text(labels)} {_format_value(value)}')
+                continue
+            for labels, (counts, total, count) in series:
+                cumulative = 0
+                for bound, bucket_count in zip(buckets + (float('inf'),), counts):
+                    cumulative += bucket_count
+                    le = '+Inf' if bound == float('inf') else _format_value(bound)
+                    lines.append(f'{name}_bucket{_labels_text(labels, (("le", le),))} {cumulative}')
+                lines.append(f'{name}_sum{_labels_text(labels)} {_format_value(total)}')
+                lines.append(f'{name}_count{_labels_text(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _pid_alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
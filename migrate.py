@@ -0,0 +1,242 @@
+"""数据库结构迁移工具
+
+用法：
+    python migrate.py status                 # 查看已执行与待执行的迁移
+    python migrate.py up [--benchmark]       # 执行全部待执行迁移，--benchmark 记录前后 EXPLAIN 与耗时
+    python migrate.py down 0001              # 回滚指定版本
+    python migrate.py benchmark              # 只对当前结构跑一次查询基准
+
+迁移文件位于 migrations/，命名为 <版本号>_<说明>.sql，
+用 "-- migrate:up" 与 "-- migrate:down" 分隔执行与回滚语句。
+已执行的版本记录在 schema_migrations 表中。
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import statistics
+import sys
+import time
+from datetime import datetime
+
+import pymysql
+
+from app import (
+    DB_CONFIG, MAJOR_ORDER_BY, MAJOR_SORT_COLUMNS, build_major_conditions, get_major_filters, major_code_lookup_query,
+)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+REPORTS_DIR = os.path.join(MIGRATIONS_DIR, 'reports')
+MIGRATION_FILE = re.compile(r'^(\d+)_([\w-]+)\.sql$')
+
+
+def connect():
+    return pymysql.connect(**dict(DB_CONFIG, autocommit=True))
+
+
+def load_migrations():
+    """读取迁移文件，返回按版本排序的 [(版本, 名称, up 语句列表, down 语句列表)]"""
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = MIGRATION_FILE.match(filename)
+        if not match:
+            continue
+        with open(os.path.join(MIGRATIONS_DIR, filename), encoding='utf-8') as f:
+            text = f.read()
+        sections = {'up': [], 'down': []}
+        current = None
+        for line in text.splitlines():
+            marker = re.match(r'^--\s*migrate:(up|down)\s*$', line.strip())
+            if marker:
+                current = marker.group(1)
+            elif current and not line.strip().startswith('--'):
+                sections[current].append(line)
+        migrations.append((
+            match.group(1), match.group(2),
+            split_statements('\n'.join(sections['up'])),
+            split_statements('\n'.join(sections['down'])),
+        ))
+    return migrations
+
+
+def split_statements(sql):
+    return [statement.strip() for statement in re.split(r';\s*(?:\n|$)', sql) if statement.strip()]
+
+
+def ensure_version_table(cursor):
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        " version VARCHAR(20) NOT NULL PRIMARY KEY,"
+        " name VARCHAR(255) NOT NULL,"
+        " applied_at DATETIME NOT NULL,"
+        " duration FLOAT NOT NULL"
+        ") ENGINE = InnoDB CHARACTER SET = utf8mb4"
+    )
+
+
+def applied_versions(cursor):
+    ensure_version_table(cursor)
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row['version'] for row in cursor.fetchall()}
+
+
+def benchmark_queries(cursor):
+    """取实际数据中的取值，构造与应用相同的查询语句"""
+    cursor.execute(f"SELECT * FROM major_infos ORDER BY {MAJOR_ORDER_BY} LIMIT 1 OFFSET 100")
+    sample = cursor.fetchone() or {}
+    cursor.execute("SELECT total_score FROM score_table WHERE total_score IS NOT NULL LIMIT 1")
+    score = cursor.fetchone()
+
+    filter_sets = {
+        'unfiltered': {},
+        'batch': {'batch_name_query': sample.get('batch_name', '')},
+        'college_name': {'college_name_query': (sample.get('college_name') or '')[:4]},
+        'major_name': {'major_name_query': (sample.get('major_name') or '')[:2]},
+    }
+    # 全文索引存在时，名称查询额外测一组 FULLTEXT_SEARCH 模式的语句
+    cursor.execute("SHOW INDEX FROM major_infos WHERE Key_name = 'ft_major_names'")
+    modes = [('', False)] + ([('fulltext_', True)] if cursor.fetchall() else [])
+
+    queries = []
+    for label, values in filter_sets.items():
+        for prefix, fulltext in modes:
+            if fulltext and not ('college_name_query' in values or 'major_name_query' in values):
+                continue
+            conditions, params = build_major_conditions(get_major_filters(values), fulltext=fulltext)
+            where = " WHERE " + " AND ".join(conditions) if conditions else ""
+            queries.append((f'{prefix}{label}:count', f"SELECT COUNT(*) as count FROM major_infos{where}", tuple(params)))
+            queries.append((f'{prefix}{label}:page',
+                            f"SELECT * FROM major_infos{where} ORDER BY {MAJOR_ORDER_BY} LIMIT %s OFFSET %s",
+                            tuple(params) + (20, 0)))
+    queries.append(('unfiltered:deep_page', f"SELECT * FROM major_infos ORDER BY {MAJOR_ORDER_BY} LIMIT %s OFFSET %s",
+                    (20, 20000)))
+    if sample:
+        seek = f"({MAJOR_ORDER_BY}) > ({', '.join(['%s'] * len(MAJOR_SORT_COLUMNS))})"
+        queries.append(('unfiltered:keyset_page',
+                        f"SELECT * FROM major_infos WHERE {seek} ORDER BY {MAJOR_ORDER_BY} LIMIT %s",
+                        tuple(sample[column] for column in MAJOR_SORT_COLUMNS) + (20,)))
+    if sample:
+        queries.append(('volunteer_check:lookup', *major_code_lookup_query([(sample['college_code'], sample['major_code'])])))
+    if score:
+        queries.append(('score_rank:count', "SELECT COUNT(*) as score_rank FROM score_table WHERE total_score > %s",
+                        (score['total_score'],)))
+    return queries
+
+
+def run_benchmark(cursor, repeat=5):
+    """对每条查询记录 EXPLAIN 输出与多次执行的耗时中位数（毫秒）"""
+    results = {}
+    for label, sql, params in benchmark_queries(cursor):
+        cursor.execute("EXPLAIN " + sql, params)
+        explain = cursor.fetchall()
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            cursor.execute(sql, params)
+            cursor.fetchall()
+            timings.append((time.perf_counter() - start) * 1000)
+        results[label] = {
+            'sql': sql,
+            'explain': explain,
+            'median_ms': round(statistics.median(timings), 3),
+            'min_ms': round(min(timings), 3),
+        }
+        logging.info(f"{label}: {results[label]['median_ms']} ms, "
+                     f"type={explain[0].get('type')}, key={explain[0].get('key')}, rows={explain[0].get('rows')}")
+    return results
+
+
+def save_report(report, tag):
+    os.makedirs(REPORTS_DIR, exist_ok=True)
+    path = os.path.join(REPORTS_DIR, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{tag}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+    logging.info(f"基准报告已保存: {path}")
+
+
+def compare(before, after):
+    for label, result in after.items():
+        if label in before:
+            old, new = before[label]['median_ms'], result['median_ms']
+            speedup = old / new if new else float('inf')
+            logging.info(f"{label}: {old} ms -> {new} ms ({speedup:.1f}x)")
+
+
+def cmd_status(cursor):
+    applied = applied_versions(cursor)
+    for version, name, _, _ in load_migrations():
+        logging.info(f"{version} {name}: {'已执行' if version in applied else '待执行'}")
+
+
+def cmd_up(cursor, target=None, benchmark=False):
+    applied = applied_versions(cursor)
+    pending = [m for m in load_migrations() if m[0] not in applied and (target is None or m[0] <= target)]
+    if not pending:
+        logging.info("没有待执行的迁移")
+        return
+    before = run_benchmark(cursor) if benchmark else None
+    for version, name, up, _ in pending:
+        logging.info(f"执行迁移 {version} {name}")
+        start = time.perf_counter()
+        for statement in up:
+            logging.info(f"  {statement}")
+            cursor.execute(statement)
+        duration = time.perf_counter() - start
+        cursor.execute(
+            "INSERT INTO schema_migrations (version, name, applied_at, duration) VALUES (%s, %s, %s, %s)",
+            (version, name, datetime.now(), duration)
+        )
+        logging.info(f"迁移 {version} 完成，耗时 {duration:.2f} 秒")
+    if benchmark:
+        after = run_benchmark(cursor)
+        compare(before, after)
+        save_report({'migrations': [m[0] for m in pending], 'before': before, 'after': after},
+                    f"up_{pending[-1][0]}")
+
+
+def cmd_down(cursor, version):
+    applied = applied_versions(cursor)
+    migrations = {m[0]: m for m in load_migrations()}
+    if version not in migrations or version not in applied:
+        raise SystemExit(f"版本 {version} 不存在或尚未执行")
+    _, name, _, down = migrations[version]
+    if not down:
+        raise SystemExit(f"版本 {version} 没有回滚语句")
+    logging.info(f"回滚迁移 {version} {name}")
+    for statement in down:
+        logging.info(f"  {statement}")
+        cursor.execute(statement)
+    cursor.execute("DELETE FROM schema_migrations WHERE version=%s", (version,))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="数据库结构迁移")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('status', help="查看迁移状态")
+    up_parser = subparsers.add_parser('up', help="执行待执行的迁移")
+    up_parser.add_argument('--target', help="执行到指定版本为止")
+    up_parser.add_argument('--benchmark', action='store_true', help="记录迁移前后的 EXPLAIN 与查询耗时")
+    down_parser = subparsers.add_parser('down', help="回滚指定版本")
+    down_parser.add_argument('version')
+    subparsers.add_parser('benchmark', help="对当前结构运行查询基准")
+    args = parser.parse_args(argv)
+
+    connection = connect()
+    try:
+        with connection.cursor() as cursor:
+            if args.command == 'status':
+                cmd_status(cursor)
+            elif args.command == 'up':
+                cmd_up(cursor, args.target, args.benchmark)
+            elif args.command == 'down':
+                cmd_down(cursor, args.version)
+            else:
+                save_report({'results': run_benchmark(cursor)}, 'benchmark')
+    finally:
+        connection.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,14 @@
+-- 查询列索引
+-- college_major 的 ORDER BY batch_name, college_code, major_code（InnoDB 二级索引自带主键 id，键集分页的 id 末位同样可用）
+-- college_name / major_name 的 ngram 全文索引，供 FULLTEXT_SEARCH 模式使用
+-- score_table.total_score 索引，供排名统计使用
+
+-- migrate:up
+ALTER TABLE `major_infos` ADD INDEX `idx_major_sort` (`batch_name`, `college_code`, `major_code`);
+ALTER TABLE `major_infos` ADD FULLTEXT INDEX `ft_major_names` (`college_name`, `major_name`) WITH PARSER ngram;
+ALTER TABLE `score_table` ADD INDEX `idx_total_score` (`total_score`);
+
+-- migrate:down
+ALTER TABLE `score_table` DROP INDEX `idx_total_score`;
+ALTER TABLE `major_infos` DROP INDEX `ft_major_names`;
+ALTER TABLE `major_infos` DROP INDEX `idx_major_sort`;
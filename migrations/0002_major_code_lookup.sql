@@ -0,0 +1,7 @@
+-- 志愿表批量检查按 (college_code, major_code) 精确查找，排序索引以 batch_name 开头用不上
+
+-- migrate:up
+ALTER TABLE `major_infos` ADD INDEX `idx_major_codes` (`college_code`, `major_code`);
+
+-- migrate:down
+ALTER TABLE `major_infos` DROP INDEX `idx_major_codes`;
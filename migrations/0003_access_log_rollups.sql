@@ -0,0 +1,30 @@
+-- access_logs 按分钟与按小时的汇总表，及汇总进度（已处理的最大 id）
+-- latency_sketch 为对数分桶的耗时计数（JSON），可逐桶相加合并，用于估算 p95/p99
+-- access_logs 添加 access_time 索引，按保留期限清理时不必扫描全表
+
+-- migrate:up
+CREATE TABLE `access_log_rollup_minute` (
+  `bucket_start` datetime NOT NULL,
+  `endpoint` varchar(100) NOT NULL,
+  `request_count` int NOT NULL,
+  `client_error_count` int NOT NULL COMMENT '4xx 响应数',
+  `error_count` int NOT NULL COMMENT '5xx 响应数',
+  `total_time` double NOT NULL COMMENT 'process_time 之和（秒）',
+  `max_time` float NOT NULL,
+  `latency_sketch` text NOT NULL,
+  PRIMARY KEY (`bucket_start`, `endpoint`)
+) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_0900_ai_ci;
+CREATE TABLE `access_log_rollup_hour` LIKE `access_log_rollup_minute`;
+CREATE TABLE `access_log_rollup_state` (
+  `name` varchar(50) NOT NULL,
+  `last_id` bigint NOT NULL,
+  `updated_at` datetime NOT NULL,
+  PRIMARY KEY (`name`)
+) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_0900_ai_ci;
+ALTER TABLE `access_logs` ADD INDEX `idx_access_time` (`access_time`);
+
+-- migrate:down
+ALTER TABLE `access_logs` DROP INDEX `idx_access_time`;
+DROP TABLE `access_log_rollup_state`;
+DROP TABLE `access_log_rollup_hour`;
+DROP TABLE `access_log_rollup_minute`;
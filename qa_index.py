@@ -0,0 +1,340 @@
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import tempfile
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from operator import itemgetter
+
+# 文件末尾的定位信息：元数据 JSON 的偏移与长度、魔数
+MAGIC = b'ZYQAIDX1'
+_FOOTER = struct.Struct('<QQ8s')
+FORMAT_VERSION = 1
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# 单字查询按前缀展开成以该字开头的二元组，最多取文档数最多的这么多个
+PREFIX_EXPANSION_LIMIT = 32
+
+_TOKEN = re.compile(r'[\u3400-\u9fff\uf900-\ufaff]+|[a-z0-9]+')
+
+
+def tokenize(text):
+    """分词：连续汉字切成重叠二元组（单个汉字保留单字），字母数字按整词，统一小写"""
+    tokens = []
+    for run in _TOKEN.findall(text.casefold()):
+        if run[0].isascii() or len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class _Blob:
+    """字符串表：utf-8 内容依次拼接，另存 n+1 个偏移"""
+
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = array('Q', [0])
+
+    def add(self, text):
+        self.data += (text or '').encode('utf-8')
+        self.offsets.append(len(self.data))
+        return len(self.offsets) - 2
+
+
+def write_index(path, universities, documents):
+    """由数据库数据生成索引文件，先写临时文件再原子替换
+
+    universities: [(id, 名称)]
+    documents: 按 university_id、question_id 排序的
+        (answer_id, question_id, 问题, 回答来源, 回答内容, university_id)
+    返回元数据字典。
+    """
+    start = time.perf_counter()
+    universities = sorted(universities)
+    uni_index = {uni_id: i for i, (uni_id, _) in enumerate(universities)}
+    uni_names = _Blob()
+    for _, name in universities:
+        uni_names.add(name)
+    uni_ids = array('I', (uni_id for uni_id, _ in universities))
+    uni_doc_start = array('I', [0] * (len(universities) + 1))
+
+    questions = _Blob()
+    question_ids = array('I')
+    sources = _Blob()
+    contents = _Blob()
+    doc_answer_ids = array('I')
+    doc_question = array('I')
+    doc_lengths = array('I')
+    postings = {}  # 词 -> (文档号数组, 词频数组)，文档按顺序加入，天然有序
+
+    last_question = None
+    last_uni = -1
+    for answer_id, question_id, question, source, content, university_id in documents:
+        uni = uni_index.get(university_id)
+        if uni is None:
+            continue
+        if uni < last_uni:
+            raise ValueError("documents 需按 university_id 排序")
+        doc = len(doc_answer_ids)
+        # 之前出现过的大学到本校之间的文档区间
+        for i in range(last_uni + 1, uni + 1):
+            uni_doc_start[i] = doc
+        last_uni = uni
+        if question_id != last_question:
+            questions.add(question)
+            question_ids.append(question_id)
+            last_question = question_id
+        doc_answer_ids.append(answer_id)
+        doc_question.append(len(question_ids) - 1)
+        sources.add(source)
+        contents.add(content)
+
+        tokens = tokenize(f"{question}\n{content}")
+        doc_lengths.append(len(tokens))
+        for term, tf in Counter(tokens).items():
+            entry = postings.get(term)
+            if entry is None:
+                entry = postings[term] = (array('I'), array('H'))
+            entry[0].append(doc)
+            entry[1].append(min(tf, 65535))
+    doc_count = len(doc_answer_ids)
+    for i in range(last_uni + 1, len(universities) + 1):
+        uni_doc_start[i] = doc_count
+
+    # 词典按 utf-8 字节序排列，与查询时的二分比较一致
+    terms = sorted(postings, key=lambda term: term.encode('utf-8'))
+    term_blob = _Blob()
+    term_start = array('Q', [0])
+    posting_docs = array('I')
+    posting_tfs = array('H')
+    for term in terms:
+        docs, tfs = postings.pop(term)
+        term_blob.add(term)
+        posting_docs.extend(docs)
+        posting_tfs.extend(tfs)
+        term_start.append(len(posting_docs))
+
+    avgdl = sum(doc_lengths) / doc_count if doc_count else 0.0
+    # 预先算好 BM25 的文档长度归一项 k1 * (1 - b + b * dl / avgdl)
+    norms = array('f', (BM25_K1 * (1 - BM25_B + BM25_B * length / avgdl) if avgdl else BM25_K1
+                        for length in doc_lengths))
+
+    sections = {
+        'term_data': term_blob.data, 'term_offsets': term_blob.offsets, 'term_start': term_start,
+        'posting_docs': posting_docs, 'posting_tfs': posting_tfs, 'norms': norms,
+        'doc_answer_ids': doc_answer_ids, 'doc_question': doc_question,
+        'source_data': sources.data, 'source_offsets': sources.offsets,
+        'content_data': contents.data, 'content_offsets': contents.offsets,
+        'question_ids': question_ids, 'question_data': questions.data, 'question_offsets': questions.offsets,
+        'uni_ids': uni_ids, 'uni_doc_start': uni_doc_start,
+        'uni_name_data': uni_names.data, 'uni_name_offsets': uni_names.offsets,
+    }
+    meta = {
+        'version': FORMAT_VERSION,
+        'byteorder': sys.byteorder,
+        'created_at': time.time(),
+        'documents': doc_count,
+        'questions': len(question_ids),
+        'universities': len(universities),
+        'terms': len(terms),
+        'postings': len(posting_docs),
+        'avgdl': avgdl,
+        'k1': BM25_K1,
+        'b': BM25_B,
+        'sections': {},
+    }
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.qa_index.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC)
+            for name, data in sections.items():
+                # 各段按 8 字节对齐，便于直接映射为数组
+                f.write(b'\0' * (-f.tell() % 8))
+                offset = f.tell()
+                raw = data.tobytes() if isinstance(data, array) else bytes(data)
+                f.write(raw)
+                meta['sections'][name] = [offset, len(raw), data.typecode if isinstance(data, array) else 'B']
+            meta_offset = f.tell()
+            raw_meta = json.dumps(meta, ensure_ascii=False).encode('utf-8')
+            f.write(raw_meta)
+            f.write(_FOOTER.pack(meta_offset, len(raw_meta), MAGIC))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    meta['build_seconds'] = round(time.perf_counter() - start, 2)
+    return meta
+
+
+class QAIndex:
+    """院校问答倒排索引（只读，内存映射）
+
+    每条回答为一篇文档，文本为问题加回答内容；按大学排序存放，
+    同一大学的文档号连续，按大学过滤时在倒排表上二分截取区间。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            meta_offset, meta_length, magic = _FOOTER.unpack_from(self._mm, len(self._mm) - _FOOTER.size)
+            if magic != MAGIC or self._mm[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} 不是问答索引文件")
+            self.meta = json.loads(self._mm[meta_offset:meta_offset + meta_length].decode('utf-8'))
+            if self.meta['version'] != FORMAT_VERSION or self.meta['byteorder'] != sys.byteorder:
+                raise ValueError(f"{path} 的格式版本或字节序与当前程序不符，请重新生成")
+        except Exception:
+            self.close()
+            raise
+        view = memoryview(self._mm)
+        self._views = [view]
+        for name, (offset, length, typecode) in self.meta['sections'].items():
+            section = view[offset:offset + length]
+            if typecode != 'B':
+                section = section.cast(typecode)
+            self._views.append(section)
+            setattr(self, '_' + name, section)
+        self.documents = self.meta['documents']
+        self.terms = self.meta['terms']
+        self.loaded_at = time.time()
+        self._uni_by_id = {uni_id: i for i, uni_id in enumerate(self._uni_ids)}
+        self._uni_by_name = {self._uni_name(i): i for i in range(len(self._uni_ids))}
+
+    def close(self):
+        for view in reversed(getattr(self, '_views', ())):
+            view.release()
+        self._views = []
+        if getattr(self, '_mm', None) is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+    def __len__(self):
+        return self.documents
+
+    @staticmethod
+    def _text(data, offsets, i):
+        return bytes(data[offsets[i]:offsets[i + 1]]).decode('utf-8')
+
+    def _uni_name(self, i):
+        return self._text(self._uni_name_data, self._uni_name_offsets, i)
+
+    def _term_bytes(self, i):
+        return bytes(self._term_data[self._term_offsets[i]:self._term_offsets[i + 1]])
+
+    def _lower_bound(self, key):
+        lo, hi = 0, self.terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term_bytes(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _df(self, term_id):
+        return self._term_start[term_id + 1] - self._term_start[term_id]
+
+    def _query_terms(self, query):
+        term_ids = []
+        for token in dict.fromkeys(tokenize(query)):
+            key = token.encode('utf-8')
+            if len(token) == 1 and not token.isascii():
+                # 单个汉字：utf-8 中 0xff 不会出现，[key, key+0xff) 即以该字开头的全部词
+                lo, hi = self._lower_bound(key), self._lower_bound(key + b'\xff')
+                expanded = sorted(range(lo, hi), key=self._df, reverse=True)[:PREFIX_EXPANSION_LIMIT]
+                term_ids.extend(expanded)
+            else:
+                i = self._lower_bound(key)
+                if i < self.terms and self._term_bytes(i) == key:
+                    term_ids.append(i)
+        return list(dict.fromkeys(term_ids))
+
+    def universities(self):
+        """[(id, 名称)]，按 id 排序"""
+        return [(self._uni_ids[i], self._uni_name(i)) for i in range(len(self._uni_ids))]
+
+    def university_index(self, university):
+        """按 id 或名称查找大学，找不到返回 None"""
+        if isinstance(university, int):
+            return self._uni_by_id.get(university)
+        university = str(university).strip()
+        if university.isdigit() and int(university) in self._uni_by_id:
+            return self._uni_by_id[int(university)]
+        return self._uni_by_name.get(university)
+
+    def search(self, query, university=None, k=10):
+        """BM25 检索，返回 (前 k 条结果, 命中文档数)；university 为 id 或名称"""
+        term_ids = self._query_terms(query)
+        if not term_ids:
+            return [], 0
+        doc_lo, doc_hi = 0, self.documents
+        if university is not None:
+            uni = self.university_index(university)
+            if uni is None:
+                return [], 0
+            doc_lo, doc_hi = self._uni_doc_start[uni], self._uni_doc_start[uni + 1]
+
+        docs, tfs, norms = self._posting_docs, self._posting_tfs, self._norms
+        scores = {}
+        get = scores.get
+        n = self.documents
+        for term_id in term_ids:
+            start, end = self._term_start[term_id], self._term_start[term_id + 1]
+            df = end - start
+            weight = math.log(1 + (n - df + 0.5) / (df + 0.5)) * (BM25_K1 + 1)
+            if university is not None:
+                start = bisect_left(docs, doc_lo, start, end)
+                end = bisect_left(docs, doc_hi, start, end)
+            for doc, tf in zip(docs[start:end], tfs[start:end]):
+                scores[doc] = get(doc, 0.0) + weight * tf / (tf + norms[doc])
+
+        top = heapq.nlargest(k, scores.items(), key=itemgetter(1))
+        return [self.document(doc, score, query) for doc, score in top], len(scores)
+
+    def document(self, doc, score=None, query=None):
+        question = self._doc_question[doc]
+        uni = bisect_left(self._uni_doc_start, doc + 1) - 1
+        content = self._text(self._content_data, self._content_offsets, doc)
+        return {
+            'answer_id': self._doc_answer_ids[doc],
+            'question_id': self._question_ids[question],
+            'university_id': self._uni_ids[uni],
+            'university': self._uni_name(uni),
+            'question': self._text(self._question_data, self._question_offsets, question),
+            'source': self._text(self._source_data, self._source_offsets, doc),
+            'content': content,
+            'snippet': snippet(content, query) if query else content[:120],
+            'score': round(score, 4) if score is not None else None,
+        }
+
+    def stats(self):
+        stats = {key: self.meta[key] for key in ('documents', 'questions', 'universities', 'terms', 'postings')}
+        stats.update(path=self.path, file_bytes=len(self._mm), created_at=self.meta['created_at'],
+                     loaded_at=self.loaded_at)
+        return stats
+
+
+def snippet(text, query, width=120):
+    """截取回答中第一处命中查询词附近的一段文字"""
+    folded = text.casefold()
+    positions = [folded.find(token) for token in tokenize(query)]
+    positions = [pos for pos in positions if pos >= 0]
+    if not positions or len(text) <= width:
+        return text[:width] + ('…' if len(text) > width else '')
+    start = max(0, min(positions) - width // 4)
+    end = min(len(text), start + width)
+    return ('…' if start else '') + text[start:end] + ('…' if end < len(text) else '')
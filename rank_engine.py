@@ -0,0 +1,50 @@
+import time
+from bisect import bisect_left, bisect_right
+
+SCORE_FIELDS = ('theory_score', 'practical_score', 'cultural_score', 'total_score')
+
+
+class RankEngine:
+    """score_table 的内存排名索引
+
+    总分升序数组上用二分查找计算名次：名次 = 总分高于本人的人数 + 1，
+    同分同名次（与原 COUNT(*) ... WHERE total_score > x 的结果一致）。
+    """
+
+    def __init__(self, rows):
+        self.built_at = time.time()
+        self._scores = sorted(row['total_score'] for row in rows if row.get('total_score') is not None)
+        self._by_name = {}
+        for row in rows:
+            self._by_name.setdefault(row['name'], []).append(
+                {field: row.get(field) for field in ('id',) + SCORE_FIELDS})
+
+    def __len__(self):
+        return len(self._scores)
+
+    def rank(self, score):
+        """总分对应的名次，同分并列"""
+        return len(self._scores) - bisect_right(self._scores, score) + 1
+
+    def percentile(self, score):
+        """总分低于该分数的考生占比（百分数，保留两位小数）"""
+        if not self._scores:
+            return 0.0
+        return round(bisect_left(self._scores, score) * 100 / len(self._scores), 2)
+
+    def tied(self, score):
+        """与该总分同分的人数"""
+        return bisect_right(self._scores, score) - bisect_left(self._scores, score)
+
+    def lookup(self, name):
+        """按姓名查询，重名时返回全部记录；未找到返回空列表"""
+        records = []
+        for row in self._by_name.get(name, ()):
+            record = dict(row, name=name)
+            score = row['total_score']
+            if score is None:
+                record.update(rank=None, percentile=None, tied=0)
+            else:
+                record.update(rank=self.rank(score), percentile=self.percentile(score), tied=self.tied(score))
+            records.append(record)
+        return records
@@ -0,0 +1,300 @@
+import hashlib
+import hmac
+import json
+import logging
+import os
+import pickle
+import struct
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+# 文件后端每条缓存的头部：过期时间（0 表示永不过期）
+_HEADER = struct.Struct('<d')
+# 头部之后为对“头部 + 数据”的 HMAC-SHA256 签名
+_MAC_SIZE = hashlib.sha256().digest_size
+
+
+class MemoryBackend:
+    """进程内缓存后端，按条数与字节数上限做 LRU 淘汰"""
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (data, expires_at)
+        self._bytes = 0
+        self._version = None
+        self._lock = threading.Lock()
+        self._stats = {'evictions': 0, 'expired': 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            data, expires_at = entry
+            if expires_at and expires_at < time.time():
+                self._remove(key)
+                self._stats['expired'] += 1
+                return None
+            self._entries.move_to_end(key)
+            return data
+
+    def set(self, key, data, ttl):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (data, time.time() + ttl if ttl else 0)
+            self._bytes += len(data)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._stats['evictions'] += 1
+
+    def _remove(self, key):
+        data, _ = self._entries.pop(key)
+        self._bytes -= len(data)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def read_version(self):
+        return self._version
+
+    def write_version(self, token):
+        self._version = token
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, backend='memory', entries=len(self._entries), bytes=self._bytes)
+
+
+class FileBackend:
+    """基于本地目录的缓存后端，多个 gunicorn worker 共享同一目录
+
+    每条缓存一个文件，写入先落临时文件再原子重命名；读取时更新 mtime，
+    淘汰时按 mtime 从旧到新删除，近似 LRU。
+    缓存内容会被 pickle 反序列化：目录必须归当前用户所有且不允许其他用户访问，
+    每条内容带 secret 的 HMAC 签名，签名不符的文件按未命中处理并删除。
+    """
+
+    def __init__(self, directory, secret, max_entries=4096, max_bytes=256 * 1024 * 1024, sweep_every=64):
+        if not secret:
+            raise ValueError("文件缓存需要签名密钥")
+        self.directory = directory
+        self._secret = secret.encode('utf-8') if isinstance(secret, str) else secret
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sweep_every = sweep_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._stats = {'evictions': 0, 'expired': 0}
+        # 缓存内容为 pickle 数据，目录仅允许当前用户访问；已存在的目录同样检查属主与权限
+        for path in (directory, os.path.join(directory, 'entries')):
+            os.makedirs(path, mode=0o700, exist_ok=True)
+            _check_private_dir(path)
+
+    def _path(self, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, 'entries', digest)
+
+    def _write(self, path, payload):
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                payload = f.read()
+        except FileNotFoundError:
+            return None
+        body = payload[_HEADER.size + _MAC_SIZE:]
+        if len(payload) < _HEADER.size + _MAC_SIZE or not hmac.compare_digest(
+                payload[_HEADER.size:_HEADER.size + _MAC_SIZE], self._sign(payload[:_HEADER.size], body)):
+            logging.warning(f"缓存文件签名不符，已删除: {path}")
+            self._unlink(path)
+            return None
+        (expires_at,) = _HEADER.unpack_from(payload)
+        if expires_at and expires_at < time.time():
+            self._unlink(path)
+            with self._lock:
+                self._stats['expired'] += 1
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return body
+
+    def _sign(self, header, data):
+        return hmac.new(self._secret, header + data, hashlib.sha256).digest()
+
+    def set(self, key, data, ttl):
+        if len(data) > self.max_bytes:
+            return
+        header = _HEADER.pack(time.time() + ttl if ttl else 0)
+        self._write(self._path(key), header + self._sign(header, data) + data)
+        with self._lock:
+            self._writes += 1
+            sweep = self._writes % self.sweep_every == 0
+        if sweep:
+            self.sweep()
+
+    def _unlink(self, path):
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def sweep(self):
+        """按 mtime 淘汰超出上限的条目，过期条目在读取时清理"""
+        entries_dir = os.path.join(self.directory, 'entries')
+        entries = []
+        for entry in os.scandir(entries_dir):
+            if entry.name.endswith('.tmp'):
+                continue
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, entry.path))
+        entries.sort()
+        total_bytes = sum(size for _, size, _ in entries)
+        evicted = 0
+        while entries and (len(entries) > self.max_entries or total_bytes > self.max_bytes):
+            _, size, path = entries.pop(0)
+            if self._unlink(path):
+                evicted += 1
+            total_bytes -= size
+        with self._lock:
+            self._stats['evictions'] += evicted
+        return evicted
+
+    def clear(self):
+        entries_dir = os.path.join(self.directory, 'entries')
+        for entry in os.scandir(entries_dir):
+            self._unlink(entry.path)
+
+    def read_version(self):
+        try:
+            with open(os.path.join(self.directory, 'VERSION'), 'r', encoding='utf-8') as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def write_version(self, token):
+        self._write(os.path.join(self.directory, 'VERSION'), token.encode('utf-8'))
+
+    def stats(self):
+        entries_dir = os.path.join(self.directory, 'entries')
+        sizes = [entry.stat().st_size for entry in os.scandir(entries_dir) if not entry.name.endswith('.tmp')]
+        with self._lock:
+            return dict(self._stats, backend='file', entries=len(sizes), bytes=sum(sizes))
+
+
+def _check_private_dir(path):
+    # 目录须为当前用户所有且组与其他用户没有任何权限，否则其他本地用户可以放入任意 pickle 数据
+    st = os.stat(path)
+    if hasattr(os, 'getuid') and st.st_uid != os.getuid():
+        raise PermissionError(f"缓存目录 {path} 不属于当前用户，拒绝使用")
+    if st.st_mode & 0o077:
+        raise PermissionError(f"缓存目录 {path} 的权限为 {oct(st.st_mode & 0o777)}，只允许当前用户访问（0700）")
+
+
+class VersionFile:
+    """保存在文件中的数据版本，同一台机器上的 worker 共享，与缓存后端无关
+
+    写入先落临时文件再原子重命名；读取时先比对文件的 inode 与 mtime，未变化时直接返回上次读到的版本。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._stat = None
+        self._token = None
+        self._lock = threading.Lock()
+
+    def read_version(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            if key != self._stat:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._token = f.read().strip() or None
+                self._stat = key
+            return self._token
+
+    def write_version(self, token):
+        tmp = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(token)
+        os.replace(tmp, self.path)
+
+
+class ResultCache:
+    """查询结果缓存
+
+    键中带有数据版本号，major_infos 重新加载后调用 bump_version，
+    旧版本的条目不再命中，随 TTL 与 LRU 自然淘汰。
+    传入 version_file 时数据版本保存在该文件中，否则保存在缓存后端。
+    """
+
+    def __init__(self, backend, ttl=300, version_file=None):
+        self.backend = backend
+        self.ttl = ttl
+        self.version_file = version_file
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0}
+
+    @staticmethod
+    def make_key(namespace, *parts):
+        return namespace + ':' + json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+
+    def data_version(self):
+        version = (self.version_file or self.backend).read_version()
+        if version is None:
+            version = self.bump_version()
+        return version
+
+    def bump_version(self):
+        """使所有已缓存结果失效，返回新的版本号"""
+        token = uuid.uuid4().hex[:12]
+        (self.version_file or self.backend).write_version(token)
+        logging.info(f"结果缓存数据版本更新为 {token}")
+        return token
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def get(self, key, version=None):
+        """读取缓存；version 为计算结果前取得的数据版本，省略时读取当前版本"""
+        data = self.backend.get(f'{version or self.data_version()}|{key}')
+        if data is None:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return pickle.loads(data)
+
+    def set(self, key, value, ttl=None, version=None):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self.backend.set(f'{version or self.data_version()}|{key}', data, self.ttl if ttl is None else ttl)
+        self._count('stores')
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot.update(self.backend.stats())
+        snapshot['data_version'] = (self.version_file or self.backend).read_version()
+        return snapshot
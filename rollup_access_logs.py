@@ -0,0 +1,46 @@
+"""汇总访问日志并按保留期限清理
+
+用法：
+    python rollup_access_logs.py            # 汇总新增的访问日志
+    python rollup_access_logs.py --prune    # 汇总后清理过期的原始日志与汇总
+    python rollup_access_logs.py --status   # 查看汇总进度
+
+以 access_log_rollup_state 记录的最大已处理 id 为起点，每次只读取新写入的日志，
+合并到 access_log_rollup_minute 与 access_log_rollup_hour。可由 cron 每分钟运行，
+多个实例同时运行时按高水位行串行，不会重复计数。需先执行 migrate.py up。
+"""
+import argparse
+import logging
+import sys
+
+from app import Database, access_log_rollup
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="汇总访问日志并按保留期限清理")
+    parser.add_argument('--prune', action='store_true', help="汇总后按保留期限删除过期的原始日志与汇总")
+    parser.add_argument('--status', action='store_true', help="只显示汇总进度")
+    args = parser.parse_args(argv)
+
+    if args.status:
+        with Database(readonly=True) as cursor:
+            cursor.execute("SELECT last_id, updated_at FROM access_log_rollup_state")
+            state = cursor.fetchone()
+            cursor.execute("SELECT MAX(id) AS max_id FROM access_logs")
+            max_id = cursor.fetchone()['max_id'] or 0
+        if state is None:
+            logging.info(f"尚未汇总，access_logs 最大 id {max_id}")
+        else:
+            logging.info(f"已汇总到 #{state['last_id']}（{state['updated_at']}），待汇总 {max(0, max_id - state['last_id'])} 条")
+        return 0
+
+    count = access_log_rollup.run()
+    logging.info(f"本次汇总 {count} 条访问日志")
+    if args.prune:
+        deleted = access_log_rollup.prune()
+        logging.info(f"已清理: {', '.join(f'{table} {n} 条' for table, n in deleted.items()) or '无'}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+import statistics
+import time
+from collections import Counter
+from itertools import accumulate
+
+from rank_engine import SCORE_FIELDS
+
+
+class ScoreDistribution:
+    """score_table 的分数分布：总分一分一段表与各项成绩的直方图、汇总统计
+
+    与排名索引使用同一批行生成，之后图表与分段表只读内存。
+    每列一次 Counter 计数（按分段宽度整除后的取值），累计人数由 accumulate 得到。
+    """
+
+    def __init__(self, rows, segment=1, bin_width=5):
+        self.segment = segment
+        self.bin_width = bin_width
+        self.built_at = time.time()
+        columns = {field: [row[field] for row in rows if row.get(field) is not None] for field in SCORE_FIELDS}
+        self.segments = self._segments(columns['total_score'])
+        self.histograms = {field: self._histogram(values) for field, values in columns.items()}
+        self.summary = {field: self._summary(values) for field, values in columns.items()}
+
+    def __len__(self):
+        return self.summary['total_score']['count']
+
+    def _segments(self, scores):
+        """一分一段表，分数从高到低：本段人数、累计人数（不低于本段分数的人数）与本段最高名次"""
+        counts = Counter(score // self.segment for score in scores)
+        keys = sorted(counts, reverse=True)
+        table = []
+        for key, cumulative in zip(keys, accumulate(counts[key] for key in keys)):
+            count = counts[key]
+            table.append({'score': _number(key * self.segment), 'count': count,
+                          'cumulative': cumulative, 'rank': cumulative - count + 1})
+        return table
+
+    def _histogram(self, values):
+        """等宽分段的人数，包含中间的空段，可直接作为柱状图的横轴与数据"""
+        if not values:
+            return {'bin_width': self.bin_width, 'bins': [], 'counts': []}
+        counts = Counter(value // self.bin_width for value in values)
+        low, high = int(min(counts)), int(max(counts))
+        return {
+            'bin_width': self.bin_width,
+            'bins': [_number(key * self.bin_width) for key in range(low, high + 1)],
+            'counts': [counts.get(key, 0) for key in range(low, high + 1)],
+        }
+
+    @staticmethod
+    def _summary(values):
+        if not values:
+            return {'count': 0, 'min': None, 'max': None, 'mean': None, 'median': None, 'stdev': None}
+        values = [float(value) for value in values]
+        return {
+            'count': len(values),
+            'min': _number(min(values)),
+            'max': _number(max(values)),
+            'mean': round(statistics.fmean(values), 2),
+            'median': _number(statistics.median(values)),
+            'stdev': round(statistics.pstdev(values), 2),
+        }
+
+    def to_dict(self):
+        return {
+            'built_at': self.built_at,
+            'segment': self.segment,
+            'segments': self.segments,
+            'histograms': self.histograms,
+            'summary': self.summary,
+        }
+
+
+def _number(value):
+    # 整数分数去掉小数部分，JSON 与分段表中显示为 250 而不是 250.0
+    value = float(value)
+    return int(value) if value.is_integer() else round(value, 2)
@@ -0,0 +1,225 @@
+import contextvars
+import itertools
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+# 参数原样展示时的最大长度，超出截断
+PARAM_PREVIEW_LENGTH = 80
+# 含这些字样的语句不记录参数（如登录校验的密码）
+SENSITIVE_SQL = re.compile(r'password|passwd|pwd', re.I)
+# pymysql 无缓冲游标执行后的 rowcount 为 2**64-1，表示行数未知
+UNKNOWN_ROWCOUNT = 2 ** 63
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'")
+_NUMBER_LITERAL = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s|%\(\w+\)s')
+_VALUE_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+
+_current_trace = contextvars.ContextVar('sql_trace', default=None)
+
+
+def normalize_sql(sql):
+    """SQL 语句的形状：字面量与占位符替换为 ?，IN 列表合并，空白压缩
+
+    条件组合不同的动态查询得到不同的形状，同一形状只是参数不同。
+    """
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    sql = _VALUE_LIST.sub('(?+)', sql)
+    return ' '.join(sql.split())
+
+
+def preview_params(sql, params):
+    if params is None:
+        return None
+    if SENSITIVE_SQL.search(sql):
+        return '<已隐藏>'
+    if isinstance(params, dict):
+        items = params.values()
+    elif isinstance(params, (list, tuple)):
+        items = params
+    else:
+        items = (params,)
+    preview = []
+    for value in items:
+        if isinstance(value, (bytes, bytearray)):
+            value = f'<{len(value)} 字节>'
+        elif isinstance(value, str) and len(value) > PARAM_PREVIEW_LENGTH:
+            value = value[:PARAM_PREVIEW_LENGTH] + '…'
+        elif not isinstance(value, (int, float, type(None))):
+            value = str(value)[:PARAM_PREVIEW_LENGTH]
+        preview.append(value)
+    return preview
+
+
+class SQLProfiler:
+    """按请求记录 SQL 的分析器，SQL_PROFILE 开启时使用
+
+    - 每个请求的语句（形状、参数、返回行数、耗时）保存为一条跟踪，保留最近 max_traces 条
+    - 超过 slow_ms 的语句按 sample_rate 采样，后台线程对其执行 EXPLAIN，
+      同一形状 explain_interval 秒内只执行一次
+    - 按分钟滚动汇总各语句形状的次数与耗时，取最近 window_minutes 分钟最慢的形状
+    """
+
+    def __init__(self, explain, slow_ms=200.0, sample_rate=1.0, max_traces=200, max_samples=50,
+                 window_minutes=15, explain_interval=60.0):
+        self._explain = explain  # (sql, params) -> EXPLAIN 结果行
+        self.slow_ms = slow_ms
+        self.sample_rate = sample_rate
+        self.max_traces = max_traces
+        self.window_minutes = window_minutes
+        self.explain_interval = explain_interval
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._traces = OrderedDict()
+        self._samples = deque(maxlen=max_samples)
+        self._windows = deque()  # [(分钟, {形状: [次数, 总毫秒, 最大毫秒, 总行数]})]
+        self._explained = {}  # 形状 -> 上次 EXPLAIN 的时间
+        self._executor = None
+        self._pid = None
+
+    def begin_request(self, method, path, endpoint):
+        trace = {
+            'id': f'{os.getpid()}-{next(self._ids)}',
+            'method': method,
+            'path': path,
+            'endpoint': endpoint,
+            'started_at': time.time(),
+            'statements': [],
+        }
+        return trace, _current_trace.set(trace)
+
+    def end_request(self, token, trace, status, duration):
+        _current_trace.reset(token)
+        statements = trace['statements']
+        trace.update(
+            status=status,
+            duration_ms=round(duration * 1000, 3),
+            sql_count=len(statements),
+            sql_ms=round(sum(statement['ms'] for statement in statements), 3),
+        )
+        with self._lock:
+            self._traces[trace['id']] = trace
+            while len(self._traces) > self.max_traces:
+                self._traces.popitem(last=False)
+        return trace
+
+    def instrument_cursor(self, cursor):
+        """替换游标实例的 execute，记录语句、参数、返回行数与耗时"""
+        execute = cursor.execute
+
+        def profiled_execute(query, args=None):
+            start = time.perf_counter()
+            try:
+                return execute(query, args)
+            finally:
+                rowcount = cursor.rowcount
+                rows = rowcount if 0 <= rowcount < UNKNOWN_ROWCOUNT else None
+                self.record(query, args, rows, time.perf_counter() - start)
+
+        cursor.execute = profiled_execute
+        return cursor
+
+    def record(self, sql, params, rows, seconds):
+        if sql.lstrip()[:8].upper() == 'EXPLAIN ':
+            return
+        shape = normalize_sql(sql)
+        ms = seconds * 1000
+        statement = {'sql': shape, 'params': preview_params(sql, params), 'rows': rows, 'ms': round(ms, 3)}
+        trace = _current_trace.get()
+        if trace is not None:
+            trace['statements'].append(statement)
+
+        minute = int(time.time() // 60)
+        with self._lock:
+            if not self._windows or self._windows[-1][0] != minute:
+                self._windows.append((minute, {}))
+                while self._windows[0][0] <= minute - self.window_minutes:
+                    self._windows.popleft()
+            stats = self._windows[-1][1].setdefault(shape, [0, 0.0, 0.0, 0])
+            stats[0] += 1
+            stats[1] += ms
+            stats[2] = max(stats[2], ms)
+            stats[3] += rows or 0
+
+        if ms >= self.slow_ms and random.random() < self.sample_rate:
+            self._sample(sql, params, shape, statement, trace)
+
+    def _sample(self, sql, params, shape, statement, trace):
+        sample = dict(statement, statement=sql, recorded_at=time.time(), explain=None,
+                      trace_id=trace['id'] if trace else None,
+                      endpoint=trace['endpoint'] if trace else None)
+        now = time.monotonic()
+        with self._lock:
+            self._samples.append(sample)
+            explain = (shape.upper().startswith(('SELECT', 'WITH'))
+                       and now - self._explained.get(shape, -self.explain_interval) >= self.explain_interval)
+            if explain:
+                self._explained[shape] = now
+        if explain:
+            # EXPLAIN 在后台线程用另一条连接执行，不增加慢请求本身的耗时
+            self._ensure_executor().submit(self._run_explain, sample, sql, params)
+        logging.warning(f"慢查询 {statement['ms']:.1f} 毫秒: {shape}")
+
+    def _ensure_executor(self):
+        # fork 出的 worker 各自创建后台线程
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sql-explain')
+                    self._pid = os.getpid()
+        return self._executor
+
+    def _run_explain(self, sample, sql, params):
+        try:
+            sample['explain'] = self._explain(sql, params)
+        except Exception as e:
+            sample['explain'] = f'EXPLAIN 失败: {e}'
+            logging.error(f"慢查询 EXPLAIN 失败: {e}")
+
+    def trace(self, trace_id):
+        with self._lock:
+            return self._traces.get(trace_id)
+
+    def recent_traces(self, limit=50):
+        """最近的请求跟踪摘要，新的在前"""
+        with self._lock:
+            traces = list(self._traces.values())[-limit:]
+        return [{key: value for key, value in trace.items() if key != 'statements'} for trace in reversed(traces)]
+
+    def slow_samples(self):
+        with self._lock:
+            return list(reversed(self._samples))
+
+    def top_shapes(self, n=20, sort='total'):
+        """最近 window_minutes 分钟内的语句形状，按总耗时、平均耗时或最大耗时降序取前 n 个"""
+        oldest = int(time.time() // 60) - self.window_minutes
+        merged = {}
+        with self._lock:
+            for minute, shapes in self._windows:
+                if minute <= oldest:
+                    continue
+                for shape, (count, total, worst, rows) in shapes.items():
+                    stats = merged.setdefault(shape, [0, 0.0, 0.0, 0])
+                    stats[0] += count
+                    stats[1] += total
+                    stats[2] = max(stats[2], worst)
+                    stats[3] += rows
+        shapes = [{
+            'sql': shape,
+            'count': count,
+            'total_ms': round(total, 3),
+            'avg_ms': round(total / count, 3),
+            'max_ms': round(worst, 3),
+            'avg_rows': round(rows / count, 1),
+        } for shape, (count, total, worst, rows) in merged.items()]
+        key = {'avg': 'avg_ms', 'max': 'max_ms'}.get(sort, 'total_ms')
+        shapes.sort(key=lambda item: item[key], reverse=True)
+        return shapes[:n]
@@ -0,0 +1,176 @@
+import re
+from array import array
+from itertools import compress
+
+# 选考科目，位序即掩码中的位
+SUBJECTS = ('物理', '化学', '生物', '思想政治', '历史', '地理')
+SUBJECT_BITS = {subject: 1 << i for i, subject in enumerate(SUBJECTS)}
+# 要求文本中的写法 -> 科目；单字简称只用于考生输入，要求文本里容易误认（如“考生”的“生”）
+SUBJECT_ALIASES = {
+    '物理': '物理', '化学': '化学', '生物': '生物', '生物学': '生物',
+    '思想政治': '思想政治', '政治': '思想政治', '历史': '历史', '地理': '地理',
+}
+SHORT_ALIASES = {'物': '物理', '化': '化学', '生': '生物', '政': '思想政治', '史': '历史', '地': '地理'}
+
+# 参与解析的列：两列提到的科目要求同时生效
+REQUIREMENT_COLUMNS = ('subject_requirement', 'qualification_requirement')
+
+_SUBJECT_PATTERN = re.compile('|'.join(sorted(SUBJECT_ALIASES, key=len, reverse=True)))
+# 分句：逗号、分号、加号以及“首选”“再选”，各分句的要求同时生效
+_CLAUSE_SEPARATORS = re.compile(r'[，,；;。+＋]|首选|再选')
+# 分句中出现这些字样时，其中的科目选够指定门数即可（未写门数时为其一）
+_ANY_MARKERS = re.compile(r'或|/|／|任选|之一|其中|选[一二两三四五六1-6]|[一1][门科](?:即可|均可)')
+# “任选两门”“选考其中2门”“选2科”中的门数
+_CHOICE_COUNT = re.compile(r'(?:任选|其中|选考|选)\s*([一二两三四五六1-6])\s*(?:门|科|个|$)')
+_NUMERALS = {'一': 1, '二': 2, '两': 2, '三': 3, '四': 4, '五': 5, '六': 6}
+_INPUT_SEPARATORS = re.compile(r'[\s,，、;；+＋/|]+')
+
+
+def parse_requirement(text):
+    """把一条要求文本解析为 (必选科目掩码, 任选科目组元组)，任选科目组为 (科目掩码, 至少选考门数)
+
+    “物理和化学”“物理、化学（2门科目考生均须选考）”为必选；
+    “化学或生物”“物理、化学（选考其中1门即可）”为任选其一，“物理、化学、生物任选两门”为至少选考两门；
+    “首选物理，再选化学或生物”按分句分别解析。不提及科目的文本（不限、限男生等）没有选科限制。
+    """
+    if not text:
+        return 0, ()
+    required = 0
+    groups = set()
+    for clause in _CLAUSE_SEPARATORS.split(text):
+        mask = 0
+        for name in _SUBJECT_PATTERN.findall(clause):
+            mask |= SUBJECT_BITS[SUBJECT_ALIASES[name]]
+        if not mask:
+            continue
+        if mask & (mask - 1) and _ANY_MARKERS.search(clause):
+            groups.add((mask, _choice_count(clause)))
+        else:
+            required |= mask
+    return _normalize(required, groups)
+
+
+def combine(requirements):
+    """多列要求同时生效"""
+    required = 0
+    groups = set()
+    for column_required, column_groups in requirements:
+        required |= column_required
+        groups.update(column_groups)
+    return _normalize(required, groups)
+
+
+# 分句中写明的门数，未写时为 1
+def _choice_count(clause):
+    match = _CHOICE_COUNT.search(clause)
+    if match is None:
+        return 1
+    count = match.group(1)
+    return _NUMERALS[count] if count in _NUMERALS else int(count)
+
+
+def _bit_count(mask):
+    return bin(mask).count('1')
+
+
+def _normalize(required, groups):
+    # 必选科目计入任选组的门数：选够的组不再单独判断，剩余科目必须全选的组并入必选科目，
+    # 并入后可能又满足其他组，重复到不再变化
+    while True:
+        pending = set()
+        forced = 0
+        for group, count in groups:
+            count -= _bit_count(group & required)
+            group &= ~required
+            if count <= 0:
+                continue
+            if count >= _bit_count(group):
+                forced |= group
+            else:
+                pending.add((group, count))
+        if not forced:
+            return required, tuple(sorted(pending))
+        required |= forced
+        groups = pending
+
+
+def is_eligible(requirement, mask):
+    required, groups = requirement
+    return not required & ~mask and all(_bit_count(group & mask) >= count for group, count in groups)
+
+
+def parse_subjects(text):
+    """解析考生的选考科目（如“物理+化学+生物”“物化生”），返回掩码，无法识别时抛出 ValueError"""
+    mask = 0
+    for token in _INPUT_SEPARATORS.split(text or ''):
+        while token:
+            name = _SUBJECT_PATTERN.match(token)
+            if name:
+                subject = SUBJECT_ALIASES[name.group()]
+                token = token[name.end():]
+            elif token[0] in SHORT_ALIASES:
+                subject = SHORT_ALIASES[token[0]]
+                token = token[1:]
+            else:
+                raise ValueError(f"无法识别的科目: {token}")
+            mask |= SUBJECT_BITS[subject]
+    return mask
+
+
+def format_subjects(mask):
+    """掩码转为规范写法“物理+化学+生物”，用作查询参数与缓存键"""
+    return '+'.join(subject for subject in SUBJECTS if mask & SUBJECT_BITS[subject])
+
+
+class SubjectEligibility:
+    """逐行的选科要求编码，按考生选考科目一次判断全部行能否报考
+
+    相同的要求文本组合只解析一次，每行只存要求组合的编号（不超过 256 种时每行 1 字节）。
+    判断时先对每种要求组合求出能否报考，再用 bytes.translate 把整列编号映射为 0/1 标记，
+    不在 Python 层逐行循环。
+    """
+
+    def __init__(self, rows):
+        """rows: 逐行的 (选科要求, 考生资格要求) 文本元组"""
+        seen = {}
+        requirement_ids = {}
+        ids = []
+        for texts in rows:
+            requirement_id = seen.get(texts)
+            if requirement_id is None:
+                requirement = combine(parse_requirement(text) for text in texts)
+                requirement_id = seen[texts] = requirement_ids.setdefault(requirement, len(requirement_ids))
+            ids.append(requirement_id)
+        self.requirements = list(requirement_ids)
+        self._text_ids = seen
+        self._ids = bytes(ids) if len(self.requirements) <= 256 else array('H', ids)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def flags(self, mask):
+        """每行一个字节，1 表示选考科目满足要求"""
+        table = bytes(is_eligible(requirement, mask) for requirement in self.requirements)
+        if isinstance(self._ids, bytes):
+            return self._ids.translate(table.ljust(256, b'\0'))
+        return bytes(map(table.__getitem__, self._ids))
+
+    def filter(self, positions, mask):
+        """从有序行号中保留能报考的行"""
+        flags = self.flags(mask)
+        if len(positions) == len(flags):
+            # 行号覆盖全表（未设置其他条件）
+            return list(compress(range(len(flags)), flags))
+        return [pos for pos in positions if flags[pos]]
+
+    def eligible_texts(self, mask):
+        """能报考的要求文本组合，供数据库查询模式拼接条件"""
+        return [texts for texts, requirement_id in self._text_ids.items()
+                if is_eligible(self.requirements[requirement_id], mask)]
+
+    def stats(self):
+        return {
+            'rows': len(self),
+            'requirements': len(self.requirements),
+            'restricted': sum(1 for required, groups in self.requirements if required or groups),
+        }
@@ -0,0 +1,137 @@
+import heapq
+import time
+import unicodedata
+from bisect import bisect_left
+
+try:
+    from pypinyin import Style, lazy_pinyin
+except ImportError:
+    lazy_pinyin = None
+
+SUGGEST_FIELDS = ('college_name', 'major_name', 'university')
+
+# 前缀匹配条目超过该数量时，建索引时预先算好前 MAX_K 条，查询不再逐条比较
+SCAN_LIMIT = 64
+MAX_K = 20
+# 只为前几个字符的前缀预计算，更长前缀命中的条目通常很少
+PRECOMPUTE_PREFIX_LENGTH = 4
+
+# GB2312 一级汉字按拼音排序，用各声母首字的区位码判断首字母（未安装 pypinyin 时使用）
+_GB2312_INITIALS = (
+    (0xB0A1, 'a'), (0xB0C5, 'b'), (0xB2C1, 'c'), (0xB4EE, 'd'), (0xB6EA, 'e'), (0xB7A2, 'f'),
+    (0xB8C1, 'g'), (0xB9FE, 'h'), (0xBBF7, 'j'), (0xBFA6, 'k'), (0xC0AC, 'l'), (0xC2E8, 'm'),
+    (0xC4C3, 'n'), (0xC5B6, 'o'), (0xC5BE, 'p'), (0xC6DA, 'q'), (0xC8BB, 'r'), (0xC8F6, 's'),
+    (0xCBFA, 't'), (0xCDDA, 'w'), (0xCEF4, 'x'), (0xD1B9, 'y'), (0xD4D1, 'z'),
+)
+_GB2312_CODES = [code for code, _ in _GB2312_INITIALS]
+_GB2312_LEVEL1_END = 0xD7F9
+
+
+def normalize(text):
+    """全角转半角并忽略大小写与空白，名称与用户输入使用同一规则"""
+    return ''.join(unicodedata.normalize('NFKC', text or '').casefold().split())
+
+
+def _initial(char):
+    if char.isascii():
+        return char if char.isalnum() else ''
+    try:
+        code = int.from_bytes(char.encode('gb2312'), 'big')
+    except UnicodeEncodeError:
+        return None
+    if not _GB2312_CODES[0] <= code <= _GB2312_LEVEL1_END:
+        return None
+    return _GB2312_INITIALS[bisect_left(_GB2312_CODES, code + 1) - 1][1]
+
+
+def pinyin_initials(text):
+    """名称的拼音首字母串，如 武汉大学 -> whdx；无法确定某个汉字读音时返回 None
+
+    字母与数字原样保留，括号等符号忽略。
+    """
+    text = normalize(text)
+    if lazy_pinyin is not None:
+        initials = lazy_pinyin(text, style=Style.FIRST_LETTER, errors=lambda chars: [c for c in chars])
+        return ''.join(ch for part in initials for ch in part if ch.isascii() and ch.isalnum())
+    initials = []
+    for char in text:
+        initial = _initial(char)
+        if initial is None:
+            if unicodedata.category(char).startswith('L'):
+                return None
+            continue
+        initials.append(initial)
+    return ''.join(initials)
+
+
+class SuggestIndex:
+    """院校、专业名称的前缀补全索引
+
+    每个字段一个按键排序的数组，键为规范化后的名称及其拼音首字母串，
+    输入前缀用二分查找定位连续区间，再按热度（出现次数）取前 k 条。
+    命中条目很多的短前缀在建索引时预先排好序，每次按键都只需一次二分查找。
+    """
+
+    def __init__(self, counts):
+        """counts: {字段: [(名称, 热度), ...]}"""
+        self.built_at = time.time()
+        self._fields = {}
+        for field in SUGGEST_FIELDS:
+            self._fields[field] = self._build(counts.get(field, ()))
+
+    @staticmethod
+    def _build(pairs):
+        merged = {}
+        for value, count in pairs:
+            if value:
+                merged[value] = merged.get(value, 0) + int(count or 0)
+        # 条目按热度降序编号，编号小即热度高，区间内取前 k 个编号即可
+        entries = sorted(merged.items(), key=lambda item: (-item[1], item[0]))
+        keys = []
+        for entry_id, (value, _) in enumerate(entries):
+            name = normalize(value)
+            keys.append((name, entry_id))
+            initials = pinyin_initials(value)
+            if initials and initials != name:
+                keys.append((initials, entry_id))
+        keys.sort()
+        key_strings = [key for key, _ in keys]
+        entry_ids = [entry_id for _, entry_id in keys]
+
+        top = {}
+        for length in range(1, PRECOMPUTE_PREFIX_LENGTH + 1):
+            start = 0
+            while start < len(key_strings):
+                prefix = key_strings[start][:length]
+                if len(prefix) < length:
+                    start += 1
+                    continue
+                end = bisect_left(key_strings, prefix + '\U0010ffff', start)
+                if end - start > SCAN_LIMIT:
+                    top[prefix] = heapq.nsmallest(MAX_K, set(entry_ids[start:end]))
+                start = end
+        return {'entries': entries, 'keys': key_strings, 'entry_ids': entry_ids, 'top': top}
+
+    def __len__(self):
+        return sum(len(data['entries']) for data in self._fields.values())
+
+    def suggest(self, field, query, k=10):
+        """返回 [(名称, 热度), ...]，按热度降序，名称与拼音首字母均按前缀匹配"""
+        data = self._fields[field]
+        prefix = normalize(query)
+        k = min(k, MAX_K)
+        if not prefix or k <= 0:
+            return []
+        ranked = data['top'].get(prefix)
+        if ranked is None:
+            keys = data['keys']
+            start = bisect_left(keys, prefix)
+            end = bisect_left(keys, prefix + '\U0010ffff', start)
+            ranked = heapq.nsmallest(k, set(data['entry_ids'][start:end]))
+        return [data['entries'][entry_id] for entry_id in ranked[:k]]
+
+    def stats(self):
+        return {
+            field: {'entries': len(data['entries']), 'keys': len(data['keys']), 'precomputed': len(data['top'])}
+            for field, data in self._fields.items()
+        }
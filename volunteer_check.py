@@ -0,0 +1,99 @@
+from subject_eligibility import REQUIREMENT_COLUMNS, combine, is_eligible, parse_requirement, parse_subjects
+
+# 单条志愿的检查结果
+STATUS_OK = 'ok'                  # 找到且能报考
+STATUS_MISSING = 'missing'        # 招生计划中没有该院校专业组与专业
+STATUS_INELIGIBLE = 'ineligible'  # 选考科目不满足要求
+STATUS_AMBIGUOUS = 'ambiguous'    # 代码在多个批次中都存在，需要指定批次
+STATUS_DUPLICATE = 'duplicate'    # 与前面的志愿重复
+STATUSES = (STATUS_OK, STATUS_MISSING, STATUS_INELIGIBLE, STATUS_AMBIGUOUS, STATUS_DUPLICATE)
+
+
+def code_key(college_code, major_code):
+    """查找用的代码键，与 MySQL 的大小写不敏感比较一致"""
+    return college_code.casefold(), major_code.casefold()
+
+
+def parse_entry(entry):
+    """志愿条目：{"college_code", "major_code", "batch_name"（可选）} 或 [院校专业组代码, 专业代号]"""
+    if isinstance(entry, dict):
+        values = (entry.get('college_code'), entry.get('major_code'), entry.get('batch_name') or '')
+    elif isinstance(entry, (list, tuple)) and len(entry) in (2, 3):
+        values = (list(entry) + [''])[:3]
+    else:
+        raise ValueError('志愿条目应为 {"college_code": ..., "major_code": ...} 或 [院校专业组代码, 专业代号]')
+    if not all(isinstance(value, str) for value in values):
+        raise ValueError('院校专业组代码、专业代号与批次名称必须为字符串')
+    college_code, major_code, batch_name = (value.strip() for value in values)
+    if not college_code or not major_code:
+        raise ValueError('院校专业组代码与专业代号不能为空')
+    return college_code, major_code, batch_name
+
+
+def parse_list(payload, max_entries):
+    """解析一份志愿表 {"id"（可选）, "subjects", "entries": [...]}，返回 (标识, 选考科目掩码或 None, 条目列表)"""
+    if not isinstance(payload, dict):
+        raise ValueError('志愿表应为 JSON 对象')
+    entries = payload.get('entries')
+    if not isinstance(entries, list) or not entries:
+        raise ValueError('entries 必须为非空的志愿列表')
+    if len(entries) > max_entries:
+        raise ValueError(f'单份志愿表最多 {max_entries} 条')
+    subjects = payload.get('subjects') or ''
+    if not isinstance(subjects, str):
+        raise ValueError('subjects 必须为字符串，如 "物理+化学+生物"')
+    mask = parse_subjects(subjects) if subjects.strip() else None
+    list_id = payload.get('id')
+    return (None if list_id is None else str(list_id)), mask, [parse_entry(entry) for entry in entries]
+
+
+def check_list(entries, mask, matches, fields):
+    """按志愿顺序检查一份志愿表
+
+    matches 为 {代码键: [招生计划行]}，由调用方对所有志愿表一次批量查出；
+    mask 为 None 时不检查选考科目。返回 (逐条结果, 各状态计数)。
+    """
+    results = []
+    seen = {}
+    requirements = {}
+    counts = dict.fromkeys(STATUSES, 0)
+    for position, (college_code, major_code, batch_name) in enumerate(entries, 1):
+        key = code_key(college_code, major_code)
+        rows = matches.get(key, [])
+        if batch_name:
+            rows = [row for row in rows if (row.get('batch_name') or '').casefold() == batch_name.casefold()]
+        result = {'position': position, 'college_code': college_code, 'major_code': major_code}
+        if batch_name:
+            result['batch_name'] = batch_name
+
+        eligible = None
+        if mask is not None and rows:
+            eligible = []
+            for row in rows:
+                texts = tuple(row.get(column) for column in REQUIREMENT_COLUMNS)
+                if texts not in requirements:
+                    requirements[texts] = combine(parse_requirement(text) for text in texts)
+                eligible.append(is_eligible(requirements[texts], mask))
+
+        duplicate_key = key + (batch_name.casefold(),)
+        if duplicate_key in seen:
+            status = STATUS_DUPLICATE
+            result['duplicate_of'] = seen[duplicate_key]
+        elif not rows:
+            status = STATUS_MISSING
+        elif eligible is not None and not any(eligible):
+            status = STATUS_INELIGIBLE
+        elif len(rows) > 1:
+            status = STATUS_AMBIGUOUS
+        else:
+            status = STATUS_OK
+        seen.setdefault(duplicate_key, position)
+
+        result['status'] = status
+        result['rows'] = [{field: row.get(field) for field in fields} for row in rows]
+        if eligible is not None:
+            for row, row_eligible in zip(result['rows'], eligible):
+                row['eligible'] = row_eligible
+        counts[status] += 1
+        results.append(result)
+    return results, counts